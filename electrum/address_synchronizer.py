@@ -24,12 +24,13 @@
 import threading
 import asyncio
 import itertools
+import bisect
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, Optional
+from typing import TYPE_CHECKING, Dict, Optional, Set
 
 from . import bitcoin
 from .bitcoin import COINBASE_MATURITY, TYPE_ADDRESS, TYPE_PUBKEY
-from .util import PrintError, profiler, bfh, VerifiedTxInfo, TxMinedStatus
+from .util import PrintError, profiler, bfh, VerifiedTxInfo, TxMinedStatus, BitcoinException
 from .transaction import Transaction, TxOutput
 from .synchronizer import Synchronizer
 from .verifier import SPV
@@ -54,6 +55,64 @@ class UnrelatedTransactionException(AddTransactionException):
         return _("Transaction is unrelated to this wallet.")
 
 
+class HistoryIndex:
+    """Transactions sorted by (txpos key, txid), with their deltas and the
+    running balance after each of them.
+
+    Running balances are recomputed lazily, from the first position that
+    changed. New transactions and confirmations usually land at the end
+    of the history, which keeps updates cheap.
+    """
+
+    def __init__(self):
+        self._entries = []  # sorted list of (key, txid)
+        self._keys = {}  # txid -> key
+        self._deltas = {}  # txid -> delta
+        self._balances = []  # running balances, computed for a prefix of _entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, txid):
+        return txid in self._keys
+
+    def add(self, txid, key, delta):
+        self.remove(txid)
+        entry = (key, txid)
+        i = bisect.bisect_left(self._entries, entry)
+        self._entries.insert(i, entry)
+        self._keys[txid] = key
+        self._deltas[txid] = delta
+        del self._balances[i:]
+
+    def remove(self, txid):
+        key = self._keys.pop(txid, None)
+        if key is None:
+            return
+        del self._deltas[txid]
+        i = bisect.bisect_left(self._entries, (key, txid))
+        del self._entries[i]
+        del self._balances[i:]
+
+    def _compute_balances(self, end):
+        balance = self._balances[-1] if self._balances else 0
+        for key, txid in self._entries[len(self._balances):end]:
+            balance += self._deltas[txid]
+            self._balances.append(balance)
+
+    def get_balance(self):
+        self._compute_balances(len(self._entries))
+        return self._balances[-1] if self._balances else 0
+
+    def get_range(self, start=0, end=None):
+        """Returns [(txid, delta, balance), ...] for a slice of the history,
+        oldest first. Indices are interpreted as in slicing."""
+        start, end, _ = slice(start, end).indices(len(self._entries))
+        self._compute_balances(end)
+        return [(txid, self._deltas[txid], self._balances[i])
+                for i, (key, txid) in enumerate(self._entries[start:end], start)]
+
+
 class AddressSynchronizer(PrintError):
     """
     inherited by wallet
@@ -77,6 +136,17 @@ class AddressSynchronizer(PrintError):
             self.verified_tx[txid] = VerifiedTxInfo(height, timestamp, txpos, header_hash)
         # Transactions pending verification.  txid -> tx_height. Access with self.lock.
         self.unverified_tx = defaultdict(int)
+        # address -> (local_height or None, (c, u, x)). Access with self.transaction_lock.
+        self._addr_balance_cache = {}
+        # history of the whole wallet, built on first use. Access with self.transaction_lock.
+        self._history_index = None  # type: Optional[HistoryIndex]
+        self._history_dirty = set()  # txids whose entry in _history_index is stale
+        # addresses whose state changed since the last pop_changed_addresses,
+        # None if it could be any. Access with self.transaction_lock.
+        self._changed_addresses = None  # type: Optional[Set[str]]
+        self._changed_addresses_height = None
+        # scripthashes of the addresses of the wallet, see load_address_lookup_tables
+        self._address_to_scripthash = {}  # type: Dict[str, str]
         # true when synchronized
         self.up_to_date = False
         # thread local storage for caching stuff
@@ -93,6 +163,8 @@ class AddressSynchronizer(PrintError):
     def load_and_cleanup(self):
         self.load_transactions()
         self.load_local_history()
+        self.load_utxo_index()
+        self.load_address_lookup_tables()
         self.check_history()
         self.load_unverified_transactions()
         self.remove_local_transactions_we_dont_have()
@@ -100,6 +172,30 @@ class AddressSynchronizer(PrintError):
     def is_mine(self, address):
         return address in self.history
 
+    @profiler
+    def load_address_lookup_tables(self):
+        self._address_to_scripthash = {}
+        for addr in self.get_addresses():
+            self._add_address_to_lookup_tables(addr)
+
+    def _add_address_to_lookup_tables(self, addr):
+        if addr in self._address_to_scripthash:
+            return
+        try:
+            script = bitcoin.address_to_script(addr)
+        except BitcoinException:
+            return
+        self._address_to_scripthash[addr] = bitcoin.script_to_scripthash(script)
+
+    def _remove_address_from_lookup_tables(self, addr):
+        self._address_to_scripthash.pop(addr, None)
+
+    def address_to_scripthash(self, addr: str) -> str:
+        scripthash = self._address_to_scripthash.get(addr)
+        if scripthash is None:
+            scripthash = bitcoin.address_to_scripthash(addr)
+        return scripthash
+
     def get_addresses(self):
         return sorted(self.history.keys())
 
@@ -165,12 +261,14 @@ class AddressSynchronizer(PrintError):
         if write_to_disk:
             self.save_transactions()
             self.save_verified_tx()
-            self.storage.write()
+            self.storage.compact()
 
     def add_address(self, address):
+        self._add_address_to_lookup_tables(address)
         if address not in self.history:
             self.history[address] = []
             self.set_up_to_date(False)
+            self._mark_addresses_changed([address])
         if self.synchronizer:
             self.synchronizer.add(address)
 
@@ -263,6 +361,8 @@ class AddressSynchronizer(PrintError):
                                     d[addr] = set()
                                 d[addr].add((ser, v))
                             return
+            self._remove_tx_from_utxo_index(tx_hash)
+            self._invalidate_tx_caches(tx_hash)
             self.txi[tx_hash] = d = {}
             for txi in tx.inputs():
                 if txi['type'] == 'coinbase':
@@ -290,9 +390,13 @@ class AddressSynchronizer(PrintError):
                             dd[addr] = set()
                         if (ser, v) not in dd[addr]:
                             dd[addr].add((ser, v))
+                            self._add_spend_to_utxo_index(addr, ser)
                         self._add_tx_to_local_history(next_tx)
-            # add to local history
+                        self._invalidate_tx_caches(next_tx)
+            # add to local history and utxo index
             self._add_tx_to_local_history(tx_hash)
+            self._add_tx_to_utxo_index(tx_hash)
+            self._invalidate_tx_caches(tx_hash)
             # save
             self.transactions[tx_hash] = tx
             return True
@@ -324,9 +428,11 @@ class AddressSynchronizer(PrintError):
 
         with self.transaction_lock:
             self.print_error("removing tx from history", tx_hash)
+            self._invalidate_tx_caches(tx_hash)
             tx = self.transactions.pop(tx_hash, None)
             remove_from_spent_outpoints()
             self._remove_tx_from_local_history(tx_hash)
+            self._remove_tx_from_utxo_index(tx_hash)
             self.txi.pop(tx_hash, None)
             self.txo.pop(tx_hash, None)
 
@@ -350,9 +456,11 @@ class AddressSynchronizer(PrintError):
                     # make tx local
                     self.unverified_tx.pop(tx_hash, None)
                     self.verified_tx.pop(tx_hash, None)
+                    self._invalidate_tx_caches(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
             self.history[addr] = hist
+            self._mark_addresses_changed([addr])
 
         for tx_hash, tx_height in hist:
             # add it in case it was previously unconfirmed
@@ -400,6 +508,15 @@ class AddressSynchronizer(PrintError):
         for txid in itertools.chain(self.txi, self.txo):
             self._add_tx_to_local_history(txid)
 
+    @profiler
+    def load_utxo_index(self):
+        self._utxos = {}  # address -> dict(outpoint -> (value, is_cb))
+        self._txi_refs = {}  # outpoint -> number of txi entries spending it
+        for txid in self.txi:
+            self._add_tx_to_utxo_index(txid, add_outputs=False)
+        for txid in self.txo:
+            self._add_tx_to_utxo_index(txid, add_inputs=False)
+
     @profiler
     def check_history(self):
         save = False
@@ -458,6 +575,10 @@ class AddressSynchronizer(PrintError):
                 self.history = {}
                 self.verified_tx = {}
                 self.transactions = {}  # type: Dict[str, Transaction]
+                self._addr_balance_cache = {}
+                self._history_index = None
+                self._changed_addresses = None
+                self.load_utxo_index()
                 self.save_transactions()
 
     def get_txpos(self, tx_hash):
@@ -485,10 +606,39 @@ class AddressSynchronizer(PrintError):
         return f
 
     @with_local_height_cached
-    def get_history(self, domain=None):
-        # get domain
-        if domain is None:
-            domain = self.history.keys()
+    def get_history(self, domain=None, start=0, end=None):
+        """Returns [(tx_hash, tx_mined_status, delta, balance), ...], oldest
+        first. start and end select a slice of the full history; they
+        are only supported for the whole wallet (domain=None)."""
+        if domain is not None:
+            return self._get_domain_history(domain)[start:end]
+        with self.lock, self.transaction_lock:
+            index = self._get_history_index()
+            c, u, x = self.get_balance(self.history.keys())
+            # fixme: this may happen if history is incomplete
+            if index.get_balance() != c + u + x:
+                self.print_error("Error: history not synchronized")
+                return []
+            return [(tx_hash, self.get_tx_height(tx_hash), delta, balance)
+                    for tx_hash, delta, balance in index.get_range(start, end)]
+
+    def _get_history_index(self):
+        with self.lock, self.transaction_lock:
+            if self._history_index is None:
+                self._history_index = HistoryIndex()
+                self._history_dirty = set(itertools.chain(self.txi, self.txo))
+            for tx_hash in self._history_dirty:
+                addrs = set(addr for addr in itertools.chain(self.txi.get(tx_hash, []), self.txo.get(tx_hash, []))
+                            if addr in self.history)
+                if not addrs:
+                    self._history_index.remove(tx_hash)
+                    continue
+                delta = sum(self.get_tx_delta(tx_hash, addr) for addr in addrs)
+                self._history_index.add(tx_hash, self.get_txpos(tx_hash), delta)
+            self._history_dirty = set()
+            return self._history_index
+
+    def _get_domain_history(self, domain):
         domain = set(domain)
         # 1. Get the history of each address in the domain, maintain the
         #    delta of a tx as the sum of its deltas on domain addresses
@@ -544,16 +694,110 @@ class AddressSynchronizer(PrintError):
                 else:
                     self._history_local[addr] = cur_hist
 
+    # The utxo index mirrors txi/txo: an outpoint in txo is unspent as long
+    # as no txi entry refers to it. It has to be updated whenever txi/txo change.
+
+    def _add_spend_to_utxo_index(self, addr, ser):
+        self._txi_refs[ser] = self._txi_refs.get(ser, 0) + 1
+        coins = self._utxos.get(addr)
+        if coins is not None:
+            coins.pop(ser, None)
+            if not coins:
+                self._utxos.pop(addr)
+
+    def _remove_spend_from_utxo_index(self, addr, ser):
+        refs = self._txi_refs.get(ser, 0) - 1
+        if refs > 0:
+            self._txi_refs[ser] = refs
+            return
+        self._txi_refs.pop(ser, None)
+        prevout_hash, prevout_n = ser.split(':')
+        prevout_n = int(prevout_n)
+        for n, v, is_cb in self.txo.get(prevout_hash, {}).get(addr, []):
+            if n == prevout_n:
+                self._utxos.setdefault(addr, {})[ser] = (v, is_cb)
+                return
+
+    def _add_tx_to_utxo_index(self, txid, add_inputs=True, add_outputs=True):
+        with self.transaction_lock:
+            if add_inputs:
+                for addr, spent in self.txi.get(txid, {}).items():
+                    for ser, v in spent:
+                        self._add_spend_to_utxo_index(addr, ser)
+            if add_outputs:
+                for addr, outputs in self.txo.get(txid, {}).items():
+                    for n, v, is_cb in outputs:
+                        ser = txid + ':%d' % n
+                        if ser not in self._txi_refs:
+                            self._utxos.setdefault(addr, {})[ser] = (v, is_cb)
+
+    def _remove_tx_from_utxo_index(self, txid):
+        with self.transaction_lock:
+            for addr, outputs in self.txo.get(txid, {}).items():
+                coins = self._utxos.get(addr)
+                if coins is None:
+                    continue
+                for n, v, is_cb in outputs:
+                    coins.pop(txid + ':%d' % n, None)
+                if not coins:
+                    self._utxos.pop(addr)
+            for addr, spent in self.txi.get(txid, {}).items():
+                for ser, v in spent:
+                    self._remove_spend_from_utxo_index(addr, ser)
+
+    def _invalidate_tx_caches(self, txid):
+        # balances and history depend on the txi/txo entries and the
+        # heights of the transactions
+        with self.transaction_lock:
+            addrs = set(itertools.chain(self.txi.get(txid, []), self.txo.get(txid, [])))
+            for addr in addrs:
+                self._addr_balance_cache.pop(addr, None)
+            self._history_dirty.add(txid)
+            self._mark_addresses_changed(addrs)
+
+    def _invalidate_address_caches(self, addr):
+        with self.transaction_lock:
+            self._addr_balance_cache.pop(addr, None)
+            self._history_dirty |= self._history_local.get(addr, set())
+            self._mark_addresses_changed([addr])
+
+    def _mark_addresses_changed(self, addrs):
+        with self.transaction_lock:
+            if self._changed_addresses is not None:
+                self._changed_addresses.update(addrs)
+
+    def pop_changed_addresses(self) -> Optional[Set[str]]:
+        """Return the addresses whose history, balance or other state
+        shown by the GUI may have changed since the last call, or None if
+        that could be any address. Meant for a single consumer: the address
+        list of the GUI, which refreshes only the rows of these addresses.
+        """
+        local_height = self.get_local_height()
+        with self.transaction_lock:
+            changed = self._changed_addresses
+            if changed is not None and local_height != self._changed_addresses_height:
+                # balances with coinbase outputs depend on the local height
+                changed.update(addr for addr, (height, balance) in self._addr_balance_cache.items()
+                               if height is not None)
+            self._changed_addresses = set()
+            self._changed_addresses_height = local_height
+            return changed
+
     def add_unverified_tx(self, tx_hash, tx_height):
         if tx_hash in self.verified_tx:
             if tx_height in (TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_UNCONF_PARENT):
                 with self.lock:
                     self.verified_tx.pop(tx_hash)
+                    self._invalidate_tx_caches(tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
             with self.lock:
                 # tx will be verified only if height > 0
+                if self.unverified_tx.get(tx_hash) != tx_height:
+                    self._invalidate_tx_caches(tx_hash)
+                    if self.verifier and tx_height > 0:
+                        self.verifier.trigger_update()
                 self.unverified_tx[tx_hash] = tx_height
 
     def remove_unverified_tx(self, tx_hash, tx_height):
@@ -561,12 +805,14 @@ class AddressSynchronizer(PrintError):
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self._invalidate_tx_caches(tx_hash)
 
     def add_verified_tx(self, tx_hash: str, info: VerifiedTxInfo):
         # Remove from the unverified map and add to the verified map
         with self.lock:
             self.unverified_tx.pop(tx_hash, None)
             self.verified_tx[tx_hash] = info
+            self._invalidate_tx_caches(tx_hash)
         tx_mined_status = self.get_tx_height(tx_hash)
         self.network.trigger_callback('verified', self, tx_hash, tx_mined_status)
 
@@ -595,6 +841,7 @@ class AddressSynchronizer(PrintError):
                         # into unverified_tx with the old height, and if we get
                         # a status update, that will overwrite it.
                         self.unverified_tx[tx_hash] = tx_height
+                        self._invalidate_tx_caches(tx_hash)
                         txs.add(tx_hash)
         return txs
 
@@ -744,22 +991,22 @@ class AddressSynchronizer(PrintError):
         return received, sent
 
     def get_addr_utxo(self, address):
-        coins, spent = self.get_addr_io(address)
-        for txi in spent:
-            coins.pop(txi)
         out = {}
-        for txo, v in coins.items():
-            tx_height, value, is_cb = v
-            prevout_hash, prevout_n = txo.split(':')
-            x = {
-                'address':address,
-                'value':value,
-                'prevout_n':int(prevout_n),
-                'prevout_hash':prevout_hash,
-                'height':tx_height,
-                'coinbase':is_cb
-            }
-            out[txo] = x
+        with self.lock, self.transaction_lock:
+            coins = self._utxos.get(address)
+            if not coins:
+                return out
+            for txo, (value, is_cb) in coins.items():
+                prevout_hash, prevout_n = txo.split(':')
+                x = {
+                    'address':address,
+                    'value':value,
+                    'prevout_n':int(prevout_n),
+                    'prevout_hash':prevout_hash,
+                    'height':self.get_tx_height(prevout_hash).height,
+                    'coinbase':is_cb
+                }
+                out[txo] = x
         return out
 
     # return the total amount ever received by an address
@@ -772,10 +1019,22 @@ class AddressSynchronizer(PrintError):
         """Return the balance of a bitcoin address:
         confirmed and matured, unconfirmed, unmatured
         """
+        local_height = self.get_local_height()
+        with self.lock, self.transaction_lock:
+            cached = self._addr_balance_cache.get(address)
+            # only balances with coinbase outputs depend on the local height
+            if cached is not None and cached[0] in (None, local_height):
+                return cached[1]
+            balance, has_coinbase = self._compute_addr_balance(address, local_height)
+            self._addr_balance_cache[address] = (local_height if has_coinbase else None, balance)
+            return balance
+
+    def _compute_addr_balance(self, address, local_height):
         received, sent = self.get_addr_io(address)
         c = u = x = 0
-        local_height = self.get_local_height()
+        has_coinbase = False
         for txo, (tx_height, v, is_cb) in received.items():
+            has_coinbase |= is_cb
             if is_cb and tx_height + COINBASE_MATURITY > local_height:
                 x += v
             elif tx_height > 0:
@@ -787,7 +1046,7 @@ class AddressSynchronizer(PrintError):
                     c -= v
                 else:
                     u -= v
-        return c, u, x
+        return (c, u, x), has_coinbase
 
     @with_local_height_cached
     def get_utxos(self, domain=None, excluded=None, mature=False, confirmed_only=False, nonlocal_only=False):
@@ -810,6 +1069,7 @@ class AddressSynchronizer(PrintError):
                 continue
         return coins
 
+    @with_local_height_cached
     def get_balance(self, domain=None):
         if domain is None:
             domain = self.get_addresses()
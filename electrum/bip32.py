@@ -8,6 +8,7 @@ from typing import List
 from .util import bfh, bh2u, BitcoinException, print_error
 from . import constants
 from . import ecc
+from . import ecc_fast
 from .crypto import hash_160, hmac_oneshot
 from .bitcoin import rev_hex, int_to_hex, EncodeBase58Check, DecodeBase58Check
 
@@ -77,14 +78,49 @@ def CKD_pub(cK, c, n):
 # note: 's' does not need to fit into 32 bits here! (c.f. trustedcoin billing)
 def _CKD_pub(cK, c, s):
     I = hmac_oneshot(c, cK + s, hashlib.sha512)
-    pubkey = ecc.ECPrivkey(I[0:32]) + ecc.ECPubkey(cK)
-    if pubkey.is_at_infinity():
-        raise ecc.InvalidECPointException()
-    cK_n = pubkey.get_public_key_bytes(compressed=True)
+    cK_n = _pubkey_tweak_add(cK, I[0:32])
     c_n = I[32:]
     return cK_n, c_n
 
 
+def _pubkey_tweak_add(cK: bytes, tweak: bytes, parent: ecc.ECPubkey = None) -> bytes:
+    """Returns cK + tweak*G, compressed.
+    'parent' is the already parsed cK; it is not needed with libsecp256k1.
+    """
+    if ecc_fast.is_using_fast_ecc():
+        cK_n = ecc_fast.pubkey_tweak_add(cK, tweak)
+        if cK_n is None:
+            raise ecc.InvalidECPointException()
+        return cK_n
+    if parent is None:
+        parent = ecc.ECPubkey(cK)
+    pubkey = ecc.ECPrivkey(tweak) + parent
+    if pubkey.is_at_infinity():
+        raise ecc.InvalidECPointException()
+    return pubkey.get_public_key_bytes(compressed=True)
+
+
+def CKD_pub_range(cK: bytes, c: bytes, start: int, stop: int) -> List[bytes]:
+    """Same as [CKD_pub(cK, c, n)[0] for n in range(start, stop)], but
+    the parent key is only parsed once.
+    """
+    if start < 0: raise ValueError('the bip32 index needs to be non-negative')
+    parent = None if ecc_fast.is_using_fast_ecc() else ecc.ECPubkey(cK)
+    children = []
+    for n in range(start, stop):
+        # like protect_against_invalid_ecpoint, use the next index if n is invalid
+        while True:
+            if n & BIP32_PRIME: raise OverflowError()
+            I = hmac_oneshot(c, cK + n.to_bytes(4, byteorder='big'), hashlib.sha512)
+            try:
+                children.append(_pubkey_tweak_add(cK, I[0:32], parent))
+                break
+            except ecc.InvalidECPointException:
+                print_error('bip32 CKD_pub_range: skipping index')
+                n += 1
+    return children
+
+
 def xprv_header(xtype, *, net=None):
     if net is None:
         net = constants.net
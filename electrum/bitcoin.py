@@ -53,8 +53,8 @@ def rev_hex(s: str) -> str:
     return bh2u(bfh(s)[::-1])
 
 
-def int_to_hex(i: int, length: int=1) -> str:
-    """Converts int to little-endian hex string.
+def int_to_bytes(i: int, length: int=1) -> bytes:
+    """Converts int to little-endian bytes.
     `length` is the number of bytes available
     """
     if not isinstance(i, int):
@@ -62,12 +62,14 @@ def int_to_hex(i: int, length: int=1) -> str:
     range_size = pow(256, length)
     if i < -(range_size//2) or i >= range_size:
         raise OverflowError('cannot convert int {} to hex ({} bytes)'.format(i, length))
-    if i < 0:
-        # two's complement
-        i = range_size + i
-    s = hex(i)[2:].rstrip('L')
-    s = "0"*(2*length - len(s)) + s
-    return rev_hex(s)
+    # two's complement for negative numbers
+    return i.to_bytes(length, 'little', signed=i < 0)
+
+def int_to_hex(i: int, length: int=1) -> str:
+    """Converts int to little-endian hex string.
+    `length` is the number of bytes available
+    """
+    return bh2u(int_to_bytes(i, length))
 
 def script_num_to_hex(i: int) -> str:
     """See CScriptNum in Bitcoin Core.
@@ -93,16 +95,20 @@ def script_num_to_hex(i: int) -> str:
     return bh2u(result)
 
 
-def var_int(i: int) -> str:
+def compact_size(i: int) -> bytes:
     # https://en.bitcoin.it/wiki/Protocol_specification#Variable_length_integer
     if i<0xfd:
-        return int_to_hex(i)
+        return int_to_bytes(i)
     elif i<=0xffff:
-        return "fd"+int_to_hex(i,2)
+        return b'\xfd'+int_to_bytes(i,2)
     elif i<=0xffffffff:
-        return "fe"+int_to_hex(i,4)
+        return b'\xfe'+int_to_bytes(i,4)
     else:
-        return "ff"+int_to_hex(i,8)
+        return b'\xff'+int_to_bytes(i,8)
+
+
+def var_int(i: int) -> str:
+    return bh2u(compact_size(i))
 
 
 def witness_push(item: str) -> str:
@@ -112,38 +118,49 @@ def witness_push(item: str) -> str:
     return var_int(len(item) // 2) + item
 
 
-def op_push(i: int) -> str:
+def push_opcode(i: int) -> bytes:
+    """Returns the opcode that pushes `i` bytes of data."""
     if i<0x4c:  # OP_PUSHDATA1
-        return int_to_hex(i)
+        return int_to_bytes(i)
     elif i<=0xff:
-        return '4c' + int_to_hex(i)
+        return b'\x4c' + int_to_bytes(i)
     elif i<=0xffff:
-        return '4d' + int_to_hex(i,2)
+        return b'\x4d' + int_to_bytes(i,2)
     else:
-        return '4e' + int_to_hex(i,4)
+        return b'\x4e' + int_to_bytes(i,4)
 
 
-def push_script(data: str) -> str:
+def op_push(i: int) -> str:
+    return bh2u(push_opcode(i))
+
+
+def push_data(data: bytes) -> bytes:
     """Returns pushed data to the script, automatically
     choosing canonical opcodes depending on the length of the data.
-    hex -> hex
+    bytes -> bytes
 
     ported from https://github.com/btcsuite/btcd/blob/fdc2bc867bda6b351191b5872d2da8270df00d13/txscript/scriptbuilder.go#L128
     """
-    data = bfh(data)
     from .transaction import opcodes
 
     data_len = len(data)
 
     # "small integer" opcodes
     if data_len == 0 or data_len == 1 and data[0] == 0:
-        return bh2u(bytes([opcodes.OP_0]))
+        return bytes([opcodes.OP_0])
     elif data_len == 1 and data[0] <= 16:
-        return bh2u(bytes([opcodes.OP_1 - 1 + data[0]]))
+        return bytes([opcodes.OP_1 - 1 + data[0]])
     elif data_len == 1 and data[0] == 0x81:
-        return bh2u(bytes([opcodes.OP_1NEGATE]))
+        return bytes([opcodes.OP_1NEGATE])
 
-    return op_push(data_len) + bh2u(data)
+    return push_opcode(data_len) + data
+
+
+def push_script(data: str) -> str:
+    """Returns pushed data to the script, see push_data.
+    hex -> hex
+    """
+    return bh2u(push_data(bfh(data)))
 
 
 def add_number_to_script(i: int) -> bytes:
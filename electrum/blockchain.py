@@ -21,6 +21,10 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import os
+import json
+import mmap
+import time
+import hashlib
 import threading
 from typing import Optional, Dict
 
@@ -33,6 +37,9 @@ from .simple_config import SimpleConfig
 
 
 HEADER_SIZE = 80  # bytes
+HASH_SIZE = 32  # bytes
+# headers saved one by one are fsynced in groups, at most this many seconds apart
+HEADERS_FSYNC_INTERVAL = 10
 MAX_TARGET = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
 
 
@@ -86,11 +93,13 @@ blockchains_lock = threading.RLock()
 
 
 def read_blockchains(config: 'SimpleConfig'):
+    load_chainwork_cache(config)
     blockchains[constants.net.GENESIS] = Blockchain(config=config,
                                                     forkpoint=0,
                                                     parent=None,
                                                     forkpoint_hash=constants.net.GENESIS,
                                                     prev_hash=None)
+    blockchains[constants.net.GENESIS].truncate_torn_writes()
     fdir = os.path.join(util.get_headers_dir(config), 'forks')
     util.make_dir(fdir)
     # files are named as: fork2_{forkpoint}_{prev_hash}_{first_hash}
@@ -122,12 +131,15 @@ def read_blockchains(config: 'SimpleConfig'):
                        parent=parent,
                        forkpoint_hash=first_hash,
                        prev_hash=prev_hash)
+        b.truncate_torn_writes()
         # consistency checks
         h = b.read_header(b.forkpoint)
         if first_hash != hash_header(h):
+            b.close_headers_file()
             delete_chain(filename, "incorrect first hash for chain")
             return
         if not b.parent.can_connect(h, check_height=False):
+            b.close_headers_file()
             delete_chain(filename, "cannot connect chain to parent")
             return
         chain_id = b.get_id()
@@ -141,10 +153,48 @@ def read_blockchains(config: 'SimpleConfig'):
 def get_best_chain() -> 'Blockchain':
     return blockchains[constants.net.GENESIS]
 
+
+def sync_blockchains_to_disk(max_age: float=0) -> None:
+    with blockchains_lock: chains = list(blockchains.values())
+    for b in chains:
+        b.sync_to_disk(max_age)
+
 # block hash -> chain work; up to and including that block
+# As the work is a property of the block and its ancestors, entries
+# never become stale when chains get swapped or forks are dropped.
 _CHAINWORK_CACHE = {
     "0000000000000000000000000000000000000000000000000000000000000000": 0,  # virtual block at height -1
 }  # type: Dict[str, int]
+_CHAINWORK_CACHE_PATH = None  # type: Optional[str]
+
+
+def load_chainwork_cache(config: 'SimpleConfig') -> None:
+    """Loads the chain work at retarget boundaries computed in
+    previous sessions, and persists new entries to the same file."""
+    global _CHAINWORK_CACHE_PATH
+    path = os.path.join(util.get_headers_dir(config), 'chainwork_cache')
+    _CHAINWORK_CACHE_PATH = path
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            d = json.loads(f.read())
+        d = {k: int(v) for k, v in d.items()}
+    except Exception as e:
+        util.print_error("[blockchain] cannot read chainwork cache", repr(e))
+        return
+    _CHAINWORK_CACHE.update(d)
+
+
+def _save_chainwork_cache() -> None:
+    if _CHAINWORK_CACHE_PATH is None:
+        return
+    with blockchains_lock:
+        s = json.dumps(_CHAINWORK_CACHE, sort_keys=True)
+        temp_path = "%s.tmp.%s" % (_CHAINWORK_CACHE_PATH, os.getpid())
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(s)
+        os.replace(temp_path, _CHAINWORK_CACHE_PATH)
 
 
 class Blockchain(util.PrintError):
@@ -165,6 +215,11 @@ class Blockchain(util.PrintError):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        self._mmap = None  # read-only map of the headers file; reopened after writes
+        # raw hashes of the headers in our file, HASH_SIZE bytes each;
+        # filled lazily, all-zero means not computed yet
+        self._hashes = bytearray()
+        self._unsynced_since = None  # time of the oldest write not yet fsynced
         self.update_size()
 
     def with_lock(func):
@@ -241,6 +296,26 @@ class Blockchain(util.PrintError):
     def update_size(self) -> None:
         p = self.path()
         self._size = os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0
+        index_size = self._size * HASH_SIZE
+        if len(self._hashes) > index_size:
+            del self._hashes[index_size:]
+        else:
+            self._hashes.extend(bytes(index_size - len(self._hashes)))
+
+    @with_lock
+    def close_headers_file(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    @with_lock
+    def _read_raw_header(self, delta: int) -> bytes:
+        if self._mmap is None:
+            name = self.path()
+            self.assert_headers_file_available(name)
+            with open(name, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), self._size * HEADER_SIZE, access=mmap.ACCESS_READ)
+        return self._mmap[delta * HEADER_SIZE:(delta + 1) * HEADER_SIZE]
 
     @classmethod
     def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None) -> None:
@@ -259,20 +334,42 @@ class Blockchain(util.PrintError):
             raise Exception(f"insufficient proof of work: {block_hash_as_num} vs target {target}")
 
     def verify_chunk(self, index: int, data: bytes) -> None:
+        """Verifies a chunk of raw headers.
+        Works on the raw bytes: each header is hashed once,
+        and bits/target are computed once for the whole chunk.
+        """
         num = len(data) // HEADER_SIZE
         start_height = index * 2016
-        prev_hash = self.get_hash(start_height - 1)
+        prev_hash = bfh(self.get_hash(start_height - 1))[::-1]
         target = self.get_target(index-1)
+        check_pow = not constants.net.TESTNET
+        if check_pow:
+            bits = self.target_to_bits(target)
+            raw_bits = bits.to_bytes(4, byteorder='little')
+        # we only have to compare with hashes we already know
+        known_height = max(self.height(), constants.net.max_checkpoint())
+        data = memoryview(data)
         for i in range(num):
             height = start_height + i
-            try:
-                expected_header_hash = self.get_hash(height)
-            except MissingHeader:
-                expected_header_hash = None
             raw_header = data[i*HEADER_SIZE : (i+1)*HEADER_SIZE]
-            header = deserialize_header(raw_header, index*2016 + i)
-            self.verify_header(header, prev_hash, target, expected_header_hash)
-            prev_hash = hash_header(header)
+            _hash = hashlib.sha256(hashlib.sha256(raw_header).digest()).digest()
+            if height <= known_height:
+                try:
+                    expected_header_hash = self.get_hash(height)
+                except MissingHeader:
+                    expected_header_hash = None
+                if expected_header_hash and expected_header_hash != hash_encode(_hash):
+                    raise Exception("hash mismatches with expected: {} vs {}".format(expected_header_hash, hash_encode(_hash)))
+            if raw_header[4:36] != prev_hash:
+                raise Exception("prev hash mismatch: %s vs %s" % (hash_encode(prev_hash), hash_encode(raw_header[4:36])))
+            if check_pow:
+                if raw_header[72:76] != raw_bits:
+                    header_bits = int.from_bytes(raw_header[72:76], byteorder='little')
+                    raise Exception("bits mismatch: %s vs %s" % (bits, header_bits))
+                block_hash_as_num = int.from_bytes(_hash, byteorder='little')
+                if block_hash_as_num > target:
+                    raise Exception(f"insufficient proof of work: {block_hash_as_num} vs target {target}")
+            prev_hash = _hash
 
     @with_lock
     def path(self):
@@ -346,8 +443,11 @@ class Blockchain(util.PrintError):
             parent_data = f.read(parent_branch_size*HEADER_SIZE)
         self.write(parent_data, 0)
         parent.write(my_data, (forkpoint - parent.forkpoint)*HEADER_SIZE)
+        self.close_headers_file()
+        parent.close_headers_file()
         # swap parameters
         self.parent, parent.parent = parent.parent, self  # type: Optional[Blockchain], Optional[Blockchain]
+        self._hashes, parent._hashes = parent._hashes, self._hashes
         self.forkpoint, parent.forkpoint = parent.forkpoint, self.forkpoint
         self._forkpoint_hash, parent._forkpoint_hash = parent._forkpoint_hash, hash_raw_header(bh2u(parent_data[:HEADER_SIZE]))
         self._prev_hash, parent._prev_hash = parent._prev_hash, self._prev_hash
@@ -378,9 +478,15 @@ class Blockchain(util.PrintError):
             raise FileNotFoundError('Cannot find headers file but headers_dir is there. Should be at {}'.format(path))
 
     @with_lock
-    def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
+    def write(self, data: bytes, offset: int, truncate: bool=True, *, durable: bool=True) -> None:
+        """Writes data at offset. Unless durable, the write is only
+        fsynced together with later ones (see HEADERS_FSYNC_INTERVAL);
+        a crash in between is repaired by truncate_torn_writes.
+        """
         filename = self.path()
         self.assert_headers_file_available(filename)
+        # the file cannot be truncated or grown under an existing map
+        self.close_headers_file()
         with open(filename, 'rb+') as f:
             if truncate and offset != self._size * HEADER_SIZE:
                 f.seek(offset)
@@ -388,7 +494,66 @@ class Blockchain(util.PrintError):
             f.seek(offset)
             f.write(data)
             f.flush()
-            os.fsync(f.fileno())
+            if self._unsynced_since is None and not durable:
+                self._unsynced_since = time.time()
+            if durable or time.time() - self._unsynced_since >= HEADERS_FSYNC_INTERVAL:
+                os.fsync(f.fileno())
+                self._unsynced_since = None
+        self.update_size()
+        # invalidate the hashes of the headers we overwrote
+        start = offset // HEADER_SIZE * HASH_SIZE
+        end = min(len(self._hashes), -(-(offset + len(data)) // HEADER_SIZE) * HASH_SIZE)
+        if start < end:
+            self._hashes[start:end] = bytes(end - start)
+
+    @with_lock
+    def sync_to_disk(self, max_age: float=0) -> None:
+        """fsyncs writes that are older than max_age seconds"""
+        if self._unsynced_since is None or time.time() - self._unsynced_since < max_age:
+            return
+        filename = self.path()
+        if os.path.exists(filename):
+            with open(filename, 'rb+') as f:
+                os.fsync(f.fileno())
+        self._unsynced_since = None
+
+    @with_lock
+    def truncate_torn_writes(self) -> None:
+        """Drops the headers at the end of our file that did not make it
+        to disk intact, e.g. after a crash between two group commits.
+        Only the last chunk is checked; older writes were fsynced.
+        """
+        filename = self.path()
+        if not os.path.exists(filename):
+            return
+        file_size = os.path.getsize(filename)
+        size = file_size // HEADER_SIZE
+        start = max(0, size - 2016)
+        with open(filename, 'rb') as f:
+            f.seek(start * HEADER_SIZE)
+            data = f.read((size - start) * HEADER_SIZE)
+        good_size = size
+        prev_hash = None
+        for i in range(size - start):
+            raw_header = data[i*HEADER_SIZE:(i+1)*HEADER_SIZE]
+            if raw_header == bytes(HEADER_SIZE):
+                # headers below the max checkpoint might not have been downloaded
+                if self.forkpoint + start + i > constants.net.max_checkpoint():
+                    good_size = start + i
+                    break
+                prev_hash = None
+                continue
+            if prev_hash is not None and raw_header[4:36] != prev_hash:
+                good_size = start + i
+                break
+            prev_hash = sha256d(raw_header)
+        if good_size * HEADER_SIZE != file_size:
+            self.print_error(f"truncating torn writes in {filename}: {size - good_size} headers")
+            self.close_headers_file()
+            with open(filename, 'rb+') as f:
+                f.truncate(good_size * HEADER_SIZE)
+                f.flush()
+                os.fsync(f.fileno())
         self.update_size()
 
     @with_lock
@@ -398,7 +563,7 @@ class Blockchain(util.PrintError):
         # headers are only _appended_ to the end:
         assert delta == self.size()
         assert len(data) == HEADER_SIZE
-        self.write(data, delta*HEADER_SIZE)
+        self.write(data, delta*HEADER_SIZE, durable=False)
         self.swap_with_parent()
 
     @with_lock
@@ -410,17 +575,29 @@ class Blockchain(util.PrintError):
         if height > self.height():
             return
         delta = height - self.forkpoint
-        name = self.path()
-        self.assert_headers_file_available(name)
-        with open(name, 'rb') as f:
-            f.seek(delta * HEADER_SIZE)
-            h = f.read(HEADER_SIZE)
-            if len(h) < HEADER_SIZE:
-                raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
+        h = self._read_raw_header(delta)
         if h == bytes([0])*HEADER_SIZE:
             return None
         return deserialize_header(h, height)
 
+    @with_lock
+    def _get_hash_from_index(self, height: int) -> str:
+        if height < 0:
+            raise MissingHeader(height)
+        if height < self.forkpoint:
+            return self.parent.get_hash(height)
+        if height > self.height():
+            raise MissingHeader(height)
+        delta = height - self.forkpoint
+        h = bytes(self._hashes[delta * HASH_SIZE:(delta + 1) * HASH_SIZE])
+        if h == bytes(HASH_SIZE):
+            raw_header = self._read_raw_header(delta)
+            if raw_header == bytes(HEADER_SIZE):
+                raise MissingHeader(height)
+            h = sha256d(raw_header)
+            self._hashes[delta * HASH_SIZE:(delta + 1) * HASH_SIZE] = h
+        return hash_encode(h)
+
     def get_hash(self, height: int) -> str:
         def is_height_checkpoint():
             within_cp_range = height <= constants.net.max_checkpoint()
@@ -436,10 +613,7 @@ class Blockchain(util.PrintError):
             h, t = self.checkpoints[index]
             return h
         else:
-            header = self.read_header(height)
-            if header is None:
-                raise MissingHeader(height)
-            return hash_header(header)
+            return self._get_hash_from_index(height)
 
     def get_target(self, index: int) -> int:
         # compute target from chunk x, used in chunk x+1
@@ -510,12 +684,15 @@ class Blockchain(util.PrintError):
             cached_height -= 2016
         assert cached_height >= -1, cached_height
         running_total = _CHAINWORK_CACHE[self.get_hash(cached_height)]
+        cache_updated = cached_height < last_retarget
         while cached_height < last_retarget:
             cached_height += 2016
             work_in_single_header = self.chainwork_of_header_at_height(cached_height)
             work_in_chunk = 2016 * work_in_single_header
             running_total += work_in_chunk
             _CHAINWORK_CACHE[self.get_hash(cached_height)] = running_total
+        if cache_updated:
+            _save_chainwork_cache()
         cached_height += 2016
         work_in_single_header = self.chainwork_of_header_at_height(cached_height)
         work_in_last_partial_chunk = (height % 2016 + 1) * work_in_single_header
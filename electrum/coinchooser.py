@@ -22,6 +22,7 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import time
 from collections import defaultdict
 from math import floor, log10
 from typing import NamedTuple, List
@@ -230,12 +231,28 @@ class CoinChooserBase(PrintError):
 
             return total_weight
 
+        def excess_funds(buckets):
+            '''Given a list of buckets, return the value left over after
+            paying for the transaction without change (negative if the
+            buckets are not enough)'''
+            total_input = input_value + sum(bucket.value for bucket in buckets)
+            total_weight = get_tx_weight(buckets)
+            return total_input - spent_amount - fee_estimator_w(total_weight)
+
         def sufficient_funds(buckets):
             '''Given a list of buckets, return True if it has enough
             value to pay for the transaction'''
-            total_input = input_value + sum(bucket.value for bucket in buckets)
-            total_weight = get_tx_weight(buckets)
-            return total_input >= spent_amount + fee_estimator_w(total_weight)
+            return excess_funds(buckets) >= 0
+
+        # For choosers that look for a transaction without change.
+        # The change address is only a guess when it is not specified.
+        self.excess_funds = excess_funds
+        self.dust_threshold = dust_threshold
+        self.change_fee = 0
+        if change_addrs or coins:
+            change_addr = change_addrs[0] if change_addrs else coins[0]['address']
+            change_weight = 4 * Transaction.estimated_output_size(change_addr)
+            self.change_fee = fee_estimator_w(change_weight)
 
         # Collect the coins into buckets, choose a subset of the buckets
         buckets = self.bucketize_coins(coins)
@@ -380,8 +397,122 @@ class CoinChooserPrivacy(CoinChooserRandom):
         return penalty
 
 
+class CoinChooserBranchAndBound(CoinChooserPrivacy):
+    """Looks for coins that pay for the transaction without change.
+    It searches for a set of addresses whose coins, after their own fees,
+    add up to the amount being sent plus less than the cost of a change
+    output. Such a transaction is cheaper now, and leaves no change to
+    spend later. If no such set is found quickly, it chooses coins like
+    Privacy does.
+    """
+
+    bnb_max_tries = 100000
+    bnb_time_limit = 0.5  # seconds
+
+    def branch_and_bound(self, values, costs, target, max_excess, max_waste):
+        '''Depth-first search over the positive values, sorted in
+        descending order, for a subset adding up to at least target but
+        less than target + max_excess. Of the subsets found within the
+        budget, returns the indices of the one with the least waste (the
+        costs of its items plus its excess), if that is below max_waste.'''
+        n = len(values)
+        # remaining[i] is what the values from i onwards add up to
+        remaining = [0] * (n + 1)
+        for i in reversed(range(n)):
+            remaining[i] = remaining[i + 1] + values[i]
+        if remaining[0] < target:
+            return None
+        best, best_waste = None, max_waste
+        selected = []
+        total = cost = 0
+        i = 0
+        deadline = time.monotonic() + self.bnb_time_limit
+        for tries in range(self.bnb_max_tries):
+            if tries % 1000 == 999 and time.monotonic() > deadline:
+                break
+            if cost >= best_waste:
+                backtrack = True
+            elif total >= target:
+                # adding more values would only add to the waste
+                excess = total - target
+                if excess < max_excess and cost + excess < best_waste:
+                    best, best_waste = list(selected), cost + excess
+                backtrack = True
+            else:
+                backtrack = total + remaining[i] < target
+            if not backtrack:
+                selected.append(i)
+                total += values[i]
+                cost += costs[i]
+                i += 1
+                continue
+            if not selected:
+                break
+            # replace the last inclusion by its omission; omitting it and
+            # including an equal value instead was already covered
+            last = selected.pop()
+            total -= values[last]
+            cost -= costs[last]
+            i = last + 1
+            while i < n and values[i] == values[last] and costs[i] == costs[last]:
+                i += 1
+        return best
+
+    def bucket_selection_without_change(self, buckets):
+        '''Returns buckets that pay for the transaction without change,
+        or None. Like bucket_candidates_prefer_confirmed, only uses
+        buckets with unconfirmed coins if the others are not enough.
+
+        Excess value that would not make a change output above dust
+        goes to the fee. The selection must waste less in input fees and
+        excess than the cheapest alternative with change: one input, the
+        change output, and spending the change later.'''
+        bucket_sets = [[bkt for bkt in buckets if bkt.min_height > 0],
+                       [bkt for bkt in buckets if bkt.min_height == 0],
+                       [bkt for bkt in buckets if bkt.min_height < 0]]
+        max_excess = self.change_fee + self.dust_threshold
+        already_selected_buckets = []
+        for bkts_choose_from in bucket_sets:
+            all_buckets = already_selected_buckets + bkts_choose_from
+            if self.excess_funds(all_buckets) < 0:
+                already_selected_buckets = all_buckets
+                continue
+            # effective value: what a bucket adds after paying for itself
+            excess = self.excess_funds(already_selected_buckets)
+            candidates = []
+            for bkt in bkts_choose_from:
+                value = self.excess_funds(already_selected_buckets + [bkt]) - excess
+                if value > 0:
+                    candidates.append((value, bkt.value - value, bkt))
+            if not candidates:
+                return None
+            candidates.sort(key=lambda x: x[0], reverse=True)
+            min_input_fee = min(cost for value, cost, bkt in candidates)
+            max_waste = 2 * min_input_fee + self.change_fee
+            indices = self.branch_and_bound([value for value, cost, bkt in candidates],
+                                            [cost for value, cost, bkt in candidates],
+                                            -excess, max_excess, max_waste)
+            if indices is None:
+                return None
+            selection = already_selected_buckets + [candidates[n][2] for n in indices]
+            # effective values are estimates as fees are not quite additive
+            if not 0 <= self.excess_funds(selection) < max_excess:
+                return None
+            return selection
+        return None
+
+    def choose_buckets(self, buckets, sufficient_funds, penalty_func):
+        selection = self.bucket_selection_without_change(buckets)
+        if selection is not None:
+            self.print_error("Found selection without change, excess:",
+                             self.excess_funds(selection))
+            return selection
+        return super().choose_buckets(buckets, sufficient_funds, penalty_func)
+
+
 COIN_CHOOSERS = {
     'Privacy': CoinChooserPrivacy,
+    'BranchAndBound': CoinChooserBranchAndBound,
 }
 
 def get_name(config):
@@ -5,6 +5,7 @@ import os
 import sys
 import traceback
 import ctypes
+from typing import Optional
 from ctypes.util import find_library
 from ctypes import (
     byref, c_byte, c_int, c_uint, c_char_p, c_size_t, c_void_p, create_string_buffer, CFUNCTYPE, POINTER
@@ -81,6 +82,9 @@ def load_library():
         secp256k1.secp256k1_ec_pubkey_tweak_mul.argtypes = [c_void_p, c_char_p, c_char_p]
         secp256k1.secp256k1_ec_pubkey_tweak_mul.restype = c_int
 
+        secp256k1.secp256k1_ec_pubkey_tweak_add.argtypes = [c_void_p, c_char_p, c_char_p]
+        secp256k1.secp256k1_ec_pubkey_tweak_add.restype = c_int
+
         secp256k1.ctx = secp256k1.secp256k1_context_create(SECP256K1_CONTEXT_SIGN | SECP256K1_CONTEXT_VERIFY)
         r = secp256k1.secp256k1_context_randomize(secp256k1.ctx, os.urandom(32))
         if r:
@@ -214,6 +218,26 @@ def is_using_fast_ecc():
     return _patched_functions.monkey_patching_active
 
 
+def pubkey_tweak_add(pubkey_bytes: bytes, tweak: bytes) -> Optional[bytes]:
+    """Returns pubkey + tweak*G, serialized compressed, computed by libsecp256k1.
+    Returns None if the tweak is not below the curve order or the result is infinity.
+    Only to be called if is_using_fast_ecc().
+    """
+    pubkey = create_string_buffer(64)
+    r = _libsecp256k1.secp256k1_ec_pubkey_parse(
+        _libsecp256k1.ctx, pubkey, pubkey_bytes, len(pubkey_bytes))
+    if not r:
+        raise ValueError('invalid public key')
+    r = _libsecp256k1.secp256k1_ec_pubkey_tweak_add(_libsecp256k1.ctx, pubkey, tweak)
+    if not r:
+        return None
+    pubkey_serialized = create_string_buffer(33)
+    pubkey_size = c_size_t(33)
+    _libsecp256k1.secp256k1_ec_pubkey_serialize(
+        _libsecp256k1.ctx, pubkey_serialized, byref(pubkey_size), pubkey, SECP256K1_EC_COMPRESSED)
+    return bytes(pubkey_serialized)
+
+
 try:
     _libsecp256k1 = load_library()
 except:
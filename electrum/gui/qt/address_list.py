@@ -27,19 +27,221 @@ import webbrowser
 from electrum.i18n import _
 from electrum.util import block_explorer_URL
 from electrum.plugin import run_hook
-from electrum.bitcoin import is_address
 
 from .util import *
 
 
-class AddressList(MyTreeWidget):
+class AddressModel(QAbstractTableModel):
+    """The addresses of the address list, in the order of the wallet.
+
+    The state of an address is read from the wallet when the view first
+    asks for its row, and kept until the wallet reports the address as
+    changed. Amounts are formatted when shown, so that a change of unit
+    or exchange rate only needs a repaint. Labels are always read from the
+    wallet, as plugins may change them without going through set_label.
+    """
+
+    def __init__(self, view: 'AddressList'):
+        QAbstractTableModel.__init__(self, view)
+        self.view = view
+        self.headers = []
+        self.addresses = []
+        self.row_of_address = {}
+        self.cache = {}  # address -> dict, see get_row_data
+        self.monospace_font = QFont(MONOSPACE_FONT)
+
+    def set_headers(self, headers):
+        self.beginResetModel()
+        self.headers = headers
+        self.endResetModel()
+
+    def set_addresses(self, addresses, changed):
+        """changed: the addresses whose state changed, None if any may have"""
+        if changed is None:
+            self.cache.clear()
+        else:
+            for address in changed:
+                self.cache.pop(address, None)
+        if addresses != self.addresses:
+            insertions = self.get_insertions(addresses)
+            if insertions is None:
+                self.beginResetModel()
+                self.addresses = list(addresses)
+                self.row_of_address = {addr: i for i, addr in enumerate(addresses)}
+                self.endResetModel()
+                return
+            # new addresses are usually appended to the receiving or
+            # change addresses of the wallet
+            for i, new_addresses in insertions:
+                self.beginInsertRows(QModelIndex(), i, i + len(new_addresses) - 1)
+                self.addresses[i:i] = new_addresses
+                self.endInsertRows()
+            self.row_of_address = {addr: i for i, addr in enumerate(self.addresses)}
+        if not self.addresses:
+            return
+        last_column = self.columnCount() - 1
+        if changed is None:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.addresses) - 1, last_column))
+            return
+        for address in changed:
+            i = self.row_of_address.get(address)
+            if i is not None:
+                self.dataChanged.emit(self.index(i, 0), self.index(i, last_column))
+
+    def get_insertions(self, addresses):
+        """Returns [(row, new addresses)] that turn the current addresses
+        into addresses, or None if they cannot be obtained by insertions.
+        """
+        insertions = []
+        i = 0
+        for j, addr in enumerate(addresses):
+            if i < len(self.addresses) and self.addresses[i] == addr:
+                i += 1
+            elif insertions and insertions[-1][0] + len(insertions[-1][1]) == j:
+                insertions[-1][1].append(addr)
+            else:
+                insertions.append((j, [addr]))
+        return insertions if i == len(self.addresses) else None
+
+    def get_row_data(self, i):
+        address = self.addresses[i]
+        d = self.cache.get(address)
+        if d is not None:
+            return d
+        wallet = self.view.wallet
+        c, u, x = wallet.get_addr_balance(address)
+        d = {
+            'num': wallet.get_address_history_len(address),
+            'balance': c + u + x,
+            'is_used': wallet.is_used(address),
+            'is_change': wallet.is_change(address),
+            'is_frozen': wallet.is_frozen(address),
+            'is_beyond_limit': wallet.is_beyond_limit(address),
+        }
+        self.cache[address] = d
+        return d
+
+    def get_text(self, i, column):
+        d = self.get_row_data(i)
+        if column == 0:
+            return _('change') if d['is_change'] else _('receiving')
+        elif column == 1:
+            return self.addresses[i]
+        elif column == 2:
+            return self.view.wallet.labels.get(self.addresses[i], '')
+        elif column == 3:
+            return self.view.parent.format_amount(d['balance'], whitespaces=True)
+        elif column == 4 and self.view.show_fiat:
+            fx = self.view.parent.fx
+            return fx.value_str(d['balance'], fx.exchange_rate())
+        return "%d" % d['num']
+
+    def sort_key(self, i, column):
+        if column == 0:
+            # the order of the wallet
+            return i
+        elif column == 1:
+            return self.addresses[i]
+        if column == 2:
+            return self.view.wallet.labels.get(self.addresses[i], '')
+        d = self.get_row_data(i)
+        if column == 3 or column == 4 and self.view.show_fiat:
+            return d['balance']
+        return d['num']
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.addresses)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        flags = QAbstractTableModel.flags(self, index)
+        if index.column() in self.view.editable_columns:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        i, column = index.row(), index.column()
+        if role == AddressList.ADDRESS_ROLE:
+            return self.addresses[i]
+        elif role in (Qt.DisplayRole, Qt.EditRole):
+            return self.get_text(i, column)
+        elif role == Qt.FontRole:
+            return self.monospace_font if column not in (0, 2) else None
+        elif role == Qt.TextAlignmentRole:
+            if column == 4 and self.view.show_fiat:
+                return Qt.AlignRight | Qt.AlignVCenter
+            return Qt.AlignVCenter
+        elif role == Qt.BackgroundRole:
+            d = self.get_row_data(i)
+            if column == 0:
+                return ColorScheme.YELLOW.as_color(True) if d['is_change'] else ColorScheme.GREEN.as_color(True)
+            elif column == 1:
+                if d['is_beyond_limit']:
+                    return ColorScheme.RED.as_color(True)
+                elif d['is_frozen']:
+                    return ColorScheme.BLUE.as_color(True)
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        prior = self.data(index)
+        if value != prior:
+            self.view.on_edited(index.row(), index.column(), value)
+        return True
+
+
+class AddressSortModel(QSortFilterProxyModel):
+
+    def lessThan(self, left, right):
+        model = self.sourceModel()
+        return model.sort_key(left.row(), left.column()) < model.sort_key(right.row(), right.column())
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        view = self.parent()
+        model = self.sourceModel()
+        if view.show_used:
+            d = model.get_row_data(source_row)
+            balance = d['balance']
+            is_used_and_empty = d['is_used'] and balance == 0
+            if view.show_used == 1 and (balance or is_used_and_empty):
+                return False
+            if view.show_used == 2 and balance == 0:
+                return False
+            if view.show_used == 3 and not is_used_and_empty:
+                return False
+        p = view.current_filter
+        if not p:
+            return True
+        return any(p in model.get_text(source_row, column).lower()
+                   for column in AddressList.filter_columns)
+
+
+class AddressList(MyTreeView):
     filter_columns = [0, 1, 2, 3]  # Type, Address, Label, Balance
+    ADDRESS_ROLE = Qt.UserRole
 
     def __init__(self, parent=None):
-        MyTreeWidget.__init__(self, parent, self.create_menu, [], 2)
+        MyTreeView.__init__(self, parent, self.create_menu, 2)
+        self.wallet = None
+        self.show_fiat = False
+        self.address_model = AddressModel(self)
+        self.proxy = AddressSortModel(self)
+        self.proxy.setSourceModel(self.address_model)
+        self.setModel(self.proxy)
         self.refresh_headers()
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setSortingEnabled(True)
+        self.sortByColumn(0, Qt.AscendingOrder)
         self.show_change = 0
         self.show_used = 0
         self.change_button = QComboBox(self)
@@ -58,6 +260,7 @@ class AddressList(MyTreeWidget):
         self.show_change = 0
         self.show_used = 0
         self.update()
+        self.proxy.invalidateFilter()
 
     def save_toolbar_state(self, state, config):
         config.set_key('show_toolbar_addresses', state)
@@ -65,9 +268,11 @@ class AddressList(MyTreeWidget):
     def refresh_headers(self):
         headers = [_('Type'), _('Address'), _('Label'), _('Balance')]
         fx = self.parent.fx
-        if fx and fx.get_fiat_address_config():
+        self.show_fiat = bool(fx and fx.get_fiat_address_config())
+        if self.show_fiat:
             headers.extend([_(fx.get_currency()+' Balance')])
         headers.extend([_('Tx')])
+        self.address_model.set_headers(headers)
         self.update_headers(headers)
 
     def toggle_change(self, state):
@@ -80,92 +285,57 @@ class AddressList(MyTreeWidget):
         if state == self.show_used:
             return
         self.show_used = state
-        self.update()
+        self.proxy.invalidateFilter()
 
     def on_update(self):
         self.wallet = self.parent.wallet
-        item = self.currentItem()
-        current_address = item.data(0, Qt.UserRole) if item else None
         if self.show_change == 1:
             addr_list = self.wallet.get_receiving_addresses()
         elif self.show_change == 2:
             addr_list = self.wallet.get_change_addresses()
         else:
             addr_list = self.wallet.get_addresses()
-        self.clear()
-        fx = self.parent.fx
-        for address in addr_list:
-            num = self.wallet.get_address_history_len(address)
-            label = self.wallet.labels.get(address, '')
-            c, u, x = self.wallet.get_addr_balance(address)
-            balance = c + u + x
-            is_used_and_empty = self.wallet.is_used(address) and balance == 0
-            if self.show_used == 1 and (balance or is_used_and_empty):
-                continue
-            if self.show_used == 2 and balance == 0:
-                continue
-            if self.show_used == 3 and not is_used_and_empty:
-                continue
-            balance_text = self.parent.format_amount(balance, whitespaces=True)
-            # create item
-            if fx and fx.get_fiat_address_config():
-                rate = fx.exchange_rate()
-                fiat_balance = fx.value_str(balance, rate)
-                address_item = SortableTreeWidgetItem(['', address, label, balance_text, fiat_balance, "%d"%num])
-            else:
-                address_item = SortableTreeWidgetItem(['', address, label, balance_text, "%d"%num])
-            # align text and set fonts
-            for i in range(address_item.columnCount()):
-                address_item.setTextAlignment(i, Qt.AlignVCenter)
-                if i not in (0, 2):
-                    address_item.setFont(i, QFont(MONOSPACE_FONT))
-            if fx and fx.get_fiat_address_config():
-                address_item.setTextAlignment(4, Qt.AlignRight | Qt.AlignVCenter)
-            # setup column 0
-            if self.wallet.is_change(address):
-                address_item.setText(0, _('change'))
-                address_item.setBackground(0, ColorScheme.YELLOW.as_color(True))
-            else:
-                address_item.setText(0, _('receiving'))
-                address_item.setBackground(0, ColorScheme.GREEN.as_color(True))
-            address_item.setData(0, Qt.UserRole, address)  # column 0; independent from address column
-            # setup column 1
-            if self.wallet.is_frozen(address):
-                address_item.setBackground(1, ColorScheme.BLUE.as_color(True))
-            if self.wallet.is_beyond_limit(address):
-                address_item.setBackground(1, ColorScheme.RED.as_color(True))
-            # add item
-            self.addChild(address_item)
-            if address == current_address:
-                self.setCurrentItem(address_item)
+        current_address = self.currentIndex().data(self.ADDRESS_ROLE)
+        self.address_model.set_addresses(addr_list, self.wallet.pop_changed_addresses())
+        if current_address and not self.currentIndex().isValid():
+            i = self.address_model.row_of_address.get(current_address)
+            if i is not None:
+                self.setCurrentIndex(self.proxy.mapFromSource(self.address_model.index(i, 0)))
+        # unchanged rows may still show amounts in another unit
+        self.viewport().update()
+
+    def on_edited(self, row, column, text):
+        '''Called only when the text actually changes'''
+        address = self.address_model.addresses[row]
+        self.parent.wallet.set_label(address, text)
+        self.update()
+        self.parent.history_list.update_labels()
+        self.parent.update_completions()
 
     def create_menu(self, position):
         from electrum.wallet import Multisig_Wallet
         is_multisig = isinstance(self.wallet, Multisig_Wallet)
         can_delete = self.wallet.can_delete_address()
-        selected = self.selectedItems()
+        selected = self.selectionModel().selectedRows()
         multi_select = len(selected) > 1
-        addrs = [item.text(1) for item in selected]
+        addrs = [index.data(self.ADDRESS_ROLE) for index in selected]
         if not addrs:
             return
         if not multi_select:
-            item = self.itemAt(position)
-            col = self.currentColumn()
-            if not item:
+            index = self.currentIndex()
+            if not index.isValid():
                 return
+            col = index.column()
             addr = addrs[0]
-            if not is_address(addr):
-                item.setExpanded(not item.isExpanded())
-                return
 
         menu = QMenu()
         if not multi_select:
-            column_title = self.headerItem().text(col)
-            copy_text = item.text(col)
+            column_title = self.address_model.headerData(col, Qt.Horizontal)
+            copy_text = index.data()
             menu.addAction(_("Copy {}").format(column_title), lambda: self.parent.app.clipboard().setText(copy_text))
             menu.addAction(_('Details'), lambda: self.parent.show_address(addr))
             if col in self.editable_columns:
-                menu.addAction(_("Edit {}").format(column_title), lambda: self.editItem(item, col))
+                menu.addAction(_("Edit {}").format(column_title), lambda: self.edit(index))
             menu.addAction(_("Request payment"), lambda: self.parent.receive_at(addr))
             if self.wallet.can_export():
                 menu.addAction(_("Private key"), lambda: self.parent.show_private_key(addr))
@@ -189,7 +359,3 @@ class AddressList(MyTreeWidget):
 
         run_hook('receive_menu', menu, addrs, self.wallet)
         menu.exec_(self.viewport().mapToGlobal(position))
-
-    def on_permit_edit(self, item, column):
-        # labels for headings, e.g. "receiving" or "used" should not be editable
-        return item.childCount() == 0
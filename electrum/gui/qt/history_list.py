@@ -30,7 +30,7 @@ from typing import TYPE_CHECKING
 
 from electrum.address_synchronizer import TX_HEIGHT_LOCAL
 from electrum.i18n import _
-from electrum.util import block_explorer_URL, profiler, print_error, TxMinedStatus
+from electrum.util import block_explorer_URL, profiler, print_error, timestamp_to_datetime
 
 from .util import *
 
@@ -58,23 +58,238 @@ TX_ICONS = [
 ]
 
 
-class HistoryList(MyTreeWidget, AcceptFileDragDrop):
+class HistoryModel(QAbstractTableModel):
+    """The transactions of the history list, oldest first.
+
+    Only the txid, mined status, value and balance of each transaction
+    are kept. The status and fiat values are computed when the view asks
+    for a row, which is usually only for the visible rows, and cached
+    until the row changes. Labels and amounts are read when shown, so
+    that a change of label or unit only needs a repaint.
+    """
+
+    def __init__(self, view: 'HistoryList'):
+        QAbstractTableModel.__init__(self, view)
+        self.view = view
+        self.headers = []
+        self.rows = []  # [(tx_hash, tx_mined_status, value, balance)]
+        self.row_of_txid = {}
+        self.cache = {}  # row -> dict, see get_row_data
+        self.blue_brush = QBrush(QColor("#1E1EFF"))
+        self.red_brush = QBrush(QColor("#BC1E1E"))
+        self.monospace_font = QFont(MONOSPACE_FONT)
+
+    def set_headers(self, headers):
+        self.beginResetModel()
+        self.headers = headers
+        self.cache.clear()
+        self.endResetModel()
+
+    def set_rows(self, rows):
+        """Only the rows that differ from the current ones are refreshed."""
+        n = len(self.rows)
+        if len(rows) >= n and all(a[0] == b[0] for a, b in zip(self.rows, rows)):
+            # new transactions usually land at the end of the history
+            for i in range(n):
+                if self.rows[i] != rows[i]:
+                    self.rows[i] = rows[i]
+                    self.refresh_row(i)
+            if len(rows) > n:
+                self.beginInsertRows(QModelIndex(), n, len(rows) - 1)
+                self.rows.extend(rows[n:])
+                for i in range(n, len(rows)):
+                    self.row_of_txid[rows[i][0]] = i
+                self.endInsertRows()
+        else:
+            self.beginResetModel()
+            self.cache.clear()
+            self.rows = list(rows)
+            self.row_of_txid = {row[0]: i for i, row in enumerate(rows)}
+            self.endResetModel()
+
+    def update_row(self, tx_hash, tx_mined_status):
+        i = self.row_of_txid.get(tx_hash)
+        if i is None:
+            return
+        tx_hash, old_status, value, balance = self.rows[i]
+        self.rows[i] = (tx_hash, tx_mined_status, value, balance)
+        self.refresh_row(i)
+
+    def refresh_row(self, i):
+        self.cache.pop(i, None)
+        self.dataChanged.emit(self.index(i, 0), self.index(i, self.columnCount() - 1))
+
+    def refresh_all_rows(self):
+        self.cache.clear()
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, self.columnCount() - 1))
+
+    def update_labels(self):
+        if not self.rows:
+            return
+        self.dataChanged.emit(self.index(0, 3), self.index(len(self.rows) - 1, 3))
+
+    def get_row_data(self, i):
+        d = self.cache.get(i)
+        if d is not None:
+            return d
+        wallet = self.view.wallet
+        window = self.view.parent
+        fx = window.fx
+        tx_hash, tx_mined_status, value, balance = self.rows[i]
+        status, status_str = wallet.get_tx_status(tx_hash, tx_mined_status)
+        fiat = None
+        fiat_text = []
+        if fx and fx.show_history():
+            tx_fee = wallet.get_tx_fee(wallet.transactions.get(tx_hash))
+            fiat = wallet.get_tx_item_fiat(tx_hash, value, fx, tx_fee)
+            fiat_text.append(fx.format_fiat(fiat['fiat_value'].value))
+            # fixme: should use is_mine
+            if value < 0:
+                fiat_text.append(fx.format_fiat(fiat['acquisition_price'].value))
+                fiat_text.append(fx.format_fiat(fiat['capital_gain'].value))
+        d = {
+            'status': status,
+            'status_str': status_str,
+            'fiat': fiat,
+            'fiat_text': fiat_text,
+        }
+        self.cache[i] = d
+        return d
+
+    def get_text(self, i, column):
+        tx_hash, tx_mined_status, value, balance = self.rows[i]
+        window = self.view.parent
+        if column == 0:
+            return ''
+        elif column == 1:
+            return tx_hash
+        elif column == 2:
+            return self.get_row_data(i)['status_str']
+        elif column == 3:
+            return self.view.wallet.get_label(tx_hash)
+        elif column == 4:
+            return window.format_amount(value, is_diff=True, whitespaces=True)
+        elif column == 5:
+            return window.format_amount(balance, whitespaces=True)
+        fiat_text = self.get_row_data(i)['fiat_text']
+        return fiat_text[column - 6] if column - 6 < len(fiat_text) else ''
+
+    def sort_key(self, i, column):
+        tx_hash, tx_mined_status, value, balance = self.rows[i]
+        if column == 0:
+            # most recent first
+            return -i
+        elif column == 2:
+            return i
+        elif column == 4:
+            return value
+        elif column == 5:
+            return balance
+        elif column >= 6:
+            fiat = self.get_row_data(i)['fiat']
+            if not fiat or value >= 0 and column > 6:
+                return None
+            key = {6: 'fiat_value', 7: 'acquisition_price', 8: 'capital_gain'}[column]
+            return fiat[key].value
+        return self.get_text(i, column)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        flags = QAbstractTableModel.flags(self, index)
+        if index.column() in self.view.editable_columns:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        i, column = index.row(), index.column()
+        if role == HistoryList.TX_HASH_ROLE:
+            return self.rows[i][0]
+        elif role == HistoryList.TX_VALUE_ROLE:
+            return self.rows[i][2]
+        elif role == Qt.FontRole:
+            return self.monospace_font if column != 2 else None
+        elif role == Qt.TextAlignmentRole:
+            return Qt.AlignRight | Qt.AlignVCenter if column > 3 else None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.get_text(i, column)
+        d = self.get_row_data(i)
+        if role == Qt.DecorationRole:
+            if column == 0:
+                return self.view.icon_cache.get(":icons/" + TX_ICONS[d['status']])
+            elif column == 3 and self.view.wallet.invoices.paid.get(self.rows[i][0]):
+                return self.view.icon_cache.get(":icons/seal")
+        elif role == Qt.ToolTipRole and column == 0:
+            conf = self.rows[i][1].conf
+            return str(conf) + " confirmation" + ("s" if conf != 1 else "")
+        elif role == Qt.ForegroundRole:
+            value = self.rows[i][2]
+            if value and value < 0 and column in (3, 4):
+                return self.red_brush
+            if column == 6 and d['fiat'] is not None and not d['fiat']['fiat_default']:
+                return self.blue_brush
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        prior = self.data(index)
+        if value != prior:
+            self.view.on_edited(index.row(), index.column(), value)
+        return True
+
+
+class HistorySortModel(QSortFilterProxyModel):
+
+    def lessThan(self, left, right):
+        model = self.sourceModel()
+        a = model.sort_key(left.row(), left.column())
+        b = model.sort_key(right.row(), right.column())
+        if a is None or b is None:
+            return a is None and b is not None
+        return a < b
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        p = self.parent().current_filter
+        if not p:
+            return True
+        model = self.sourceModel()
+        return any(p in model.get_text(source_row, column).lower()
+                   for column in HistoryList.filter_columns)
+
+
+class HistoryList(MyTreeView, AcceptFileDragDrop):
     filter_columns = [2, 3, 4]  # Date, Description, Amount
     TX_HASH_ROLE = Qt.UserRole
     TX_VALUE_ROLE = Qt.UserRole + 1
 
     def __init__(self, parent=None):
-        MyTreeWidget.__init__(self, parent, self.create_menu, [], 3)
+        MyTreeView.__init__(self, parent, self.create_menu, 3)
         AcceptFileDragDrop.__init__(self, ".txn")
+        self.wallet = None
+        self.history_model = HistoryModel(self)
+        self.proxy = HistorySortModel(self)
+        self.proxy.setSourceModel(self.history_model)
+        self.setModel(self.proxy)
         self.refresh_headers()
-        self.setColumnHidden(1, True)
         self.setSortingEnabled(True)
         self.sortByColumn(0, Qt.AscendingOrder)
         self.start_timestamp = None
         self.end_timestamp = None
         self.years = []
         self.create_toolbar_buttons()
-        self.wallet = None
 
     def format_date(self, d):
         return str(datetime.date(d.year, d.month, d.day)) if d else _('None')
@@ -90,11 +305,19 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
                 headers.extend(['%s '%fx.ccy + _('Capital Gains')])
         else:
             self.editable_columns -= {6}
+        self.history_model.set_headers(headers)
         self.update_headers(headers)
+        self.setColumnHidden(1, True)
 
     def get_domain(self):
         '''Replaced in address_dialog.py'''
-        return self.wallet.get_addresses()
+        return None  # the whole wallet
+
+    def get_full_history(self):
+        return self.wallet.get_full_history(domain=self.get_domain(),
+                                            from_timestamp=self.start_timestamp,
+                                            to_timestamp=self.end_timestamp,
+                                            fx=self.parent.fx)
 
     def on_combo(self, x):
         s = self.period_combo.itemText(x)
@@ -170,7 +393,7 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
             return time.mktime(date.timetuple())
 
     def show_summary(self):
-        h = self.summary
+        h = self.get_full_history()['summary']
         if not h:
             self.parent.show_message(_("Nothing to summarize."))
             return
@@ -215,7 +438,7 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
                 _("Perhaps some dependencies are missing...") + " (matplotlib?)")
             return
         try:
-            plt = plot_history(self.transactions)
+            plt = plot_history(self.get_full_history()['transactions'])
             plt.show()
         except NothingToPlotException as e:
             self.parent.show_message(str(e))
@@ -224,81 +447,44 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
     def on_update(self):
         self.wallet = self.parent.wallet  # type: Abstract_Wallet
         fx = self.parent.fx
-        r = self.wallet.get_full_history(domain=self.get_domain(), from_timestamp=self.start_timestamp, to_timestamp=self.end_timestamp, fx=fx)
-        self.transactions = r['transactions']
-        self.summary = r['summary']
-        if not self.years and self.transactions:
-            start_date = self.transactions[0].get('date') or date.today()
-            end_date = self.transactions[-1].get('date') or date.today()
+        if fx: fx.history_used_spot = False
+        now = time.time()
+        rows = []
+        for tx_hash, tx_mined_status, value, balance in self.wallet.get_history(self.get_domain()):
+            timestamp = tx_mined_status.timestamp
+            if self.start_timestamp and (timestamp or now) < self.start_timestamp:
+                continue
+            if self.end_timestamp and (timestamp or now) >= self.end_timestamp:
+                continue
+            # value may be None if wallet is not fully synchronized
+            if value is None:
+                continue
+            rows.append((tx_hash, tx_mined_status, value, balance))
+        if not self.years and rows:
+            start_date = timestamp_to_datetime(rows[0][1].timestamp) or date.today()
+            end_date = timestamp_to_datetime(rows[-1][1].timestamp) or date.today()
             self.years = [str(i) for i in range(start_date.year, end_date.year + 1)]
             self.period_combo.insertItems(1, self.years)
-        item = self.currentItem()
-        current_tx = item.data(0, self.TX_HASH_ROLE) if item else None
-        self.clear()
-        if fx: fx.history_used_spot = False
-        blue_brush = QBrush(QColor("#1E1EFF"))
-        red_brush = QBrush(QColor("#BC1E1E"))
-        monospace_font = QFont(MONOSPACE_FONT)
-        for tx_item in self.transactions:
-            tx_hash = tx_item['txid']
-            height = tx_item['height']
-            conf = tx_item['confirmations']
-            timestamp = tx_item['timestamp']
-            value_sat = tx_item['value'].value
-            balance = tx_item['balance'].value
-            label = tx_item['label']
-            tx_mined_status = TxMinedStatus(height, conf, timestamp, None)
-            status, status_str = self.wallet.get_tx_status(tx_hash, tx_mined_status)
-            has_invoice = self.wallet.invoices.paid.get(tx_hash)
-            icon = self.icon_cache.get(":icons/" + TX_ICONS[status])
-            v_str = self.parent.format_amount(value_sat, is_diff=True, whitespaces=True)
-            balance_str = self.parent.format_amount(balance, whitespaces=True)
-            entry = ['', tx_hash, status_str, label, v_str, balance_str]
-            fiat_value = None
-            if value_sat is not None and fx and fx.show_history():
-                fiat_value = tx_item['fiat_value'].value
-                value_str = fx.format_fiat(fiat_value)
-                entry.append(value_str)
-                # fixme: should use is_mine
-                if value_sat < 0:
-                    entry.append(fx.format_fiat(tx_item['acquisition_price'].value))
-                    entry.append(fx.format_fiat(tx_item['capital_gain'].value))
-            item = SortableTreeWidgetItem(entry)
-            item.setIcon(0, icon)
-            item.setToolTip(0, str(conf) + " confirmation" + ("s" if conf != 1 else ""))
-            if has_invoice:
-                item.setIcon(3, self.icon_cache.get(":icons/seal"))
-            for i in range(len(entry)):
-                if i>3:
-                    item.setTextAlignment(i, Qt.AlignRight | Qt.AlignVCenter)
-                if i!=2:
-                    item.setFont(i, monospace_font)
-            if value_sat and value_sat < 0:
-                item.setForeground(3, red_brush)
-                item.setForeground(4, red_brush)
-            if fiat_value is not None and not tx_item['fiat_default']:
-                item.setForeground(6, blue_brush)
-            # sort orders
-            item.setData(0, SortableTreeWidgetItem.DataRole, (status, conf))
-            item.setData(4, SortableTreeWidgetItem.DataRole, value_sat)
-            item.setData(5, SortableTreeWidgetItem.DataRole, balance)
-            if fiat_value is not None:
-                item.setData(6, SortableTreeWidgetItem.DataRole, fiat_value)
-                if value_sat < 0:
-                    item.setData(7, SortableTreeWidgetItem.DataRole, tx_item['acquisition_price'].value)
-                    item.setData(8, SortableTreeWidgetItem.DataRole, tx_item['capital_gain'].value)
-            if tx_hash:
-                item.setData(0, self.TX_HASH_ROLE, tx_hash)
-                item.setData(0, self.TX_VALUE_ROLE, value_sat)
-            self.insertTopLevelItem(0, item)
-            if current_tx == tx_hash:
-                self.setCurrentItem(item)
-
-    def on_edited(self, item, column, prior):
+        current_tx = self.currentIndex().data(self.TX_HASH_ROLE)
+        self.history_model.set_rows(rows)
+        if current_tx and not self.currentIndex().isValid():
+            i = self.history_model.row_of_txid.get(current_tx)
+            if i is not None:
+                self.setCurrentIndex(self.proxy.mapFromSource(self.history_model.index(i, 0)))
+        # unchanged rows may still show amounts in another unit, or other labels
+        self.viewport().update()
+
+    def update_all_rows(self):
+        """Like update, for changes that are not in the history of the
+        wallet and may affect every row, e.g. fee estimates or exchange
+        rates."""
+        if self.wallet is not None:
+            self.history_model.refresh_all_rows()
+        self.update()
+
+    def on_edited(self, row, column, text):
         '''Called only when the text actually changes'''
-        key = item.data(0, self.TX_HASH_ROLE)
-        value_sat = item.data(0, self.TX_VALUE_ROLE)
-        text = item.text(column)
+        key, tx_mined_status, value_sat, balance = self.history_model.rows[row]
         # fixme
         if column == 3:
             self.parent.wallet.set_label(key, text)
@@ -306,13 +492,14 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
             self.parent.update_completions()
         elif column == 6:
             self.parent.wallet.set_fiat_value(key, self.parent.fx.ccy, text, self.parent.fx, value_sat)
-            self.on_update()
+            # capital gains of later transactions depend on it
+            self.update_all_rows()
 
-    def on_doubleclick(self, item, column):
-        if self.permit_edit(item, column):
-            super(HistoryList, self).on_doubleclick(item, column)
+    def on_doubleclick(self, index):
+        if self.permit_edit(index):
+            super(HistoryList, self).on_doubleclick(index)
         else:
-            tx_hash = item.data(0, self.TX_HASH_ROLE)
+            tx_hash = index.data(self.TX_HASH_ROLE)
             self.show_transaction(tx_hash)
 
     def show_transaction(self, tx_hash):
@@ -323,45 +510,32 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
         self.parent.show_transaction(tx, label)
 
     def update_labels(self):
-        root = self.invisibleRootItem()
-        child_count = root.childCount()
-        for i in range(child_count):
-            item = root.child(i)
-            txid = item.data(0, self.TX_HASH_ROLE)
-            label = self.wallet.get_label(txid)
-            item.setText(3, label)
+        if self.wallet is None:
+            return
+        self.history_model.update_labels()
 
     def update_item(self, tx_hash, tx_mined_status):
         if self.wallet is None:
             return
-        conf = tx_mined_status.conf
-        status, status_str = self.wallet.get_tx_status(tx_hash, tx_mined_status)
-        icon = self.icon_cache.get(":icons/" +  TX_ICONS[status])
-        items = self.findItems(tx_hash, Qt.MatchExactly, column=1)
-        if items:
-            item = items[0]
-            item.setIcon(0, icon)
-            item.setData(0, SortableTreeWidgetItem.DataRole, (status, conf))
-            item.setText(2, status_str)
+        self.history_model.update_row(tx_hash, tx_mined_status)
 
     def create_menu(self, position):
-        self.selectedIndexes()
-        item = self.currentItem()
-        if not item:
+        index = self.currentIndex()
+        if not index.isValid():
             return
-        column = self.currentColumn()
-        tx_hash = item.data(0, self.TX_HASH_ROLE)
+        column = index.column()
+        tx_hash = index.data(self.TX_HASH_ROLE)
         if not tx_hash:
             return
         tx = self.wallet.transactions.get(tx_hash)
         if not tx:
             return
-        if column is 0:
+        if column == 0:
             column_title = "ID"
             column_data = tx_hash
         else:
-            column_title = self.headerItem().text(column)
-            column_data = item.text(column)
+            column_title = self.history_model.headerData(column, Qt.Horizontal)
+            column_data = index.data()
         tx_URL = block_explorer_URL(self.config, 'tx', tx_hash)
         height = self.wallet.get_tx_height(tx_hash).height
         is_relevant, is_mine, v, fee = self.wallet.get_wallet_delta(tx)
@@ -372,8 +546,8 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
             menu.addAction(_("Remove"), lambda: self.remove_local_tx(tx_hash))
         menu.addAction(_("Copy {}").format(column_title), lambda: self.parent.app.clipboard().setText(column_data))
         for c in self.editable_columns:
-            menu.addAction(_("Edit {}").format(self.headerItem().text(c)),
-                           lambda bound_c=c: self.editItem(item, bound_c))
+            menu.addAction(_("Edit {}").format(self.history_model.headerData(c, Qt.Horizontal)),
+                           lambda bound_c=c: self.edit(index.sibling(index.row(), bound_c)))
         menu.addAction(_("Details"), lambda: self.show_transaction(tx_hash))
         if is_unconfirmed and tx:
             # note: the current implementation of RBF *needs* the old tx fee
@@ -427,7 +601,6 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
         hbox = Buttons(CancelButton(d), OkButton(d, _('Export')))
         vbox.addLayout(hbox)
         #run_hook('export_history_dialog', self, hbox)
-        self.update()
         if not d.exec_():
             return
         filename = filename_e.text()
@@ -442,7 +615,7 @@ class HistoryList(MyTreeWidget, AcceptFileDragDrop):
         self.parent.show_message(_("Your wallet history has been successfully exported."))
 
     def do_export_history(self, file_name, is_csv):
-        history = self.transactions
+        history = self.get_full_history()['transactions']
         lines = []
         if is_csv:
             for item in history:
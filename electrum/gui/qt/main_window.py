@@ -130,7 +130,14 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         self.qr_window = None
         self.not_enough_funds = False
         self.pluginsdialog = None
-        self.require_fee_update = False
+        # edits of the send tab are debounced, and the transaction is
+        # built in the background; see do_update_fee
+        self.fee_update_timer = QTimer(self)
+        self.fee_update_timer.setSingleShot(True)
+        self.fee_update_timer.setInterval(200)
+        self.fee_update_timer.timeout.connect(self.do_update_fee)
+        self.fee_preview_thread = TaskThread(self)
+        self.fee_preview_id = 0
         self.tl_windows = []
         self.tx_external_keypairs = {}
 
@@ -244,7 +251,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         edit.textEdited.emit(edit.text())
         # History tab needs updating if it used spot
         if self.fx.history_used_spot:
-            self.history_list.update()
+            self.history_list.update_all_rows()
 
     def toggle_tab(self, tab):
         show = not self.config.get('show_{}_tab'.format(tab.tab_name), False)
@@ -353,7 +360,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
                 self.fee_slider.update()
                 self.do_update_fee()
             # todo: update only unconfirmed tx
-            self.history_list.update()
+            self.history_list.update_all_rows()
         else:
             self.print_error("unexpected network_qt signal:", event, args)
 
@@ -454,6 +461,8 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         new_path = os.path.join(wallet_folder, filename)
         if new_path != path:
             try:
+                # the wallet file alone must hold every change, not the journal
+                self.wallet.storage.compact()
                 shutil.copy2(path, new_path)
                 self.show_message(_("A copy of your wallet file was created in")+" '%s'" % str(new_path), title=_("Wallet backup created"))
             except BaseException as reason:
@@ -682,10 +691,6 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         # resolve aliases
         # FIXME this is a blocking network call that has a timeout of 5 sec
         self.payto_e.resolve()
-        # update fee
-        if self.require_fee_update:
-            self.do_update_fee()
-            self.require_fee_update = False
         self.notify_transactions()
 
     def format_amount(self, x, is_diff=False, whitespaces=False):
@@ -1323,7 +1328,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         self.do_update_fee()
 
     def update_fee(self):
-        self.require_fee_update = True
+        self.fee_update_timer.start()
 
     def get_payto_or_dummy(self):
         r = self.payto_e.get_recipient()
@@ -1334,91 +1339,115 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
     def do_update_fee(self):
         '''Recalculate the fee.  If the fee was manually input, retain it, but
         still build the TX to see if there are enough funds.
+        The TX is built in the background. A request that is still queued
+        when the send tab changes again is skipped, and only the result of
+        the latest request is shown.
         '''
-        freeze_fee = self.is_send_fee_frozen()
-        freeze_feerate = self.is_send_feerate_frozen()
+        self.fee_update_timer.stop()
+        self.fee_preview_id += 1
+        preview_id = self.fee_preview_id
         amount = '!' if self.is_max else self.amount_e.get_amount()
         if amount is None:
-            if not freeze_fee:
+            if not self.is_send_fee_frozen():
                 self.fee_e.setAmount(None)
             self.not_enough_funds = False
             self.statusBar().showMessage('')
-        else:
-            fee_estimator = self.get_send_fee_estimator()
-            outputs = self.payto_e.get_outputs(self.is_max)
-            if not outputs:
-                _type, addr = self.get_payto_or_dummy()
-                outputs = [TxOutput(_type, addr, amount)]
-            is_sweep = bool(self.tx_external_keypairs)
-            make_tx = lambda fee_est: \
-                self.wallet.make_unsigned_transaction(
-                    self.get_coins(), outputs, self.config,
-                    fixed_fee=fee_est, is_sweep=is_sweep)
+            return
+        fee_estimator = self.get_send_fee_estimator()
+        outputs = self.payto_e.get_outputs(self.is_max)
+        if not outputs:
+            _type, addr = self.get_payto_or_dummy()
+            outputs = [TxOutput(_type, addr, amount)]
+        is_sweep = bool(self.tx_external_keypairs)
+        # read on the GUI thread, the form may change while the task runs
+        coins = list(self.get_coins())
+        make_tx = lambda fee_est: \
+            self.wallet.make_unsigned_transaction(
+                coins, outputs, self.config,
+                fixed_fee=fee_est, is_sweep=is_sweep)
+
+        def task():
+            # runs in fee_preview_thread
+            if preview_id != self.fee_preview_id:
+                return None
             try:
-                tx = make_tx(fee_estimator)
-                self.not_enough_funds = False
-            except (NotEnoughFunds, NoDynamicFeeEstimates) as e:
-                if not freeze_fee:
-                    self.fee_e.setAmount(None)
-                if not freeze_feerate:
-                    self.feerate_e.setAmount(None)
-                self.feerounding_icon.setVisible(False)
-
-                if isinstance(e, NotEnoughFunds):
-                    self.not_enough_funds = True
-                elif isinstance(e, NoDynamicFeeEstimates):
-                    try:
-                        tx = make_tx(0)
-                        size = tx.estimated_size()
-                        self.size_e.setAmount(size)
-                    except BaseException:
-                        pass
-                return
-            except BaseException:
-                traceback.print_exc(file=sys.stderr)
-                return
+                return make_tx(fee_estimator), None
+            except NotEnoughFunds as e:
+                return None, e
+            except NoDynamicFeeEstimates as e:
+                try:
+                    return make_tx(0), e
+                except BaseException:
+                    return None, e
 
-            size = tx.estimated_size()
-            self.size_e.setAmount(size)
+        def on_success(result):
+            if preview_id == self.fee_preview_id and result is not None:
+                self.show_fee_preview(*result)
 
-            fee = tx.get_fee()
-            fee = None if self.not_enough_funds else fee
+        def on_error(exc_info):
+            if preview_id == self.fee_preview_id:
+                traceback.print_exception(*exc_info)
 
-            # Displayed fee/fee_rate values are set according to user input.
-            # Due to rounding or dropping dust in CoinChooser,
-            # actual fees often differ somewhat.
-            if freeze_feerate or self.fee_slider.is_active():
-                displayed_feerate = self.feerate_e.get_amount()
-                if displayed_feerate is not None:
-                    displayed_feerate = quantize_feerate(displayed_feerate)
-                else:
-                    # fallback to actual fee
-                    displayed_feerate = quantize_feerate(fee / size) if fee is not None else None
-                    self.feerate_e.setAmount(displayed_feerate)
-                displayed_fee = round(displayed_feerate * size) if displayed_feerate is not None else None
-                self.fee_e.setAmount(displayed_fee)
-            else:
-                if freeze_fee:
-                    displayed_fee = self.fee_e.get_amount()
-                else:
-                    # fallback to actual fee if nothing is frozen
-                    displayed_fee = fee
-                    self.fee_e.setAmount(displayed_fee)
-                displayed_fee = displayed_fee if displayed_fee else 0
-                displayed_feerate = quantize_feerate(displayed_fee / size) if displayed_fee is not None else None
-                self.feerate_e.setAmount(displayed_feerate)
+        self.fee_preview_thread.add(task, on_success=on_success, on_error=on_error)
 
-            # show/hide fee rounding icon
-            feerounding = (fee - displayed_fee) if fee else 0
-            self.set_feerounding_text(int(feerounding))
-            self.feerounding_icon.setToolTip(self.feerounding_text)
-            self.feerounding_icon.setVisible(abs(feerounding) >= 1)
+    def show_fee_preview(self, tx, error):
+        freeze_fee = self.is_send_fee_frozen()
+        freeze_feerate = self.is_send_feerate_frozen()
+        if error:
+            if not freeze_fee:
+                self.fee_e.setAmount(None)
+            if not freeze_feerate:
+                self.feerate_e.setAmount(None)
+            self.feerounding_icon.setVisible(False)
 
-            if self.is_max:
-                amount = tx.output_value()
-                __, x_fee_amount = run_hook('get_tx_extra_fee', self.wallet, tx) or (None, 0)
-                amount_after_all_fees = amount - x_fee_amount
-                self.amount_e.setAmount(amount_after_all_fees)
+            if isinstance(error, NotEnoughFunds):
+                self.not_enough_funds = True
+            elif isinstance(error, NoDynamicFeeEstimates):
+                if tx:
+                    self.size_e.setAmount(tx.estimated_size())
+            return
+        self.not_enough_funds = False
+
+        size = tx.estimated_size()
+        self.size_e.setAmount(size)
+
+        fee = tx.get_fee()
+
+        # Displayed fee/fee_rate values are set according to user input.
+        # Due to rounding or dropping dust in CoinChooser,
+        # actual fees often differ somewhat.
+        if freeze_feerate or self.fee_slider.is_active():
+            displayed_feerate = self.feerate_e.get_amount()
+            if displayed_feerate is not None:
+                displayed_feerate = quantize_feerate(displayed_feerate)
+            else:
+                # fallback to actual fee
+                displayed_feerate = quantize_feerate(fee / size) if fee is not None else None
+                self.feerate_e.setAmount(displayed_feerate)
+            displayed_fee = round(displayed_feerate * size) if displayed_feerate is not None else None
+            self.fee_e.setAmount(displayed_fee)
+        else:
+            if freeze_fee:
+                displayed_fee = self.fee_e.get_amount()
+            else:
+                # fallback to actual fee if nothing is frozen
+                displayed_fee = fee
+                self.fee_e.setAmount(displayed_fee)
+            displayed_fee = displayed_fee if displayed_fee else 0
+            displayed_feerate = quantize_feerate(displayed_fee / size) if displayed_fee is not None else None
+            self.feerate_e.setAmount(displayed_feerate)
+
+        # show/hide fee rounding icon
+        feerounding = (fee - displayed_fee) if fee else 0
+        self.set_feerounding_text(int(feerounding))
+        self.feerounding_icon.setToolTip(self.feerounding_text)
+        self.feerounding_icon.setVisible(abs(feerounding) >= 1)
+
+        if self.is_max:
+            amount = tx.output_value()
+            __, x_fee_amount = run_hook('get_tx_extra_fee', self.wallet, tx) or (None, 0)
+            amount_after_all_fees = amount - x_fee_amount
+            self.amount_e.setAmount(amount_after_all_fees)
 
     def from_list_delete(self, item):
         i = self.from_list.indexOfTopLevelItem(item)
@@ -1796,6 +1825,9 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         self.feerounding_icon.setVisible(False)
         self.set_pay_from([])
         self.tx_external_keypairs = {}
+        # drop any fee preview still pending for the cleared form
+        self.fee_preview_id += 1
+        self.fee_update_timer.stop()
         self.update_status()
         run_hook('do_clear', self)
 
@@ -3105,6 +3137,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
 
     def clean_up(self):
         self.wallet.thread.stop()
+        self.fee_preview_thread.stop()
         if self.network:
             self.network.unregister_callback(self.on_network)
         self.config.set_key("is_maximized", self.isMaximized())
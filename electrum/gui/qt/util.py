@@ -398,7 +398,42 @@ class ElectrumItemDelegate(QStyledItemDelegate):
     def createEditor(self, parent, option, index):
         return self.parent().createEditor(parent, option, index)
 
-class MyTreeWidget(QTreeWidget):
+class ListToolbar:
+    '''Optional toolbar of MyTreeWidget and MyTreeView.'''
+
+    def create_toolbar(self, config=None):
+        hbox = QHBoxLayout()
+        buttons = self.get_toolbar_buttons()
+        for b in buttons:
+            b.setVisible(False)
+            hbox.addWidget(b)
+        hide_button = QPushButton('x')
+        hide_button.setVisible(False)
+        hide_button.pressed.connect(lambda: self.show_toolbar(False, config))
+        self.toolbar_buttons = buttons + (hide_button,)
+        hbox.addStretch()
+        hbox.addWidget(hide_button)
+        return hbox
+
+    def save_toolbar_state(self, state, config):
+        pass  # implemented in subclasses
+
+    def show_toolbar(self, state, config=None):
+        if state == self.toolbar_shown:
+            return
+        self.toolbar_shown = state
+        if config:
+            self.save_toolbar_state(state, config)
+        for b in self.toolbar_buttons:
+            b.setVisible(state)
+        if not state:
+            self.on_hide_toolbar()
+
+    def toggle_toolbar(self, config=None):
+        self.show_toolbar(not self.toolbar_shown, config)
+
+
+class MyTreeWidget(QTreeWidget, ListToolbar):
 
     def __init__(self, parent, create_menu, headers, stretch_column=None,
                  editable_columns=None):
@@ -546,36 +581,91 @@ class MyTreeWidget(QTreeWidget):
             item.setHidden(all([item.text(column).lower().find(p) == -1
                                 for column in columns]))
 
-    def create_toolbar(self, config=None):
-        hbox = QHBoxLayout()
-        buttons = self.get_toolbar_buttons()
-        for b in buttons:
-            b.setVisible(False)
-            hbox.addWidget(b)
-        hide_button = QPushButton('x')
-        hide_button.setVisible(False)
-        hide_button.pressed.connect(lambda: self.show_toolbar(False, config))
-        self.toolbar_buttons = buttons + (hide_button,)
-        hbox.addStretch()
-        hbox.addWidget(hide_button)
-        return hbox
 
-    def save_toolbar_state(self, state, config):
-        pass  # implemented in subclasses
+class MyTreeView(QTreeView, ListToolbar):
+    '''Like MyTreeWidget, for lists whose rows come from a model.
+    The model of the view must be a proxy that filters rows on
+    current_filter; the model behind it provides the headers and
+    handles edits in setData.'''
 
-    def show_toolbar(self, state, config=None):
-        if state == self.toolbar_shown:
-            return
-        self.toolbar_shown = state
-        if config:
-            self.save_toolbar_state(state, config)
-        for b in self.toolbar_buttons:
-            b.setVisible(state)
-        if not state:
-            self.on_hide_toolbar()
+    def __init__(self, parent, create_menu, stretch_column=None,
+                 editable_columns=None):
+        QTreeView.__init__(self, parent)
+        self.parent = parent
+        self.config = self.parent.config
+        self.stretch_column = stretch_column
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(create_menu)
+        self.setUniformRowHeights(True)
+        self.icon_cache = IconCache()
 
-    def toggle_toolbar(self, config=None):
-        self.show_toolbar(not self.toolbar_shown, config)
+        # Control which columns are editable
+        self.pending_update = False
+        if editable_columns is None:
+            editable_columns = {stretch_column}
+        else:
+            editable_columns = set(editable_columns)
+        self.editable_columns = editable_columns
+        # editing is started by on_doubleclick and by the context menu
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.doubleClicked.connect(self.on_doubleclick)
+        self.current_filter = ""
+
+        self.setRootIsDecorated(False)  # remove left margin
+        self.toolbar_shown = False
+
+    def update_headers(self, headers):
+        self.header().setStretchLastSection(False)
+        for col in range(len(headers)):
+            sm = QHeaderView.Stretch if col == self.stretch_column else QHeaderView.ResizeToContents
+            self.header().setSectionResizeMode(col, sm)
+
+    def is_editing(self):
+        return self.state() == QAbstractItemView.EditingState
+
+    def keyPressEvent(self, event):
+        if event.key() in [ Qt.Key_F2, Qt.Key_Return ] and not self.is_editing():
+            self.on_activated(self.currentIndex())
+        else:
+            QTreeView.keyPressEvent(self, event)
+
+    def permit_edit(self, index):
+        return (index.column() in self.editable_columns
+                and self.on_permit_edit(index))
+
+    def on_permit_edit(self, index):
+        return True
+
+    def on_doubleclick(self, index):
+        if self.permit_edit(index):
+            self.edit(index)
+
+    def on_activated(self, index):
+        # on 'enter' we show the menu
+        pt = self.visualRect(index).bottomLeft()
+        pt.setX(50)
+        self.customContextMenuRequested.emit(pt)
+
+    def closeEditor(self, editor, hint):
+        QTreeView.closeEditor(self, editor, hint)
+        # Now do any pending updates
+        if self.pending_update:
+            self.pending_update = False
+            self.on_update()
+
+    def update(self):
+        # Defer updates if editing
+        if self.is_editing():
+            self.pending_update = True
+        else:
+            self.on_update()
+
+    def on_update(self):
+        pass
+
+    def filter(self, p):
+        self.current_filter = p.lower()
+        self.model().invalidateFilter()
 
 
 class ButtonsWidget(QWidget):
@@ -26,6 +26,7 @@ import os
 import re
 import ssl
 import sys
+import time
 import traceback
 import asyncio
 from typing import Tuple, Union, List, TYPE_CHECKING, Optional
@@ -54,7 +55,16 @@ class NotificationSession(RPCSession):
         super(NotificationSession, self).__init__(*args, **kwargs)
         self.subscriptions = defaultdict(list)
         self.cache = {}
-        self.in_flight_requests_semaphore = asyncio.Semaphore(100)
+        self.max_in_flight_requests = 100
+        self.in_flight_requests_semaphore = asyncio.Semaphore(self.max_in_flight_requests)
+        # serializes batches taking several slots of the semaphore at once,
+        # so that two partly acquired batches cannot wait on each other
+        self.batch_slots_lock = asyncio.Lock()
+        # batching statistics: each batch saves len(batch) - 1 round trips
+        self.num_batches = 0
+        self.num_batched_requests = 0
+        # moving average of the response time of requests, in seconds
+        self.latency = None  # type: Optional[float]
 
     async def handle_request(self, request):
         # note: if server sends malformed request and we raise, the superclass
@@ -75,12 +85,64 @@ class NotificationSession(RPCSession):
             timeout = 30
         # note: the semaphore implementation guarantees no starvation
         async with self.in_flight_requests_semaphore:
+            start = time.monotonic()
             try:
-                return await asyncio.wait_for(
+                result = await asyncio.wait_for(
                     super().send_request(*args, **kwargs),
                     timeout)
             except asyncio.TimeoutError as e:
+                self._update_latency(timeout)
                 raise RequestTimedOut('request timed out: {}'.format(args)) from e
+            self._update_latency(time.monotonic() - start)
+            return result
+
+    def _update_latency(self, elapsed: float):
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * elapsed
+
+    async def send_requests_batch(self, requests: List[Tuple[str, List]], *, timeout=None) -> List:
+        """Sends [(method, params), ...] as JSON-RPC batches.
+        Returns the results in the same order. Requests that failed
+        have an exception instead of a result.
+        Each request counts against the in-flight limit, and batches
+        larger than the limit are split.
+        """
+        assert requests
+        if timeout is None:
+            timeout = 30
+        results = []
+        for i in range(0, len(requests), self.max_in_flight_requests):
+            chunk = requests[i:i+self.max_in_flight_requests]
+            results.extend(await self._send_requests_batch_chunk(chunk, timeout))
+        return results
+
+    async def _send_requests_batch_chunk(self, requests: List[Tuple[str, List]], timeout) -> List:
+        async def send_batch():
+            async with self.send_batch() as batch:
+                for method, params in requests:
+                    batch.add_request(method, params)
+            return batch.results
+        num_acquired = 0
+        try:
+            async with self.batch_slots_lock:
+                for _ in requests:
+                    await self.in_flight_requests_semaphore.acquire()
+                    num_acquired += 1
+            try:
+                results = await asyncio.wait_for(send_batch(), timeout)
+            except asyncio.TimeoutError as e:
+                raise RequestTimedOut('batch request timed out: {} requests'.format(len(requests))) from e
+        finally:
+            for _ in range(num_acquired):
+                self.in_flight_requests_semaphore.release()
+        self.num_batches += 1
+        self.num_batched_requests += len(requests)
+        return list(results)
+
+    def get_round_trips_saved(self) -> int:
+        return self.num_batched_requests - self.num_batches
 
     async def subscribe(self, method: str, params: List, queue: asyncio.Queue):
         # note: until the cache is written for the first time,
@@ -94,6 +156,24 @@ class NotificationSession(RPCSession):
             self.cache[key] = result
         await queue.put(params + [result])
 
+    async def subscribe_batch(self, method: str, params_list: List[List], queue: asyncio.Queue):
+        """Like subscribe, for several params at once. Subscriptions
+        that are not cached are requested in a single batch."""
+        keys = [self.get_hashable_key_for_rpc_call(method, params) for params in params_list]
+        to_request = []
+        for params, key in zip(params_list, keys):
+            self.subscriptions[key].append(queue)
+            if key not in self.cache:
+                to_request.append((params, key))
+        if to_request:
+            results = await self.send_requests_batch([(method, params) for params, key in to_request])
+            for (params, key), result in zip(to_request, results):
+                if isinstance(result, Exception):
+                    raise result
+                self.cache[key] = result
+        for params, key in zip(params_list, keys):
+            await queue.put(params + [self.cache[key]])
+
     def unsubscribe(self, queue):
         """Unsubscribe a callback to free object references to enable GC."""
         # note: we can't unsubscribe from the server, so we keep receiving
@@ -334,10 +414,7 @@ class Interface(PrintError):
         if can_return_early and index in self._requested_chunks:
             return
         self.print_error("requesting chunk from height {}".format(height))
-        size = 2016
-        if tip is not None:
-            size = min(size, tip - index * 2016 + 1)
-            size = max(size, 0)
+        size = _chunk_size(index, tip)
         try:
             self._requested_chunks.add(index)
             res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
@@ -349,6 +426,73 @@ class Interface(PrintError):
             return conn, 0
         return conn, res['count']
 
+    def _get_interfaces_for_chunks(self, tip) -> List['Interface']:
+        """Interfaces that can serve chunks up to tip, us first."""
+        others = [iface for iface in self.network.get_ready_interfaces()
+                  if iface is not self and iface.tip >= tip]
+        return [self] + others
+
+    async def request_chunks(self, height, tip) -> Tuple[int, bool]:
+        """Fetches the chunks from height up to tip, keeping up to
+        'header_chunk_pipeline_depth' requests in flight, spread over
+        the interfaces that have the headers. Chunks are connected
+        strictly in order as they arrive; a new request is only sent
+        when a chunk got connected.
+        Returns the height after the last connected header,
+        and whether we stopped because a chunk could not connect.
+        """
+        depth = max(1, self.network.config.get('header_chunk_pipeline_depth', 4))
+        interfaces = self._get_interfaces_for_chunks(tip)
+        next_index = height // 2016
+        last_index = tip // 2016
+        in_flight = []  # type: List[Tuple[int, Interface, asyncio.Future]]
+
+        def fill_pipeline():
+            nonlocal next_index
+            while len(in_flight) < depth and next_index <= last_index:
+                iface = interfaces[next_index % len(interfaces)]
+                fut = asyncio.ensure_future(iface._fetch_chunk(next_index, tip))
+                in_flight.append((next_index, iface, fut))
+                next_index += 1
+
+        try:
+            fill_pipeline()
+            while in_flight:
+                index, iface, fut = in_flight.pop(0)
+                try:
+                    res = await fut
+                except (aiorpcx.jsonrpc.RPCError, GracefulDisconnect, OSError, asyncio.CancelledError) as e:
+                    # pending requests get cancelled when the other server disconnects
+                    lost_other = iface is not self and (not isinstance(e, asyncio.CancelledError)
+                                                        or iface.session.is_closing())
+                    if not lost_other:
+                        raise
+                    # try again from our own server
+                    self.print_error(f"failed to get chunk {index} from {iface.server}: {repr(e)}")
+                    res = await self._fetch_chunk(index, tip)
+                    iface = self
+                conn = self.blockchain.connect_chunk(index, res['hex'])
+                if not conn and iface is not self:
+                    # other server may be on another fork; ask ours
+                    res = await self._fetch_chunk(index, tip)
+                    conn = self.blockchain.connect_chunk(index, res['hex'])
+                if not conn:
+                    return index * 2016, False
+                height = index * 2016 + res['count']
+                if res['count'] < _chunk_size(index, tip):
+                    # server does not have all the headers we asked for
+                    break
+                fill_pipeline()
+        finally:
+            for _, _, fut in in_flight:
+                fut.cancel()
+        return height, True
+
+    async def _fetch_chunk(self, index, tip):
+        size = _chunk_size(index, tip)
+        self.print_error("requesting chunk {} ({} headers)".format(index, size))
+        return await self.session.send_request('blockchain.block.headers', [index * 2016, size])
+
     async def open_session(self, sslc, exit_early=False):
         async with aiorpcx.Connector(NotificationSession,
                                      host=self.host, port=self.port,
@@ -420,14 +564,13 @@ class Interface(PrintError):
         while last is None or height <= next_height:
             prev_last, prev_height = last, height
             if next_height > height + 10:
-                could_connect, num_headers = await self.request_chunk(height, next_height)
+                height, could_connect = await self.request_chunks(height, next_height)
                 if not could_connect:
                     if height <= constants.net.max_checkpoint():
                         raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
                     last, height = await self.step(height)
                     continue
                 self.network.trigger_callback('network_updated')
-                height = (height // 2016 * 2016) + num_headers
                 assert height <= next_height+1, (height, self.tip)
                 last = 'catchup'
             else:
@@ -548,6 +691,14 @@ class Interface(PrintError):
         return height, header, bad, bad_header
 
 
+def _chunk_size(index: int, tip: Optional[int]) -> int:
+    size = 2016
+    if tip is not None:
+        size = min(size, tip - index * 2016 + 1)
+        size = max(size, 0)
+    return size
+
+
 def _assert_header_does_not_check_against_any_chain(header: dict) -> None:
     chain_bad = blockchain.check_header(header) if 'mock' not in header else header['mock']['check'](header)
     if chain_bad:
@@ -26,11 +26,15 @@
 
 from unicodedata import normalize
 import hashlib
+import multiprocessing
+import os
+import sys
+from typing import List
 
 from . import bitcoin, ecc, constants, bip32
 from .bitcoin import (deserialize_privkey, serialize_privkey,
                       public_key_to_p2pkh, seed_type, is_seed)
-from .bip32 import (bip32_public_derivation, deserialize_xpub, CKD_pub,
+from .bip32 import (bip32_public_derivation, deserialize_xpub, CKD_pub, CKD_pub_range,
                     bip32_root, deserialize_xprv, bip32_private_derivation,
                     bip32_private_key, bip32_derivation, BIP32_PRIME,
                     is_xpub, is_xprv)
@@ -40,6 +44,35 @@ from .util import (PrintError, InvalidPassword, hfu, WalletFileException,
                    BitcoinException, bh2u, bfh, print_error, inv_dict)
 from .mnemonic import Mnemonic, load_wordlist
 from .plugin import run_hook
+from . import ecc_fast
+
+
+# ranges of at least this many keys are derived in a pool of worker processes
+PARALLEL_DERIVATION_MIN_KEYS = 5000
+PARALLEL_DERIVATION_MIN_KEYS_FAST_ECC = 200000
+
+
+def _can_use_process_pool():
+    # frozen binaries and android cannot start worker processes this way
+    return not getattr(sys, 'frozen', False) and 'ANDROID_DATA' not in os.environ \
+        and (os.cpu_count() or 1) > 1
+
+
+def derive_pubkeys_range(cK: bytes, c: bytes, start: int, stop: int) -> List[bytes]:
+    min_keys = PARALLEL_DERIVATION_MIN_KEYS_FAST_ECC if ecc_fast.is_using_fast_ecc() \
+        else PARALLEL_DERIVATION_MIN_KEYS
+    if stop - start < min_keys or not _can_use_process_pool():
+        return CKD_pub_range(cK, c, start, stop)
+    num_processes = os.cpu_count()
+    step = -(-(stop - start) // num_processes)
+    chunks = [(cK, c, i, min(i + step, stop)) for i in range(start, stop, step)]
+    try:
+        with multiprocessing.get_context('spawn').Pool(num_processes) as pool:
+            results = pool.starmap(CKD_pub_range, chunks)
+    except Exception as e:
+        print_error('[keystore] parallel key derivation failed', repr(e))
+        return CKD_pub_range(cK, c, start, stop)
+    return [cK_n for result in results for cK_n in result]
 
 
 class KeyStore(PrintError):
@@ -238,19 +271,33 @@ class Xpub:
         self.xpub = None
         self.xpub_receive = None
         self.xpub_change = None
+        self._branch_keys = {}  # for_change -> (cK, c)
 
     def get_master_public_key(self):
         return self.xpub
 
+    def get_branch_key(self, for_change):
+        branch_key = self._branch_keys.get(for_change)
+        if branch_key is None:
+            xpub = self.xpub_change if for_change else self.xpub_receive
+            if xpub is None:
+                xpub = bip32_public_derivation(self.xpub, "", "/%d"%for_change)
+                if for_change:
+                    self.xpub_change = xpub
+                else:
+                    self.xpub_receive = xpub
+            _, _, _, _, c, cK = deserialize_xpub(xpub)
+            branch_key = self._branch_keys[for_change] = (cK, c)
+        return branch_key
+
     def derive_pubkey(self, for_change, n):
-        xpub = self.xpub_change if for_change else self.xpub_receive
-        if xpub is None:
-            xpub = bip32_public_derivation(self.xpub, "", "/%d"%for_change)
-            if for_change:
-                self.xpub_change = xpub
-            else:
-                self.xpub_receive = xpub
-        return self.get_pubkey_from_xpub(xpub, (n,))
+        cK, c = self.get_branch_key(for_change)
+        cK, c = CKD_pub(cK, c, n)
+        return bh2u(cK)
+
+    def derive_pubkeys_range(self, for_change, start, stop):
+        cK, c = self.get_branch_key(for_change)
+        return [bh2u(cK_n) for cK_n in derive_pubkeys_range(cK, c, start, stop)]
 
     @classmethod
     def get_pubkey_from_xpub(self, xpub, sequence):
@@ -425,6 +472,9 @@ class Old_KeyStore(Deterministic_KeyStore):
     def derive_pubkey(self, for_change, n):
         return self.get_pubkey_from_mpk(self.mpk, for_change, n)
 
+    def derive_pubkeys_range(self, for_change, start, stop):
+        return [self.derive_pubkey(for_change, n) for n in range(start, stop)]
+
     def get_private_key_from_stretched_exponent(self, for_change, n, secexp):
         secexp = (secexp + self.get_sequence(self.mpk, for_change, n)) % ecc.CURVE_ORDER
         pk = number_to_string(secexp, ecc.CURVE_ORDER)
@@ -46,11 +46,22 @@ from . import constants
 from . import blockchain
 from .blockchain import Blockchain, HEADER_SIZE
 from .interface import Interface, serialize_server, deserialize_server, RequestTimedOut
+from .transaction import Transaction
+from .tx_cache import TxCache
+from .verifier import verify_tx_is_in_block, MerkleVerificationFailure
 from .version import PROTOCOL_VERSION
 from .simple_config import SimpleConfig
 
 NODES_RETRY_INTERVAL = 60
 SERVER_RETRY_INTERVAL = 10
+# _maintain_sessions runs when woken up, and at least this often (seconds)
+MAINTAIN_SESSIONS_INTERVAL = 1
+
+# verifiable requests are hedged to a second server if the first one
+# has not answered after this many times its usual response time
+REQUEST_HEDGE_LATENCY_FACTOR = 3
+REQUEST_HEDGE_MIN_DELAY = 0.5
+REQUEST_DEFAULT_LATENCY = 1.0
 
 
 def parse_servers(result: Sequence[Tuple[str, str, List[str]]]) -> Dict[str, dict]:
@@ -122,6 +133,23 @@ class NetworkParameters(NamedTuple):
 proxy_modes = ['socks4', 'socks5']
 
 
+def _is_raw_tx_with_txid(raw, tx_hash: str) -> bool:
+    try:
+        return Transaction(raw).txid() == tx_hash
+    except Exception:
+        return False
+
+
+def _is_valid_merkle(merkle, tx_hash: str, tx_height: int, header: dict) -> bool:
+    if not isinstance(merkle, dict) or merkle.get('block_height') != tx_height:
+        return False
+    try:
+        verify_tx_is_in_block(tx_hash, merkle.get('merkle'), merkle.get('pos'), header, tx_height)
+    except MerkleVerificationFailure:
+        return False
+    return True
+
+
 def serialize_proxy(p):
     if not isinstance(p, dict):
         return None
@@ -213,6 +241,8 @@ class Network(PrintError):
 
         dir_path = os.path.join(self.config.path, 'certs')
         util.make_dir(dir_path)
+        # raw transactions fetched by any wallet
+        self.tx_cache = TxCache(self.config)
 
         # retry times
         self.server_retry_time = time.time()
@@ -224,6 +254,7 @@ class Network(PrintError):
         self.auto_connect = self.config.get('auto_connect', True)
         self.connecting = set()
         self.server_queue = None
+        self._maintain_sessions_event = None  # type: Optional[asyncio.Event]
         self.proxy = None
 
         self._set_status('disconnected')
@@ -400,6 +431,13 @@ class Network(PrintError):
         with self.interfaces_lock:
             return list(self.interfaces)
 
+    def get_ready_interfaces(self) -> List[Interface]:
+        """The connected interfaces that finished their handshake."""
+        with self.interfaces_lock: interfaces = list(self.interfaces.values())
+        return [iface for iface in interfaces
+                if iface.ready.done() and not iface.ready.cancelled()
+                and iface.session and not iface.session.is_closing()]
+
     @with_recent_servers_lock
     def get_servers(self):
         # start with hardcoded servers
@@ -428,6 +466,7 @@ class Network(PrintError):
                 self._set_status('connecting')
             self.connecting.add(server)
             self.server_queue.put(server)
+            self._trigger_maintain_sessions()
 
     def _start_random_interface(self):
         with self.interfaces_lock:
@@ -640,6 +679,7 @@ class Network(PrintError):
         if interface:
             await self._close_interface(interface)
             self.trigger_callback('network_updated')
+        self._trigger_maintain_sessions()
 
     @ignore_exceptions  # do not kill main_taskgroup
     @log_exceptions
@@ -660,6 +700,7 @@ class Network(PrintError):
         finally:
             try: self.connecting.remove(server)
             except KeyError: pass
+            self._trigger_maintain_sessions()
 
         if server == self.default_server:
             await self.switch_to_interface(server)
@@ -711,30 +752,174 @@ class Network(PrintError):
             raise Exception('no interface to do request on... gave up.')
         return make_reliable_wrapper
 
+    def _pick_interfaces_for_request(self, n: int) -> List[Interface]:
+        """Picks up to n distinct ready interfaces at random, favouring
+        the ones that answer faster."""
+        interfaces = self.get_ready_interfaces()
+        weights = [1 / (iface.session.latency or REQUEST_DEFAULT_LATENCY) for iface in interfaces]
+        picked = []
+        while interfaces and len(picked) < n:
+            i = random.choices(range(len(interfaces)), weights)[0]
+            picked.append(interfaces.pop(i))
+            weights.pop(i)
+        return picked
+
+    @staticmethod
+    async def _wait_for_first_result(tasks: List[asyncio.Future], timeout: Optional[float]):
+        """Waits until one of tasks succeeds, and returns (True, result).
+        Returns (False, None) if all of them failed, or on timeout.
+        Failed tasks are removed from the list."""
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while tasks:
+            remaining = None if deadline is None else max(0, deadline - loop.time())
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                tasks.remove(task)
+                if not task.cancelled() and task.exception() is None:
+                    return True, task.result()
+        return False, None
+
+    async def _send_verifiable_request(self, send, verify, fallback):
+        """Sends a read-only request whose result can be checked locally
+        to any of the ready interfaces, picked by latency. If it is slow
+        to answer, the request is also sent to a second interface, and
+        the first valid result wins. If no result can be obtained that
+        way, fallback() is used to ask the main interface.
+
+        Requests that reveal our addresses must not go through here;
+        they stay pinned to the main interface.
+        """
+        if not self.config.get('request_fanout', True):
+            return await fallback()
+        async def attempt(iface: Interface):
+            result = await send(iface.session)
+            if not verify(result):
+                raise Exception('invalid result from {}'.format(iface.server))
+            return result
+        candidates = self._pick_interfaces_for_request(2)
+        tasks = []
+        try:
+            for i, iface in enumerate(candidates):
+                tasks.append(asyncio.ensure_future(attempt(iface)))
+                if i + 1 < len(candidates):
+                    latency = iface.session.latency or REQUEST_DEFAULT_LATENCY
+                    hedge_delay = max(REQUEST_HEDGE_MIN_DELAY, REQUEST_HEDGE_LATENCY_FACTOR * latency)
+                else:
+                    hedge_delay = None
+                success, result = await self._wait_for_first_result(tasks, hedge_delay)
+                if success:
+                    return result
+        finally:
+            for task in tasks:
+                task.cancel()
+        return await fallback()
+
     @best_effort_reliable
+    async def _send_request_to_main_interface(self, method: str, params: List, *, timeout=None):
+        return await self.interface.session.send_request(method, params, timeout=timeout)
+
     async def get_merkle_for_transaction(self, tx_hash: str, tx_height: int) -> dict:
-        return await self.interface.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
+        method, params = 'blockchain.transaction.get_merkle', [tx_hash, tx_height]
+        header = self.blockchain().read_header(tx_height)
+        if header is None:
+            # cannot be verified yet
+            return await self._send_request_to_main_interface(method, params)
+        verify = lambda merkle: _is_valid_merkle(merkle, tx_hash, tx_height, header)
+        return await self._send_verifiable_request(
+            lambda session: session.send_request(method, params),
+            verify,
+            lambda: self._send_request_to_main_interface(method, params))
 
     @best_effort_reliable
     async def broadcast_transaction(self, tx, *, timeout=10):
         out = await self.interface.session.send_request('blockchain.transaction.broadcast', [str(tx)], timeout=timeout)
         if out != tx.txid():
             raise Exception(out)
+        self.tx_cache.put(out, str(tx))
         return out  # txid
 
     @best_effort_reliable
     async def request_chunk(self, height, tip=None, *, can_return_early=False):
         return await self.interface.request_chunk(height, tip=tip, can_return_early=can_return_early)
 
-    @best_effort_reliable
+    def _add_to_tx_cache(self, tx_hash: str, raw: str):
+        # results from the main interface have not been checked yet
+        if _is_raw_tx_with_txid(raw, tx_hash):
+            self.tx_cache.put(tx_hash, raw)
+
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
-        return await self.interface.session.send_request('blockchain.transaction.get', [tx_hash],
-                                                         timeout=timeout)
+        raw = self.tx_cache.get(tx_hash)
+        if raw is not None:
+            return raw
+        method, params = 'blockchain.transaction.get', [tx_hash]
+        raw = await self._send_verifiable_request(
+            lambda session: session.send_request(method, params, timeout=timeout),
+            lambda raw: _is_raw_tx_with_txid(raw, tx_hash),
+            lambda: self._send_request_to_main_interface(method, params, timeout=timeout))
+        self._add_to_tx_cache(tx_hash, raw)
+        return raw
 
     @best_effort_reliable
     async def get_history_for_scripthash(self, sh: str) -> List[dict]:
         return await self.interface.session.send_request('blockchain.scripthash.get_history', [sh])
 
+    @best_effort_reliable
+    async def _send_requests_batch_to_main_interface(self, method: str, params_list: List[List], *,
+                                                     timeout=None, raise_errors=True) -> List:
+        return await self._send_requests_batch(method, params_list, timeout=timeout, raise_errors=raise_errors)
+
+    async def _send_requests_batch(self, method: str, params_list: List[List], *,
+                                   timeout=None, raise_errors=True) -> List:
+        results = await self.interface.session.send_requests_batch(
+            [(method, params) for params in params_list], timeout=timeout)
+        if raise_errors:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    async def get_merkles_for_transactions(self, txs: Sequence[Tuple[str, int]]) -> List:
+        """Batched get_merkle_for_transaction, for [(tx_hash, tx_height), ...].
+        Requests that failed have an exception instead of a result."""
+        method, params_list = 'blockchain.transaction.get_merkle', [[tx_hash, tx_height] for tx_hash, tx_height in txs]
+        fallback = lambda: self._send_requests_batch_to_main_interface(method, params_list, raise_errors=False)
+        chain = self.blockchain()
+        headers = {tx_height: chain.read_header(tx_height) for tx_height in set(h for _, h in txs)}
+        if None in headers.values():
+            # cannot be verified yet
+            return await fallback()
+        def verify(merkles):
+            return all(_is_valid_merkle(merkle, tx_hash, tx_height, headers[tx_height])
+                       for merkle, (tx_hash, tx_height) in zip(merkles, txs))
+        return await self._send_verifiable_request(
+            lambda session: session.send_requests_batch([(method, params) for params in params_list]),
+            verify,
+            fallback)
+
+    async def get_transactions(self, tx_hashes: List[str], *, timeout=None) -> List[str]:
+        results = {tx_hash: self.tx_cache.get(tx_hash) for tx_hash in tx_hashes}
+        missing = [tx_hash for tx_hash, raw in results.items() if raw is None]
+        if missing:
+            method, params_list = 'blockchain.transaction.get', [[tx_hash] for tx_hash in missing]
+            def verify(raws):
+                return all(_is_raw_tx_with_txid(raw, tx_hash) for raw, tx_hash in zip(raws, missing))
+            raws = await self._send_verifiable_request(
+                lambda session: session.send_requests_batch([(method, params) for params in params_list],
+                                                            timeout=timeout),
+                verify,
+                lambda: self._send_requests_batch_to_main_interface(method, params_list, timeout=timeout))
+            for tx_hash, raw in zip(missing, raws):
+                self._add_to_tx_cache(tx_hash, raw)
+                results[tx_hash] = raw
+        return [results[tx_hash] for tx_hash in tx_hashes]
+
+    @best_effort_reliable
+    async def get_history_for_scripthashes(self, shs: List[str]) -> List[List[dict]]:
+        return await self._send_requests_batch('blockchain.scripthash.get_history', [[sh] for sh in shs])
+
     @best_effort_reliable
     async def listunspent_for_scripthash(self, sh: str) -> List[dict]:
         return await self.interface.session.send_request('blockchain.scripthash.listunspent', [sh])
@@ -816,6 +1001,7 @@ class Network(PrintError):
         self.disconnected_servers = set([])
         self.protocol = deserialize_server(self.default_server)[2]
         self.server_queue = queue.Queue()
+        self._maintain_sessions_event = asyncio.Event()
         self._set_proxy(deserialize_proxy(self.config.get('proxy')))
         self._set_oneserver(self.config.get('oneserver', False))
         self._start_interface(self.default_server)
@@ -845,10 +1031,12 @@ class Network(PrintError):
         except (asyncio.TimeoutError, asyncio.CancelledError) as e:
             self.print_error(f"exc during main_taskgroup cancellation: {repr(e)}")
         self.main_taskgroup = None
+        blockchain.sync_blockchains_to_disk()
         self.interface = None  # type: Interface
         self.interfaces = {}  # type: Dict[str, Interface]
         self.connecting.clear()
         self.server_queue = None
+        self._maintain_sessions_event = None
         if not full_shutdown:
             self.trigger_callback('network_updated')
 
@@ -875,8 +1063,15 @@ class Network(PrintError):
             else:
                 await self.switch_to_interface(self.default_server)
 
+    def _trigger_maintain_sessions(self):
+        """Wakes up _maintain_sessions. Can be called from any thread."""
+        event = self._maintain_sessions_event
+        if event is not None:
+            self.asyncio_loop.call_soon_threadsafe(event.set)
+
     async def _maintain_sessions(self):
         while True:
+            self._maintain_sessions_event.clear()
             # launch already queued up new interfaces
             while self.server_queue.qsize() > 0:
                 server = self.server_queue.get()
@@ -896,5 +1091,13 @@ class Network(PrintError):
             if self.is_connected():
                 if self.config.is_fee_estimates_update_required():
                     await self.interface.group.spawn(self._request_fee_estimates, self.interface)
+            # group commit of headers saved one by one
+            blockchain.sync_blockchains_to_disk(max_age=blockchain.HEADERS_FSYNC_INTERVAL)
 
+            # wait for a server to be queued or to go down; the retry
+            # intervals and fee estimates only need a coarse timer
+            try:
+                await asyncio.wait_for(self._maintain_sessions_event.wait(), MAINTAIN_SESSIONS_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
             await asyncio.sleep(0.1)
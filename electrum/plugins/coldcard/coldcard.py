@@ -443,10 +443,10 @@ class Coldcard_KeyStore(Hardware_KeyStore):
         # global section: just the unsigned txn
         class CustomTXSerialization(Transaction):
             @classmethod
-            def input_script(cls, txin, estimate_size=False):
-                return ''
+            def input_script_bytes(cls, txin, estimate_size=False):
+                return b''
 
-        unsigned = bfh(CustomTXSerialization(tx.serialize()).serialize_to_network(witness=False))
+        unsigned = CustomTXSerialization(tx.serialize()).serialize_to_network_bytes(witness=False)
         write_kv(PSBT_GLOBAL_UNSIGNED_TX, unsigned)
 
         # end globals section
@@ -526,7 +526,7 @@ class DigitalBitbox_KeyStore(Hardware_KeyStore):
                     if x_pubkey in derivations:
                         index = derivations.get(x_pubkey)
                         inputPath = "%s/%d/%d" % (self.get_derivation(), index[0], index[1])
-                        inputHash = sha256d(binascii.unhexlify(tx.serialize_preimage(i)))
+                        inputHash = sha256d(tx.serialize_preimage_bytes(i))
                         hasharray_i = {'hash': to_hexstr(inputHash), 'keypath': inputPath}
                         hasharray.append(hasharray_i)
                         inputhasharray.append(inputHash)
@@ -551,13 +551,13 @@ class DigitalBitbox_KeyStore(Hardware_KeyStore):
             if p2pkhTransaction:
                 class CustomTXSerialization(Transaction):
                     @classmethod
-                    def input_script(self, txin, estimate_size=False):
+                    def input_script_bytes(self, txin, estimate_size=False):
                         if txin['type'] == 'p2pkh':
-                            return Transaction.get_preimage_script(txin)
+                            return binascii.unhexlify(Transaction.get_preimage_script(txin))
                         if txin['type'] == 'p2sh':
                             # Multisig verification has partial support, but is disabled. This is the
                             # expected serialization though, so we leave it here until we activate it.
-                            return '00' + push_script(Transaction.get_preimage_script(txin))
+                            return binascii.unhexlify('00' + push_script(Transaction.get_preimage_script(txin)))
                         raise Exception("unsupported type %s" % txin['type'])
                 tx_dbb_serialized = CustomTXSerialization(tx.serialize()).serialize_to_network()
             else:
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Compares the coin choosers on synthetic wallets: a few hundred
+# p2wpkh coins of random values, spent by payments of random amounts.
+# Reports the time taken, how often no change was created, and the fees:
+# paid now, and the fees for spending the change later at the same rate.
+
+import sys
+import time
+import random
+
+from electrum import coinchooser
+from electrum.bitcoin import COIN, pubkey_to_address
+from electrum.ecc import ECPrivkey
+from electrum.transaction import Transaction
+from electrum.util import NotEnoughFunds
+
+
+try:
+    num_coins = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    num_payments = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    fee_per_kb = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+except Exception:
+    print("usage: bench_coinchooser [num_coins] [num_payments] [fee_per_kb]")
+    sys.exit(1)
+
+DUST_THRESHOLD = 546
+
+
+def make_coin(rnd, value, height):
+    privkey = ECPrivkey.from_secret_scalar(rnd.randrange(1, 2**128))
+    pubkey = privkey.get_public_key_hex(compressed=True)
+    return {
+        'prevout_hash': '%064x' % rnd.getrandbits(256),
+        'prevout_n': rnd.randrange(4),
+        'value': value,
+        'height': height,
+        'address': pubkey_to_address('p2wpkh', pubkey),
+        'type': 'p2wpkh',
+        'x_pubkeys': [pubkey],
+        'pubkeys': [pubkey],
+        'num_sig': 1,
+        'signatures': [None],
+    }
+
+
+def make_wallet(seed):
+    rnd = random.Random(seed)
+    coins = []
+    for i in range(num_coins):
+        # mostly small coins, a few large ones
+        value = max(DUST_THRESHOLD, int(rnd.lognormvariate(13, 2)))
+        coins.append(make_coin(rnd, value, rnd.randrange(1, 500000)))
+    payments = []
+    total = sum(coin['value'] for coin in coins)
+    for i in range(num_payments):
+        address = make_coin(rnd, 0, 0)['address']
+        payments.append((address, min(int(rnd.lognormvariate(14, 1.5)), total // 4)))
+    return coins, payments
+
+
+def fee_estimator(size):
+    return fee_per_kb * size // 1000
+
+
+def bench(name, coins, payments):
+    chooser = coinchooser.COIN_CHOOSERS[name]()
+    change_addr = make_coin(random.Random(0), 0, 0)['address']
+    spend_fee = fee_estimator(Transaction.virtual_size_from_weight(
+        Transaction.estimated_input_weight(coins[0], True)))
+    n = changeless = fees = future_fees = 0
+    dt = 0
+    for address, amount in payments:
+        outputs = [coinchooser.TxOutput(coinchooser.TYPE_ADDRESS, address, amount)]
+        t0 = time.perf_counter()
+        try:
+            tx = chooser.make_tx(coins, [], outputs, [change_addr],
+                                 fee_estimator, DUST_THRESHOLD)
+        except NotEnoughFunds:
+            continue
+        dt += time.perf_counter() - t0
+        n += 1
+        num_change = len(tx.outputs()) - 1
+        changeless += num_change == 0
+        fees += tx.get_fee()
+        future_fees += num_change * spend_fee
+    print("%-16s %8.1f ms/tx  changeless %3d/%d  fees %9d  + change spend %9d = %9d sat" % (
+        name, dt * 1000 / max(n, 1), changeless, n, fees, future_fees, fees + future_fees))
+
+
+coinchooser.CoinChooserBase.print_error = lambda *args: None
+coins, payments = make_wallet(1)
+print("%d coins, %.4f BTC, %d payments, %d sat/kB" % (
+    len(coins), sum(coin['value'] for coin in coins) / COIN, len(payments), fee_per_kb))
+for name in sorted(coinchooser.COIN_CHOOSERS):
+    bench(name, coins, payments)
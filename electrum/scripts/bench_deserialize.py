@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Measures transaction parsing over a corpus of real transactions:
+# the raw transactions stored in a wallet file (unencrypted), or a text
+# file with one raw transaction (hex) per line.
+
+import sys
+import time
+
+from electrum.storage import WalletStorage
+from electrum.transaction import Transaction, deserialize
+
+
+try:
+    path = sys.argv[1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+except Exception:
+    print("usage: bench_deserialize <wallet_file | file_with_raw_txs> [repeat]")
+    sys.exit(1)
+
+
+def load_corpus(path):
+    try:
+        storage = WalletStorage(path, manual_upgrades=True)
+        if not storage.is_encrypted():
+            txs = storage.get('transactions', {})
+            if txs:
+                return list(txs.values())
+    except Exception:
+        pass
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def bench(name, func, raws):
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        for raw in raws:
+            func(raw)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    print("%-28s %8.1f ms  %6.1f us/tx" % (name, best * 1000, best * 1e6 / len(raws)))
+
+
+raws = load_corpus(path)
+print("%d transactions, %d bytes" % (len(raws), sum(len(raw) // 2 for raw in raws)))
+bench('deserialize (dicts)', lambda raw: deserialize(raw), raws)
+bench('Transaction.outputs', lambda raw: Transaction(raw).outputs(), raws)
+bench('Transaction.inputs', lambda raw: Transaction(raw).inputs(), raws)
+bench('Transaction.deserialize', lambda raw: Transaction(raw).deserialize(), raws)
+bench('Transaction.txid', lambda raw: Transaction(raw).txid(), raws)
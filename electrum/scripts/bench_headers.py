@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Measures header-sync throughput: verification and connection of
+# synthetic 2016-header chunks. Runs on regtest parameters, as valid
+# mainnet proof-of-work cannot be produced for synthetic headers.
+
+import sys
+import time
+import shutil
+import tempfile
+
+from electrum import constants, blockchain
+from electrum.blockchain import Blockchain, HEADER_SIZE, MissingHeader, deserialize_header, hash_header
+from electrum.crypto import sha256d
+from electrum.simple_config import SimpleConfig
+from electrum.util import bfh
+
+
+try:
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+except Exception:
+    print("usage: bench_headers [num_chunks]")
+    sys.exit(1)
+
+
+REGTEST_GENESIS_HEADER = bfh("0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4adae5494dffff7f2002000000")
+
+
+def make_chunks(n):
+    chunks = []
+    prev_hash = sha256d(REGTEST_GENESIS_HEADER)
+    for index in range(n):
+        chunk = bytearray(REGTEST_GENESIS_HEADER if index == 0 else b'')
+        for i in range(1 if index == 0 else 0, 2016):
+            height = index * 2016 + i
+            header = (1).to_bytes(4, 'little') + prev_hash + bytes(32) \
+                + (1296688602 + 600 * height).to_bytes(4, 'little') \
+                + (0x1d00ffff).to_bytes(4, 'little') + height.to_bytes(4, 'little')
+            chunk += header
+            prev_hash = sha256d(header)
+        chunks.append(bytes(chunk))
+    return chunks
+
+
+def verify_chunk_per_header(chain, index, data):
+    # the verification loop as done before verify_chunk worked on raw bytes
+    start_height = index * 2016
+    prev_hash = chain.get_hash(start_height - 1)
+    target = chain.get_target(index - 1)
+    for i in range(len(data) // HEADER_SIZE):
+        try:
+            expected_header_hash = chain.get_hash(start_height + i)
+        except MissingHeader:
+            expected_header_hash = None
+        header = deserialize_header(data[i*HEADER_SIZE:(i+1)*HEADER_SIZE], start_height + i)
+        chain.verify_header(header, prev_hash, target, expected_header_hash)
+        prev_hash = hash_header(header)
+
+
+constants.set_regtest()
+chunks = make_chunks(num_chunks)
+tmpdir = tempfile.mkdtemp()
+try:
+    config = SimpleConfig({'electrum_path': tmpdir})
+    chain = Blockchain(config=config, forkpoint=0, parent=None,
+                       forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+    blockchain.blockchains[constants.net.GENESIS] = chain
+    open(chain.path(), 'w+').close()
+
+    def sync(verify):
+        chain.write(b'', 0)
+        verify_time = save_time = 0
+        for index, chunk in enumerate(chunks):
+            t0 = time.time()
+            verify(index, chunk)
+            t1 = time.time()
+            chain.save_chunk(index, chunk)
+            verify_time += t1 - t0
+            save_time += time.time() - t1
+        return verify_time, save_time
+
+    old_verify_time, old_save_time = sync(lambda index, chunk: verify_chunk_per_header(chain, index, chunk))
+    verify_time, save_time = sync(chain.verify_chunk)
+
+    n = num_chunks * 2016
+    print("%d headers" % n)
+    print("per-header verification: %8.0f headers/s, with save_chunk %8.0f headers/s" % (
+        n / old_verify_time, n / (old_verify_time + old_save_time)))
+    print("verify_chunk:            %8.0f headers/s, with save_chunk %8.0f headers/s" % (
+        n / verify_time, n / (verify_time + save_time)))
+finally:
+    shutil.rmtree(tmpdir)
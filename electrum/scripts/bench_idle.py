@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Measures the CPU used by an idle daemon: one network and many
+# synchronized wallets, none of which receives anything.
+# Connects to the public servers; the wallets are fresh and empty.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from electrum import keystore
+from electrum.mnemonic import Mnemonic
+from electrum.network import Network
+from electrum.simple_config import SimpleConfig
+from electrum.storage import WalletStorage
+from electrum.wallet import Standard_Wallet
+from electrum.util import create_and_start_event_loop
+
+
+try:
+    num_wallets = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+except Exception:
+    print("usage: bench_idle [num_wallets] [seconds]")
+    sys.exit(1)
+
+
+def wait_until(condition, timeout=600):
+    t0 = time.time()
+    while not condition():
+        if time.time() - t0 > timeout:
+            raise Exception('timed out')
+        time.sleep(1)
+
+
+loop, stopping_fut, loop_thread = create_and_start_event_loop()
+tmpdir = tempfile.mkdtemp()
+wallets = []
+network = None
+try:
+    config = SimpleConfig({'electrum_path': tmpdir})
+    network = Network(config)
+    network._loop_thread = loop_thread
+    network.start()
+    for i in range(num_wallets):
+        storage = WalletStorage(os.path.join(tmpdir, 'wallet_%d' % i))
+        ks = keystore.from_seed(Mnemonic('en').make_seed(), '', False)
+        storage.put('keystore', ks.dump())
+        wallet = Standard_Wallet(storage)
+        wallet.start_network(network)
+        wallets.append(wallet)
+
+    print("waiting for headers and %d wallets to synchronize..." % num_wallets)
+    wait_until(lambda: network.is_connected()
+               and network.get_local_height() >= network.get_server_height() > 0)
+    wait_until(lambda: all(wallet.is_up_to_date() for wallet in wallets))
+
+    t0, cpu0 = time.time(), time.process_time()
+    time.sleep(seconds)
+    t1, cpu1 = time.time(), time.process_time()
+    print("%d wallets idle: %.2f s of CPU in %.0f s (%.1f%% of one core)" % (
+        num_wallets, cpu1 - cpu0, t1 - t0, 100 * (cpu1 - cpu0) / (t1 - t0)))
+finally:
+    for wallet in wallets:
+        wallet.stop_threads(write_to_disk=False)
+    if network:
+        network.stop()
+    loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+    loop_thread.join(timeout=1)
+    shutil.rmtree(tmpdir)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Measures the cost of one wallet save (the puts done by
+# save_transactions followed by storage.write) against wallet size.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from electrum.storage import WalletStorage, FINAL_SEED_VERSION
+
+
+try:
+    sizes = [int(x) for x in sys.argv[1:]] or [1000, 5000, 20000]
+except Exception:
+    print("usage: bench_storage [num_txs ...]")
+    sys.exit(1)
+
+
+def fake_txid(i):
+    return '%064x' % (i * 2654435761)
+
+
+def fake_addr(i):
+    return '1Addr%010d' % i
+
+
+def make_wallet_data(num_txs):
+    transactions, txi, txo, history, spent = {}, {}, {}, {}, {}
+    for i in range(num_txs):
+        txid = fake_txid(i)
+        addr = fake_addr(i % (num_txs // 4 + 1))
+        transactions[txid] = '0100' * 110
+        txo[txid] = {addr: [(0, 10000 + i, False)]}
+        if i > 0:
+            prev = fake_txid(i - 1)
+            txi[txid] = {addr: [(prev + ':0', 10000 + i - 1)]}
+            spent[prev] = {'0': txid}
+        history.setdefault(addr, []).append((txid, 500000 + i))
+    return {'transactions': transactions, 'txi': txi, 'txo': txo,
+            'addr_history': history, 'spent_outpoints': spent}
+
+
+def save(storage, data):
+    t0 = time.time()
+    for key, value in data.items():
+        storage.put(key, value)
+    t1 = time.time()
+    storage.write()
+    t2 = time.time()
+    return t1 - t0, t2 - t1
+
+
+def bench(num_txs, tmpdir):
+    path = os.path.join(tmpdir, 'wallet_%d' % num_txs)
+    storage = WalletStorage(path)
+    storage.put('seed_version', FINAL_SEED_VERSION)
+    data = make_wallet_data(num_txs)
+    save(storage, data)
+    # one new transaction per save, as when a wallet receives a payment
+    put_times, write_times = [], []
+    for i in range(num_txs, num_txs + 10):
+        txid = fake_txid(i)
+        addr = fake_addr(i)
+        data['transactions'][txid] = '0100' * 110
+        data['txo'][txid] = {addr: [(0, 10000 + i, False)]}
+        data['addr_history'][addr] = [(txid, 500000 + i)]
+        put_time, write_time = save(storage, data)
+        put_times.append(put_time)
+        write_times.append(write_time)
+    t0 = time.time()
+    storage.compact()
+    compact_time = time.time() - t0
+    t0 = time.time()
+    storage.get('transactions')
+    get_time = time.time() - t0
+    print("%8d txs: put %7.2f ms  write %7.2f ms  compact %8.2f ms  get(transactions) %7.2f ms" % (
+        num_txs,
+        1000 * sum(put_times) / len(put_times),
+        1000 * sum(write_times) / len(write_times),
+        1000 * compact_time,
+        1000 * get_time))
+
+
+tmpdir = tempfile.mkdtemp()
+try:
+    for n in sizes:
+        bench(n, tmpdir)
+finally:
+    shutil.rmtree(tmpdir)
@@ -67,6 +67,34 @@ def get_derivation_used_for_hw_device_encryption():
 # storage encryption version
 STO_EV_PLAINTEXT, STO_EV_USER_PW, STO_EV_XPUB_PW = range(0, 3)
 
+# changes between full rewrites of the wallet file are appended to a journal
+JOURNAL_SUFFIX = '.journal'
+# the journal is compacted into the wallet file once it grows larger than
+# the wallet file itself, but not before it reaches this size (in bytes)
+JOURNAL_MIN_COMPACTION_SIZE = 1024 * 1024
+
+
+_MISSING = object()
+
+
+def _copy_json(v):
+    """Deep copy of json-like data; much cheaper than copy.deepcopy."""
+    t = type(v)
+    if t is dict:
+        return {k: _copy_json(x) for k, x in v.items()}
+    if t is list:
+        return [_copy_json(x) for x in v]
+    if t in (str, int, float, bool) or v is None:
+        return v
+    if t is tuple:
+        return tuple(_copy_json(x) for x in v)
+    return copy.deepcopy(v)
+
+
+def _json_key(k):
+    # dict keys are converted to strings by json; mimic that for sub-keys
+    return k if isinstance(k, str) else json.dumps(k)
+
 
 class JsonDB(PrintError):
 
@@ -75,6 +103,18 @@ class JsonDB(PrintError):
         self.data = {}
         self.path = os.path.normcase(os.path.abspath(path))
         self.modified = False
+        # changes not yet on disk: key -> None (whole value) or set of sub-keys
+        self._pending = {}
+        # hash of the snapshot on disk the journal applies to (None: no snapshot)
+        self._snapshot_hash = None
+        self._snapshot_size = 0
+        self._journal_size = 0
+        # set when the next write must rewrite the full snapshot
+        self._needs_compaction = False
+
+    @property
+    def journal_path(self):
+        return self.path + JOURNAL_SUFFIX
 
     def get(self, key, default=None):
         with self.db_lock:
@@ -82,36 +122,103 @@ class JsonDB(PrintError):
             if v is None:
                 v = default
             else:
-                v = copy.deepcopy(v)
+                v = _copy_json(v)
         return v
 
     def put(self, key, value):
         try:
             json.dumps(key, cls=util.MyEncoder)
-            json.dumps(value, cls=util.MyEncoder)
         except:
             self.print_error(f"json error: cannot save {repr(key)} ({repr(value)})")
             return
         with self.db_lock:
             if value is not None:
-                if self.data.get(key) != value:
-                    self.modified = True
-                    self.data[key] = copy.deepcopy(value)
+                old_value = self.data.get(key)
+                if isinstance(old_value, dict) and isinstance(value, dict):
+                    self._put_dict(key, old_value, value)
+                elif old_value != value:
+                    if not self._is_json_serializable(key, value):
+                        return
+                    self._mark_changed(key)
+                    self.data[key] = _copy_json(value)
             elif key in self.data:
-                self.modified = True
+                self._mark_changed(key)
                 self.data.pop(key)
 
+    def _put_dict(self, key, old_value, value):
+        # Only the sub-keys that changed are validated and copied;
+        # unchanged sub-values are shared with the previously stored dict.
+        changed = {k for k in old_value if k not in value}
+        new_value = {}
+        for k, v in value.items():
+            old_v = old_value.get(k, _MISSING)
+            if old_v is _MISSING or old_v != v:
+                changed.add(k)
+                new_value[k] = v
+            else:
+                new_value[k] = old_v
+        if not changed:
+            return
+        if not self._is_json_serializable(key, {k: new_value[k] for k in changed if k in new_value}):
+            return
+        for k in changed:
+            if k in new_value:
+                new_value[k] = _copy_json(new_value[k])
+        self._mark_changed(key, changed)
+        self.data[key] = new_value
+
+    def _is_json_serializable(self, key, value):
+        try:
+            json.dumps(value, cls=util.MyEncoder)
+        except:
+            self.print_error(f"json error: cannot save {repr(key)} ({repr(value)})")
+            return False
+        return True
+
+    def _mark_changed(self, key, subkeys=None):
+        self.modified = True
+        if subkeys is None or key in self._pending and self._pending[key] is None:
+            self._pending[key] = None
+        else:
+            self._pending.setdefault(key, set()).update(subkeys)
+
     @profiler
     def write(self):
         with self.db_lock:
             self._write()
 
+    def compact(self):
+        """Rewrite the full snapshot and drop the journal.
+        Leaves a wallet file that does not depend on a journal, e.g. on close.
+        """
+        with self.db_lock:
+            if self._journal_size or os.path.exists(self.journal_path):
+                self.modified = True
+            if self.modified:
+                self._needs_compaction = True
+            self._write()
+
     def _write(self):
         if threading.currentThread().isDaemon():
             self.print_error('warning: daemon thread cannot write db')
             return
         if not self.modified:
             return
+        if self._should_compact():
+            self._write_snapshot()
+        else:
+            self._append_journal()
+        self._pending = {}
+        self.modified = False
+
+    def _should_compact(self):
+        if self._needs_compaction or self._snapshot_hash is None:
+            return True
+        if not self.file_exists():
+            return True
+        return self._journal_size > max(JOURNAL_MIN_COMPACTION_SIZE, self._snapshot_size)
+
+    def _write_snapshot(self):
         s = json.dumps(self.data, indent=4, sort_keys=True, cls=util.MyEncoder)
         s = self.encrypt_before_writing(s)
 
@@ -129,12 +236,99 @@ class JsonDB(PrintError):
             os.remove(self.path)
             os.rename(temp_path, self.path)
         os.chmod(self.path, mode)
+        # a journal left behind by a crash here is ignored on load,
+        # as it does not match the hash of the new snapshot
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._snapshot_hash = self._hash_snapshot(s)
+        self._snapshot_size = len(s)
+        self._journal_size = 0
+        self._needs_compaction = False
         self.print_error("saved", self.path)
-        self.modified = False
+
+    def _append_journal(self):
+        lines = []
+        if self._journal_size == 0:
+            lines.append(json.dumps({'base': self._snapshot_hash}))
+        for key, subkeys in self._pending.items():
+            if subkeys is None:
+                records = [['set', key, self.data[key]] if key in self.data else ['del', key]]
+            else:
+                d = self.data.get(key, {})
+                records = [['sset', key, _json_key(k), d[k]] if k in d else ['sdel', key, _json_key(k)]
+                           for k in subkeys]
+            for record in records:
+                s = json.dumps(record, cls=util.MyEncoder)
+                lines.append(self.encrypt_journal_record(s))
+        s = ''.join(line + '\n' for line in lines)
+        with open(self.journal_path, "a", encoding='utf-8') as f:
+            f.write(s)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_size += len(s)
+        self.print_error("saved journal", self.journal_path, len(s))
+
+    def _load_journal(self, ec_key=None):
+        """Replays the journal on top of the loaded snapshot.
+        Stops at the first record that cannot be read (e.g. torn write),
+        in which case the next write compacts the journal away.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding='utf-8') as f:
+            lines = f.read().split('\n')
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get('base') != self._snapshot_hash:
+            self.print_error("ignoring stale journal", self.journal_path)
+            self._needs_compaction = True
+            return
+        size = len(lines[0]) + 1
+        count = 0
+        for line in lines[1:]:
+            if not line:
+                break
+            try:
+                record = json.loads(self.decrypt_journal_record(line, ec_key))
+                self._apply_journal_record(record)
+            except Exception as e:
+                self.print_error("journal truncated at record", count, repr(e))
+                self._needs_compaction = True
+                self.modified = True
+                break
+            size += len(line) + 1
+            count += 1
+        self._journal_size = size
+        self.print_error("replayed journal", self.journal_path, count)
+
+    def _apply_journal_record(self, record):
+        op, key = record[0], record[1]
+        if op == 'set':
+            self.data[key] = record[2]
+        elif op == 'del':
+            self.data.pop(key, None)
+        elif op == 'sset':
+            self.data.setdefault(key, {})[record[2]] = record[3]
+        elif op == 'sdel':
+            self.data.get(key, {}).pop(record[2], None)
+        else:
+            raise WalletFileException('unknown journal record: {}'.format(op))
+
+    @staticmethod
+    def _hash_snapshot(s: str) -> str:
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
 
     def encrypt_before_writing(self, plaintext: str) -> str:
         return plaintext
 
+    def encrypt_journal_record(self, plaintext: str) -> str:
+        return plaintext
+
+    def decrypt_journal_record(self, line: str, ec_key) -> str:
+        return line
+
     def file_exists(self):
         return self.path and os.path.exists(self.path)
 
@@ -149,6 +343,8 @@ class WalletStorage(JsonDB):
         if self.file_exists():
             with open(self.path, "r", encoding='utf-8') as f:
                 self.raw = f.read()
+            self._snapshot_hash = self._hash_snapshot(self.raw)
+            self._snapshot_size = len(self.raw)
             self._encryption_version = self._init_encryption_version()
             if not self.is_encrypted():
                 self.load_data(self.raw)
@@ -157,7 +353,7 @@ class WalletStorage(JsonDB):
             # avoid new wallets getting 'upgraded'
             self.put('seed_version', FINAL_SEED_VERSION)
 
-    def load_data(self, s):
+    def load_data(self, s, ec_key=None):
         try:
             self.data = json.loads(s)
         except:
@@ -177,6 +373,7 @@ class WalletStorage(JsonDB):
                 self.data[key] = value
         if not isinstance(self.data, dict):
             raise WalletFileException("Malformed wallet file (not dict)")
+        self._load_journal(ec_key)
 
         # check here if I need to load a plugin
         t = self.get('wallet_type')
@@ -255,7 +452,7 @@ class WalletStorage(JsonDB):
             s = None
         self.pubkey = ec_key.get_public_key_hex()
         s = s.decode('utf8')
-        self.load_data(s)
+        self.load_data(s, ec_key)
 
     def encrypt_before_writing(self, plaintext: str) -> str:
         s = plaintext
@@ -268,6 +465,15 @@ class WalletStorage(JsonDB):
             s = s.decode('utf8')
         return s
 
+    def encrypt_journal_record(self, plaintext: str) -> str:
+        return self.encrypt_before_writing(plaintext)
+
+    def decrypt_journal_record(self, line: str, ec_key) -> str:
+        if not self.is_encrypted():
+            return line
+        enc_magic = self._get_encryption_magic()
+        return zlib.decompress(ec_key.decrypt_message(line, enc_magic)).decode('utf8')
+
     def check_password(self, password):
         """Raises an InvalidPassword exception on invalid password"""
         if not self.is_encrypted():
@@ -289,9 +495,11 @@ class WalletStorage(JsonDB):
         else:
             self.pubkey = None
             self._encryption_version = STO_EV_PLAINTEXT
-        # make sure next storage.write() saves changes
+        # make sure next storage.write() saves changes;
+        # the journal was encrypted with the old key, so it must be compacted
         with self.db_lock:
             self.modified = True
+            self._needs_compaction = True
 
     def requires_split(self):
         d = self.get('accounts', {})
@@ -361,7 +569,7 @@ class WalletStorage(JsonDB):
         self.convert_version_18()
 
         self.put('seed_version', FINAL_SEED_VERSION)  # just to be sure
-        self.write()
+        self.compact()
 
     def convert_wallet_type(self):
         if not self._is_upgrade_method_needed(0, 13):
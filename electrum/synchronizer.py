@@ -53,6 +53,8 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
     """
     def __init__(self, network: 'Network'):
         self.asyncio_loop = network.asyncio_loop
+        # max number of requests sent to the server in one JSON-RPC batch
+        self.batch_size = max(1, network.config.get('sync_batch_size', 100))
         NetworkJobOnDefaultServer.__init__(self, network)
 
     def _reset(self):
@@ -63,6 +65,8 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         # Queues
         self.add_queue = asyncio.Queue()
         self.status_queue = asyncio.Queue()
+        # set when main() should check progress again
+        self._progress_event = asyncio.Event()
 
     async def _start_tasks(self):
         try:
@@ -82,28 +86,50 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         if addr in self.requested_addrs: return
         self.requested_addrs.add(addr)
         await self.add_queue.put(addr)
+        self._progress_event.set()
 
     async def _on_address_status(self, addr, status):
         """Handle the change of the status of an address."""
         raise NotImplementedError()  # implemented by subclasses
 
+    def _address_to_scripthash(self, addr: str) -> str:
+        return address_to_scripthash(addr)
+
+    async def _on_address_statuses(self, items):
+        """Handle a list of (addr, status) changes. Subclasses can
+        override this to process them together."""
+        for addr, status in items:
+            await self.group.spawn(self._on_address_status, addr, status)
+
+    async def _get_batch(self, queue: asyncio.Queue) -> list:
+        """Waits for an item, then takes whatever else is already queued,
+        up to batch_size items."""
+        items = [await queue.get()]
+        while len(items) < self.batch_size and not queue.empty():
+            items.append(queue.get_nowait())
+        return items
+
     async def send_subscriptions(self):
-        async def subscribe_to_address(addr):
-            h = address_to_scripthash(addr)
-            self.scripthash_to_address[h] = addr
-            await self.session.subscribe('blockchain.scripthash.subscribe', [h], self.status_queue)
-            self.requested_addrs.remove(addr)
+        async def subscribe_to_addresses(addrs):
+            hashes = [self._address_to_scripthash(addr) for addr in addrs]
+            for h, addr in zip(hashes, addrs):
+                self.scripthash_to_address[h] = addr
+            await self.session.subscribe_batch('blockchain.scripthash.subscribe',
+                                               [[h] for h in hashes], self.status_queue)
+            self.requested_addrs.difference_update(addrs)
+            self._progress_event.set()
 
         while True:
-            addr = await self.add_queue.get()
-            await self.group.spawn(subscribe_to_address, addr)
+            addrs = await self._get_batch(self.add_queue)
+            await self.group.spawn(subscribe_to_addresses, addrs)
 
     async def handle_status(self):
         while True:
-            h, status = await self.status_queue.get()
-            addr = self.scripthash_to_address[h]
-            await self.group.spawn(self._on_address_status, addr, status)
+            items = await self._get_batch(self.status_queue)
+            await self.group.spawn(self._on_address_statuses,
+                                   [(self.scripthash_to_address[h], status) for h, status in items])
             self._processed_some_notifications = True
+            self._progress_event.set()
 
     async def main(self):
         raise NotImplementedError()  # implemented by subclasses
@@ -129,21 +155,45 @@ class Synchronizer(SynchronizerBase):
     def diagnostic_name(self):
         return '{}:{}'.format(self.__class__.__name__, self.wallet.diagnostic_name())
 
+    def _address_to_scripthash(self, addr: str) -> str:
+        return self.wallet.address_to_scripthash(addr)
+
     def is_up_to_date(self):
         return (not self.requested_addrs
                 and not self.requested_histories
                 and not self.requested_tx)
 
     async def _on_address_status(self, addr, status):
-        history = self.wallet.history.get(addr, [])
-        if history_status(history) == status:
-            return
-        if addr in self.requested_histories:
+        await self._on_address_statuses([(addr, status)])
+
+    async def _on_address_statuses(self, items):
+        to_request = []
+        for addr, status in items:
+            history = self.wallet.history.get(addr, [])
+            if history_status(history) == status:
+                continue
+            if addr in self.requested_histories:
+                continue
+            self.requested_histories[addr] = status
+            to_request.append((addr, status))
+        if not to_request:
             return
-        # request address history
-        self.requested_histories[addr] = status
-        h = address_to_scripthash(addr)
-        result = await self.network.get_history_for_scripthash(h)
+        # request address histories
+        shs = [self._address_to_scripthash(addr) for addr, status in to_request]
+        results = await self.network.get_history_for_scripthashes(shs)
+        new_hist = []
+        for (addr, status), result in zip(to_request, results):
+            hist = self._receive_history(addr, status, result)
+            if hist is not None:
+                new_hist.extend(hist)
+        # Request transactions we don't have
+        await self._request_missing_txs(new_hist)
+        # Remove requests; this allows up_to_date to be True
+        for addr, status in to_request:
+            self.requested_histories.pop(addr)
+        self._progress_event.set()
+
+    def _receive_history(self, addr, status, result):
         self.print_error("receiving history", addr, len(result))
         hashes = set(map(lambda item: item['tx_hash'], result))
         hist = list(map(lambda item: (item['tx_hash'], item['height']), result))
@@ -159,11 +209,8 @@ class Synchronizer(SynchronizerBase):
         else:
             # Store received history
             self.wallet.receive_history_callback(addr, hist, tx_fees)
-            # Request transactions we don't have
-            await self._request_missing_txs(hist)
-
-        # Remove request; this allows up_to_date to be True
-        self.requested_histories.pop(addr)
+            return hist
+        return None
 
     async def _request_missing_txs(self, hist):
         # "hist" is a list of [tx_hash, tx_height] lists
@@ -178,11 +225,16 @@ class Synchronizer(SynchronizerBase):
 
         if not transaction_hashes: return
         async with TaskGroup() as group:
-            for tx_hash in transaction_hashes:
-                await group.spawn(self._get_transaction, tx_hash)
+            for i in range(0, len(transaction_hashes), self.batch_size):
+                await group.spawn(self._get_transactions, transaction_hashes[i:i+self.batch_size])
+
+    async def _get_transactions(self, tx_hashes):
+        results = await self.network.get_transactions(tx_hashes)
+        for tx_hash, result in zip(tx_hashes, results):
+            self._receive_transaction(tx_hash, result)
+        self._progress_event.set()
 
-    async def _get_transaction(self, tx_hash):
-        result = await self.network.get_transaction(tx_hash)
+    def _receive_transaction(self, tx_hash, result):
         tx = Transaction(result)
         try:
             tx.deserialize()
@@ -203,17 +255,23 @@ class Synchronizer(SynchronizerBase):
     async def main(self):
         self.wallet.set_up_to_date(False)
         # request missing txns, if any
+        hist = []
         for history in self.wallet.history.values():
             # Old electrum servers returned ['*'] when all history for the address
             # was pruned. This no longer happens but may remain in old wallets.
             if history == ['*']: continue
-            await self._request_missing_txs(history)
+            hist.extend(history)
+        await self._request_missing_txs(hist)
         # add addresses to bootstrap
         for addr in self.wallet.get_addresses():
             await self._add_address(addr)
-        # main loop
+        # main loop: runs whenever addresses, statuses or txs came in
+        self._progress_event.set()
         while True:
+            await self._progress_event.wait()
+            # let a burst of events accumulate
             await asyncio.sleep(0.1)
+            self._progress_event.clear()
             await run_in_thread(self.wallet.synchronize)
             up_to_date = self.is_up_to_date()
             if (up_to_date != self.wallet.is_up_to_date()
@@ -221,6 +279,8 @@ class Synchronizer(SynchronizerBase):
                 self._processed_some_notifications = False
                 self.wallet.set_up_to_date(up_to_date)
                 self.wallet.network.trigger_callback('wallet_updated', self.wallet)
+                if up_to_date:
+                    self.print_error("round trips saved by batching:", self.session.get_round_trips_saved())
 
 
 class Notifier(SynchronizerBase):
@@ -1,5 +1,6 @@
 import base64
 import sys
+from unittest import mock
 
 from electrum.bitcoin import (public_key_to_p2pkh, address_from_private_key,
                               is_address, is_private_key, is_new_seed, is_old_seed,
@@ -7,10 +8,12 @@ from electrum.bitcoin import (public_key_to_p2pkh, address_from_private_key,
                               deserialize_privkey, serialize_privkey, is_segwit_address,
                               is_b58_address, address_to_scripthash, is_minikey,
                               is_compressed_privkey, seed_type, EncodeBase58Check,
-                              script_num_to_hex, push_script, add_number_to_script, int_to_hex)
+                              script_num_to_hex, push_script, add_number_to_script, int_to_hex,
+                              int_to_bytes, compact_size, push_data)
 from electrum.bip32 import (bip32_root, bip32_public_derivation, bip32_private_derivation,
                             xpub_from_xprv, xpub_type, is_xprv, is_bip32_derivation,
-                            is_xpub, convert_bip32_path_to_list_of_uint32)
+                            is_xpub, convert_bip32_path_to_list_of_uint32,
+                            deserialize_xpub, CKD_pub, CKD_pub_range)
 from electrum.crypto import sha256d
 from electrum import ecc, crypto, constants
 from electrum.ecc import number_to_string, string_to_number
@@ -18,6 +21,7 @@ from electrum.transaction import opcodes
 from electrum.util import bfh, bh2u
 from electrum.storage import WalletStorage
 from electrum.keystore import xtype_from_derivation
+from electrum import keystore
 
 from electrum import ecc_fast
 
@@ -285,6 +289,16 @@ class Test_bitcoin(SequentialTestCase):
         self.assertEqual(var_int(0x100000000), "ff0000000001000000")
         self.assertEqual(var_int(0x0123456789abcdef), "ffefcdab8967452301")
 
+    def test_bytes_encoders(self):
+        self.assertEqual(b'\xff\x7f', int_to_bytes(32767, 2))
+        self.assertEqual(b'\x00\x80', int_to_bytes(-32768, 2))
+        with self.assertRaises(OverflowError): int_to_bytes(256, 1)
+        with self.assertRaises(TypeError): int_to_bytes('1', 1)
+        self.assertEqual(b'\xfc', compact_size(0xfc))
+        self.assertEqual(b'\xfd\xfd\x00', compact_size(0xfd))
+        self.assertEqual(b'\x00', push_data(b''))
+        self.assertEqual(b'\x4c\x4c' + 76 * b'\x42', push_data(76 * b'\x42'))
+
     def test_op_push(self):
         self.assertEqual(op_push(0x00), '00')
         self.assertEqual(op_push(0x12), '12')
@@ -427,6 +441,16 @@ class Test_xprv_xpub(SequentialTestCase):
         self.assertEqual("xpub6FnCn6nSzZAw5Tw7cgR9bi15UV96gLZhjDstkXXxvCLsUXBGXPdSnLFbdpq8p9HmGsApME5hQTZ3emM2rnY5agb9rXpVGyy3bdW6EEgAtqt", xpub)
         self.assertEqual("xprvA2nrNbFZABcdryreWet9Ea4LvTJcGsqrMzxHx98MMrotbir7yrKCEXw7nadnHM8Dq38EGfSh6dqA9QWTyefMLEcBYJUuekgW4BYPJcr9E7j", xprv)
 
+    @needs_test_with_all_ecc_implementations
+    def test_CKD_pub_range(self):
+        for xprv_details in self.xprv_xpub:
+            _, _, _, _, c, cK = deserialize_xpub(xprv_details['xpub'])
+            expected = [CKD_pub(cK, c, n)[0] for n in range(5, 12)]
+            self.assertEqual(expected, CKD_pub_range(cK, c, 5, 12))
+        self.assertEqual([], CKD_pub_range(cK, c, 3, 3))
+        with self.assertRaises(OverflowError):
+            CKD_pub_range(cK, c, 0x80000000 - 1, 0x80000000 + 1)
+
     @needs_test_with_all_ecc_implementations
     def test_xpub_from_xprv(self):
         """We can derive the xpub key from a xprv."""
@@ -716,6 +740,25 @@ class Test_keyImport(SequentialTestCase):
                              is_compressed_privkey(priv_details['priv']))
 
 
+class Test_derive_pubkeys_range(SequentialTestCase):
+
+    xpub = 'xpub661MyMwAqRbcGfCPEkkyo5WmcrhTq8mi3xuBS7VEZ3LYvsgY1cCFDbenT33bdD12axvrmXhuX3xkAbKci3yZY9ZEk8vhLic7KNhLjqdh5ec'
+
+    def test_same_as_derive_pubkey(self):
+        ks = keystore.from_xpub(self.xpub)
+        for for_change in (0, 1):
+            expected = [ks.derive_pubkey(for_change, n) for n in range(3, 10)]
+            self.assertEqual(expected, ks.derive_pubkeys_range(for_change, 3, 10))
+
+    @mock.patch.object(keystore, 'PARALLEL_DERIVATION_MIN_KEYS', 2)
+    @mock.patch.object(keystore, 'PARALLEL_DERIVATION_MIN_KEYS_FAST_ECC', 2)
+    @mock.patch.object(keystore.os, 'cpu_count', lambda: 2)
+    def test_process_pool(self):
+        ks = keystore.from_xpub(self.xpub)
+        expected = [ks.derive_pubkey(0, n) for n in range(0, 5)]
+        self.assertEqual(expected, ks.derive_pubkeys_range(0, 0, 5))
+
+
 class Test_seeds(SequentialTestCase):
     """ Test old and new seeds. """
 
@@ -2,9 +2,9 @@ import shutil
 import tempfile
 import os
 
-from electrum import constants, blockchain
+from electrum import constants, blockchain, util
 from electrum.simple_config import SimpleConfig
-from electrum.blockchain import Blockchain, deserialize_header, hash_header
+from electrum.blockchain import Blockchain, deserialize_header, hash_header, serialize_header
 from electrum.util import bh2u, bfh, make_dir
 
 from . import SequentialTestCase
@@ -169,6 +169,10 @@ class TestBlockchain(SequentialTestCase):
         self.assertEqual(hash_header(self.HEADERS['I']), chain_z.get_hash(8))
         self.assertEqual(hash_header(self.HEADERS['M']), chain_z.get_hash(9))
         self.assertEqual(hash_header(self.HEADERS['Z']), chain_z.get_hash(13))
+        self.assertEqual(hash_header(self.HEADERS['O']), chain_u.get_hash(6))
+        self.assertEqual(hash_header(self.HEADERS['U']), chain_u.get_hash(12))
+        self.assertEqual(hash_header(self.HEADERS['J']), chain_l.get_hash(9))
+        self.assertEqual(hash_header(self.HEADERS['L']), chain_l.get_hash(11))
 
     def test_doing_multiple_swaps_after_single_new_header(self):
         blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
@@ -237,3 +241,84 @@ class TestBlockchain(SequentialTestCase):
 
         for b in (chain_u, chain_l, chain_z):
             self.assertTrue(all([b.can_connect(b.read_header(i), False) for i in range(b.height())]))
+
+    def test_verify_chunk(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        self._append_header(chain_u, self.HEADERS['A'])
+        self._append_header(chain_u, self.HEADERS['B'])
+
+        names = 'ABCDEF'
+        chunk = b''.join(bfh(serialize_header(self.HEADERS[x])) for x in names)
+        chain_u.verify_chunk(0, chunk)
+        # header at height 1 differs from the one we have
+        bad_chunk = b''.join(bfh(serialize_header(self.HEADERS[x])) for x in 'AGCDEF')
+        with self.assertRaises(Exception):
+            chain_u.verify_chunk(0, bad_chunk)
+        # header does not connect to the previous one
+        bad_chunk = b''.join(bfh(serialize_header(self.HEADERS[x])) for x in 'ABCEDF')
+        with self.assertRaises(Exception):
+            chain_u.verify_chunk(0, bad_chunk)
+
+    def test_verify_chunk_on_mainnet(self):
+        genesis = bfh("0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c")
+        constants.set_mainnet()
+        try:
+            chain = Blockchain(config=self.config, forkpoint=0, parent=None,
+                               forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+            chain.verify_chunk(0, genesis)
+        finally:
+            constants.set_regtest()
+
+    def test_truncate_torn_writes(self):
+        chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        blockchain.blockchains[constants.net.GENESIS] = chain_u
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEF':
+            self._append_header(chain_u, self.HEADERS[name])
+
+        # partial header at the end
+        with open(chain_u.path(), 'ab') as f:
+            f.write(bfh(serialize_header(self.HEADERS['O']))[:50])
+        chain_u.truncate_torn_writes()
+        self.assertEqual(6 * 80, os.stat(chain_u.path()).st_size)
+        self.assertEqual(5, chain_u.height())
+
+        # header that does not link to the previous one, and data after it
+        chain_u.write(bfh(serialize_header(self.HEADERS['P'])) + bfh(serialize_header(self.HEADERS['Q'])), 6 * 80)
+        chain_u.truncate_torn_writes()
+        self.assertEqual(5, chain_u.height())
+
+        # zeroes: file was extended but the data did not make it to disk
+        chain_u.write(bytes(2 * 80), 6 * 80)
+        chain_u.truncate_torn_writes()
+        self.assertEqual(5, chain_u.height())
+        self.assertEqual(hash_header(self.HEADERS['F']), chain_u.get_hash(5))
+
+    def test_chainwork_cache_is_persisted(self):
+        constants.set_mainnet()
+        saved_cache = dict(blockchain._CHAINWORK_CACHE)
+        try:
+            make_dir(util.get_headers_dir(self.config))
+            blockchain.load_chainwork_cache(self.config)
+            chain = Blockchain(config=self.config, forkpoint=0, parent=None,
+                               forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+            height = 10 * 2016 + 5
+            work = chain.get_chainwork(height)
+            checkpoint_hash = chain.get_hash(10 * 2016 - 1)
+            # new process: cache is read from disk
+            blockchain._CHAINWORK_CACHE.clear()
+            blockchain._CHAINWORK_CACHE['00' * 32] = 0
+            self.assertNotIn(checkpoint_hash, blockchain._CHAINWORK_CACHE)
+            blockchain.load_chainwork_cache(self.config)
+            self.assertIn(checkpoint_hash, blockchain._CHAINWORK_CACHE)
+            self.assertEqual(work, chain.get_chainwork(height))
+        finally:
+            blockchain._CHAINWORK_CACHE.clear()
+            blockchain._CHAINWORK_CACHE.update(saved_cache)
+            blockchain._CHAINWORK_CACHE_PATH = None
+            constants.set_regtest()
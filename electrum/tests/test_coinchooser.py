@@ -0,0 +1,103 @@
+import unittest
+
+from electrum import coinchooser
+from electrum.bitcoin import TYPE_ADDRESS, pubkey_to_address
+from electrum.coinchooser import CoinChooserBranchAndBound, CoinChooserPrivacy
+from electrum.ecc import ECPrivkey
+from electrum.transaction import TxOutput
+from electrum.util import NotEnoughFunds
+
+
+DUST_THRESHOLD = 546
+
+
+def fee_estimator(size):
+    return 10 * size
+
+
+def make_coin(n, value, height=100):
+    pubkey = ECPrivkey.from_secret_scalar(n + 1).get_public_key_hex(compressed=True)
+    return {
+        'prevout_hash': '%064x' % (n + 1),
+        'prevout_n': 0,
+        'value': value,
+        'height': height,
+        'address': pubkey_to_address('p2wpkh', pubkey),
+        'type': 'p2wpkh',
+        'x_pubkeys': [pubkey],
+        'pubkeys': [pubkey],
+        'num_sig': 1,
+        'signatures': [None],
+    }
+
+
+class TestBranchAndBound(unittest.TestCase):
+
+    def setUp(self):
+        self.chooser = CoinChooserBranchAndBound()
+
+    def test_exact_match(self):
+        values = [50, 40, 30, 20, 10]
+        indices = self.chooser.branch_and_bound(values, [1] * 5, 60, 1, 100)
+        self.assertEqual(60, sum(values[i] for i in indices))
+
+    def test_least_waste(self):
+        # both 90 and 40 + 30 + 20 are within range; fewer items waste less
+        values = [90, 40, 30, 20]
+        indices = self.chooser.branch_and_bound(values, [5] * 4, 85, 10, 100)
+        self.assertEqual([0], indices)
+
+    def test_no_match(self):
+        values = [50, 40]
+        self.assertIsNone(self.chooser.branch_and_bound(values, [1, 1], 60, 5, 100))
+        self.assertIsNone(self.chooser.branch_and_bound(values, [1, 1], 100, 5, 100))
+        # too wasteful
+        self.assertIsNone(self.chooser.branch_and_bound(values, [1, 1], 90, 5, 2))
+
+    def test_equal_values(self):
+        values = [10] * 30
+        indices = self.chooser.branch_and_bound(values, [0] * 30, 250, 1, 100)
+        self.assertEqual(25, len(indices))
+
+
+class TestCoinChooserBranchAndBound(unittest.TestCase):
+
+    def setUp(self):
+        self.coins = [make_coin(n, value) for n, value in
+                      enumerate([300000, 170000, 120000, 65000, 40000])]
+        self.change_addr = make_coin(100, 0)['address']
+        self.dest_addr = make_coin(101, 0)['address']
+
+    def make_tx(self, chooser, amount, coins=None):
+        outputs = [TxOutput(TYPE_ADDRESS, self.dest_addr, amount)]
+        return chooser.make_tx(coins or self.coins, [], outputs, [self.change_addr],
+                               fee_estimator, DUST_THRESHOLD)
+
+    def test_changeless(self):
+        # 170000 + 65000 pays for 233000 and the fee, with a little excess
+        tx = self.make_tx(CoinChooserBranchAndBound(), 233000)
+        self.assertEqual(1, len(tx.outputs()))
+        self.assertEqual({170000, 65000}, {txin['value'] for txin in tx.inputs()})
+        self.assertLess(tx.get_fee() - fee_estimator(tx.estimated_size()), 1000)
+        # the privacy chooser makes change here
+        tx = self.make_tx(CoinChooserPrivacy(), 233000)
+        self.assertEqual(2, len(tx.outputs()))
+
+    def test_falls_back_to_change(self):
+        tx = self.make_tx(CoinChooserBranchAndBound(), 250000)
+        self.assertEqual(2, len(tx.outputs()))
+        self.assertGreaterEqual(tx.input_value(), 250000 + tx.get_fee())
+
+    def test_prefers_confirmed(self):
+        coins = [make_coin(0, 170000, height=0), make_coin(1, 65000),
+                 make_coin(2, 300000), make_coin(3, 100000, height=0)]
+        tx = self.make_tx(CoinChooserBranchAndBound(), 233000, coins)
+        self.assertTrue(all(txin['height'] > 0 for txin in tx.inputs()))
+
+    def test_not_enough_funds(self):
+        with self.assertRaises(NotEnoughFunds):
+            self.make_tx(CoinChooserBranchAndBound(), 10 ** 8)
+
+    def test_registered(self):
+        self.assertIs(CoinChooserBranchAndBound,
+                      coinchooser.COIN_CHOOSERS['BranchAndBound'])
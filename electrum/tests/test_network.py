@@ -1,11 +1,15 @@
 import asyncio
 import tempfile
 import unittest
+from unittest import mock
+
+from aiorpcx import RPCSession
 
 from electrum import constants
 from electrum.simple_config import SimpleConfig
 from electrum import blockchain
-from electrum.interface import Interface
+from electrum.interface import Interface, NotificationSession, RequestTimedOut
+from electrum.network import Network
 from electrum.crypto import sha256
 from electrum.util import bh2u
 
@@ -16,6 +20,7 @@ class MockTaskGroup:
 class MockNetwork:
     main_taskgroup = MockTaskGroup()
     asyncio_loop = asyncio.get_event_loop()
+    def get_ready_interfaces(self): return []
 
 class MockInterface(Interface):
     def __init__(self, config):
@@ -113,6 +118,180 @@ class TestNetwork(unittest.TestCase):
         self.assertEqual(('catchup', 7), asyncio.get_event_loop().run_until_complete(ifa.sync_until(8, next_height=6)))
         self.assertEqual(self.interface.q.qsize(), 0)
 
+    def test_request_chunks_connects_in_order(self):
+        connected = []
+        class MockChain:
+            def connect_chunk(self, index, hexdata):
+                connected.append(index)
+                return True
+        async def mock_fetch_chunk(index, tip):
+            # later chunks arrive first
+            await asyncio.sleep(0.01 * (5 - index))
+            return {'hex': '', 'count': min(2016, tip - index * 2016 + 1)}
+        ifa = self.interface
+        ifa.blockchain = MockChain()
+        ifa._fetch_chunk = mock_fetch_chunk
+        self.config.set_key('header_chunk_pipeline_depth', 3)
+        tip = 4 * 2016 + 100
+        self.assertEqual((tip + 1, True), asyncio.get_event_loop().run_until_complete(ifa.request_chunks(10, tip)))
+        self.assertEqual([0, 1, 2, 3, 4], connected)
+
+    def test_request_chunks_stops_at_chunk_that_does_not_connect(self):
+        requested = []
+        class MockChain:
+            def connect_chunk(self, index, hexdata):
+                return index != 2
+        async def mock_fetch_chunk(index, tip):
+            requested.append(index)
+            return {'hex': '', 'count': 2016}
+        ifa = self.interface
+        ifa.blockchain = MockChain()
+        ifa._fetch_chunk = mock_fetch_chunk
+        self.config.set_key('header_chunk_pipeline_depth', 2)
+        self.assertEqual((2 * 2016, False), asyncio.get_event_loop().run_until_complete(ifa.request_chunks(0, 10 * 2016)))
+        # back-pressure: no more than 'depth' chunks beyond the last connected one
+        self.assertEqual([0, 1, 2, 3], requested)
+
+
+class MockSession:
+    def __init__(self, result, delay=0):
+        self.result = result
+        self.delay = delay
+        self.latency = 0.1
+        self.num_requests = 0
+    async def send_request(self, method, params, timeout=None):
+        self.num_requests += 1
+        await asyncio.sleep(self.delay)
+        return self.result
+
+class MockServerInterface:
+    def __init__(self, server, session):
+        self.server = server
+        self.session = session
+
+
+class TestRequestFanout(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Network.__new__(Network)
+        self.network.config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="test_network")})
+
+    def send(self, interfaces, verify=lambda result: result == 'good'):
+        self.network.get_ready_interfaces = lambda: list(interfaces)
+        async def fallback():
+            return 'fallback'
+        coro = self.network._send_verifiable_request(
+            lambda session: session.send_request('method', []), verify, fallback)
+        return asyncio.get_event_loop().run_until_complete(asyncio.wait_for(coro, 5))
+
+    def test_slow_request_is_hedged(self):
+        slow = MockServerInterface('slow', MockSession('good', delay=60))
+        fast = MockServerInterface('fast', MockSession('good'))
+        self.assertEqual('good', self.send([slow, fast]))
+        self.assertEqual(1, fast.session.num_requests)
+
+    def test_invalid_results_fall_back_to_main_interface(self):
+        bad1 = MockServerInterface('bad1', MockSession('bad'))
+        bad2 = MockServerInterface('bad2', MockSession('bad'))
+        self.assertEqual('fallback', self.send([bad1, bad2]))
+        self.assertEqual(1, bad1.session.num_requests)
+        self.assertEqual(1, bad2.session.num_requests)
+
+    def test_no_interfaces(self):
+        self.assertEqual('fallback', self.send([]))
+
+
+class MockBatchRequest:
+    def __init__(self, session):
+        self.session = session
+        self.requests = []
+        self.results = None
+    def add_request(self, method, params):
+        self.requests.append((method, params))
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        session = self.session
+        session.batches.append(len(self.requests))
+        session.in_flight += len(self.requests)
+        session.max_in_flight = max(session.max_in_flight, session.in_flight)
+        try:
+            await asyncio.sleep(session.delay)
+        finally:
+            session.in_flight -= len(self.requests)
+        self.results = tuple(session.respond(method, params) for method, params in self.requests)
+
+class MockNotificationSession(NotificationSession):
+    def __init__(self, respond, delay=0):
+        with mock.patch.object(RPCSession, '__init__', lambda self, *args, **kwargs: None):
+            super().__init__()
+        self.respond = respond
+        self.delay = delay
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+    def send_batch(self, raise_errors=False):
+        return MockBatchRequest(self)
+
+
+class TestNotificationSessionBatches(unittest.TestCase):
+
+    def run_coro(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_results_in_request_order(self):
+        session = MockNotificationSession(lambda method, params: params[0] * 2)
+        requests = [('method', [i]) for i in range(5)]
+        self.assertEqual([0, 2, 4, 6, 8], self.run_coro(session.send_requests_batch(requests)))
+        self.assertEqual(4, session.get_round_trips_saved())
+
+    def test_errors_are_returned_per_request(self):
+        def respond(method, params):
+            return ValueError(params[0]) if params[0] % 2 else params[0]
+        session = MockNotificationSession(respond)
+        results = self.run_coro(session.send_requests_batch([('method', [i]) for i in range(3)]))
+        self.assertEqual(0, results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(2, results[2])
+
+    def test_timeout(self):
+        session = MockNotificationSession(lambda method, params: None, delay=60)
+        with self.assertRaises(RequestTimedOut):
+            self.run_coro(session.send_requests_batch([('method', [])], timeout=0.01))
+        # the slots of the batch are given back
+        self.assertFalse(session.in_flight_requests_semaphore.locked())
+
+    def test_batches_count_against_in_flight_limit(self):
+        session = MockNotificationSession(lambda method, params: params[0], delay=0.01)
+        session.max_in_flight_requests = 10
+        session.in_flight_requests_semaphore = asyncio.Semaphore(10)
+        async def send_all():
+            return await asyncio.gather(
+                session.send_requests_batch([('method', [i]) for i in range(25)]),
+                session.send_requests_batch([('method', [i]) for i in range(7)]))
+        big, small = self.run_coro(send_all())
+        self.assertEqual(list(range(25)), big)
+        self.assertEqual(list(range(7)), small)
+        self.assertLessEqual(max(session.batches), 10)
+        self.assertLessEqual(session.max_in_flight, 10)
+
+    def test_subscribe_batch_raises_errors(self):
+        def respond(method, params):
+            return ValueError() if params == ['b'] else 'status'
+        session = MockNotificationSession(respond)
+        queue = asyncio.Queue()
+        with self.assertRaises(ValueError):
+            self.run_coro(session.subscribe_batch('method', [['a'], ['b']], queue))
+
+    def test_subscribe_batch_requests_uncached_only(self):
+        session = MockNotificationSession(lambda method, params: params[0] + '-status')
+        session.cache[session.get_hashable_key_for_rpc_call('method', ['a'])] = 'cached'
+        queue = asyncio.Queue()
+        self.run_coro(session.subscribe_batch('method', [['a'], ['b'], ['c']], queue))
+        self.assertEqual([2], session.batches)
+        self.assertEqual([['a', 'cached'], ['b', 'b-status'], ['c', 'c-status']],
+                         [queue.get_nowait() for _ in range(3)])
+
 
 if __name__=="__main__":
     constants.set_regtest()
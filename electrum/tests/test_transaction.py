@@ -146,6 +146,28 @@ class TestTransaction(SequentialTestCase):
         self.assertEqual(estimated_output_size('bc1q3g5tmkmlvxryhh843v4dz026avatc0zzr6h3af'), 31)
         self.assertEqual(estimated_output_size('bc1qnvks7gfdu72de8qv6q6rhkkzu70fqz4wpjzuxjf6aydsx7wxfwcqnlxuv3'), 43)
 
+    def test_estimated_input_weight(self):
+        Transaction = transaction.Transaction
+        compressed = '02' + '11' * 32
+        uncompressed = '04' + '11' * 64
+        def txin(n, _type, num_sig=1, num_pubkeys=1, pubkey=compressed):
+            return {'prevout_hash': '%064x' % n, 'prevout_n': n, 'type': _type,
+                    'num_sig': num_sig, 'x_pubkeys': [pubkey] * num_pubkeys,
+                    'signatures': [None] * num_pubkeys}
+        txins = [txin(0, 'p2pkh'), txin(1, 'p2pkh', pubkey=uncompressed),
+                 txin(2, 'p2wpkh'), txin(3, 'p2wpkh-p2sh'), txin(4, 'p2sh', 2, 3),
+                 txin(5, 'p2wsh', 2, 3), txin(6, 'p2wsh-p2sh', 3, 5)]
+        expected = [(592, 593), (720, 721), (272, 272), (364, 364), (1188, 1189), (418, 418), (699, 699)]
+        # the second time, the sizes of an input of the same template are reused
+        for i in range(2):
+            weights = [(Transaction.estimated_input_weight(x, False),
+                        Transaction.estimated_input_weight(x, True)) for x in txins]
+            self.assertEqual(expected, weights)
+            txins = [dict(x, prevout_n=x['prevout_n'] + 100) for x in txins]
+        # a saved scriptSig is used as is
+        x = dict(txins[0], scriptSig='00', signatures=['00'])
+        self.assertEqual(4 * 42, Transaction.estimated_input_weight(x, False))
+
     # TODO other tests for segwit tx
     def test_tx_signed_segwit(self):
         tx = transaction.Transaction(signed_segwit_blob)
@@ -156,6 +178,33 @@ class TestTransaction(SequentialTestCase):
         self.assertEqual(tx.estimated_weight(), 561)
         self.assertEqual(tx.estimated_size(), 141)
 
+    def test_txid_follows_changes_to_the_tx(self):
+        tx = transaction.Transaction(signed_segwit_blob)
+        txid, wtxid = tx.txid(), tx.wtxid()
+        tx.locktime += 1
+        self.assertNotEqual(txid, tx.txid())
+        self.assertNotEqual(wtxid, tx.wtxid())
+        self.assertEqual(transaction.Transaction(tx.serialize_to_network()).txid(), tx.txid())
+        tx.locktime -= 1
+        self.assertEqual(txid, tx.txid())
+        self.assertEqual(signed_segwit_blob, str(tx))
+        tx.version = 2
+        self.assertEqual(transaction.Transaction(tx.serialize_to_network()).txid(), tx.txid())
+        tx = transaction.Transaction(signed_segwit_blob)
+        tx.txid()
+        tx.BIP69_sort()
+        self.assertEqual(transaction.Transaction(tx.serialize_to_network()).txid(), tx.txid())
+
+    def test_txid_after_remove_signatures(self):
+        tx = transaction.Transaction(signed_blob)
+        self.assertIsNotNone(tx.txid())
+        tx = transaction.Transaction(tx.serialize())
+        tx.deserialize(force_full_parse=True)
+        tx.txid()
+        tx.remove_signatures()
+        # not all inputs are segwit: the txid is not known without signatures
+        self.assertIsNone(tx.txid())
+
     def test_errors(self):
         with self.assertRaises(TypeError):
             transaction.Transaction.pay_script(output_type=None, addr='')
@@ -171,6 +220,23 @@ class TestTransaction(SequentialTestCase):
         tx = transaction.Transaction(v2_blob)
         self.assertEqual(tx.txid(), "b97f9180173ab141b61b9f944d841e60feec691d6daab4d4d932b24dd36606fe")
 
+    def test_outputs_parsed_separately_from_inputs(self):
+        raw_tx = '020000000001010000000000000000000000000000000000000000000000000000000000000000ffffffff050214030101ffffffff02902f50090000000017a914ba582096f8647ca4195f55c8ef7e7e6e120e88b1870000000000000000266a24aa21a9ede2f61c3f71d1defd3fa999dfa36953755c690689799962b48bebd836974e8cf90120000000000000000000000000000000000000000000000000000000000000000000000000'
+        tx = transaction.Transaction(raw_tx)
+        outputs = tx.outputs()
+        self.assertIsNone(tx._inputs)
+        self.assertEqual(2, tx.version)
+        self.assertTrue(tx.is_segwit())
+        d = transaction.deserialize(raw_tx)
+        self.assertEqual([(x['type'], x['address'], x['value']) for x in d['outputs']],
+                         [tuple(o) for o in outputs])
+        self.assertEqual(d['inputs'], tx.inputs())
+        self.assertEqual('e28ee5866ec0535fe5efac5ad350cbf4960ed981b471a0c4a6baad1d8168d3d7', tx.txid())
+        with self.assertRaises(transaction.SerializationError):
+            transaction.Transaction(raw_tx + '00').outputs()
+        with self.assertRaises(transaction.SerializationError):
+            transaction.Transaction(raw_tx[:-20]).outputs()
+
     def test_get_address_from_output_script(self):
         # the inverse of this test is in test_bitcoin: test_address_to_script
         addr_from_script = lambda script: transaction.get_address_from_output_script(bfh(script))
@@ -214,6 +280,11 @@ class TestTransaction(SequentialTestCase):
         self.assertEqual(txid, tx.txid())
         self.assertEqual(raw_tx, tx.serialize())
         self.assertTrue(tx.estimated_size() >= 0)
+        # without the raw tx, the ids are computed from the serialized fields
+        wtxid = tx.wtxid()
+        tx.raw = None
+        self.assertEqual(txid, tx.txid())
+        self.assertEqual(wtxid, tx.wtxid())
 
     def test_txid_coinbase_to_p2pk(self):
         raw_tx = '01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4103400d0302ef02062f503253482f522cfabe6d6dd90d39663d10f8fd25ec88338295d4c6ce1c90d4aeb368d8bdbadcc1da3b635801000000000000000474073e03ffffffff013c25cf2d01000000434104b0bd634234abbb1ba1e986e884185c61cf43e001f9137f23c2c409273eb16e6537a576782eba668a7ef8bd3b3cfb1edb7117ab65129b8a2e681f3c1e0908ef7bac00000000'
@@ -801,6 +872,11 @@ class TestTransactionTestnet(TestCaseForTestnet):
         self.assertEqual(txid, tx.txid())
         self.assertEqual(raw_tx, tx.serialize())
         self.assertTrue(tx.estimated_size() >= 0)
+        # without the raw tx, the ids are computed from the serialized fields
+        wtxid = tx.wtxid()
+        tx.raw = None
+        self.assertEqual(txid, tx.txid())
+        self.assertEqual(wtxid, tx.wtxid())
 
 # partial txns using our partial format --->
     # NOTE: our partial format contains xpubs, and xpubs have version bytes,
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from electrum.simple_config import SimpleConfig
+from electrum.tx_cache import TxCache
+
+
+TXID1 = '01' * 32
+TXID2 = '02' * 32
+TXID3 = '03' * 32
+
+
+class TestTxCache(unittest.TestCase):
+
+    def setUp(self):
+        self.electrum_path = tempfile.mkdtemp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+
+    def tearDown(self):
+        shutil.rmtree(self.electrum_path)
+
+    def test_get_missing(self):
+        cache = TxCache(self.config)
+        self.assertIsNone(cache.get(TXID1))
+        self.assertNotIn(TXID1, cache)
+
+    def test_put_and_get(self):
+        cache = TxCache(self.config)
+        cache.put(TXID1, 'aa')
+        self.assertEqual('aa', cache.get(TXID1))
+        self.assertIn(TXID1, cache)
+
+    def test_nothing_written_to_disk(self):
+        before = set(os.listdir(self.electrum_path))
+        cache = TxCache(self.config)
+        cache.put(TXID1, 'aa')
+        self.assertEqual(before, set(os.listdir(self.electrum_path)))
+        self.assertIsNone(TxCache(self.config).get(TXID1))
+
+    def test_lru_eviction(self):
+        cache = TxCache(self.config, memory_size=2)
+        cache.put(TXID1, 'aa')
+        cache.put(TXID2, 'bb')
+        cache.get(TXID1)
+        cache.put(TXID3, 'cc')
+        self.assertEqual([TXID1, TXID3], list(cache._memory))
+        self.assertIsNone(cache.get(TXID2))
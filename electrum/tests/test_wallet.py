@@ -8,8 +8,9 @@ from unittest import TestCase
 import time
 
 from io import StringIO
-from electrum.storage import WalletStorage, FINAL_SEED_VERSION
+from electrum.storage import WalletStorage, FINAL_SEED_VERSION, STO_EV_USER_PW
 from electrum.wallet import Abstract_Wallet
+from electrum.address_synchronizer import HistoryIndex
 from electrum.exchange_rate import ExchangeBase, FxThread
 from electrum.util import TxMinedStatus
 from electrum.bitcoin import COIN
@@ -75,6 +76,89 @@ class TestWalletStorage(WalletTestCase):
             contents = f.read()
         self.assertEqual(some_dict, json.loads(contents))
 
+    def _create_storage_with_snapshot(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.put('labels', {'a': 'b'})
+        storage.put('seed_version', FINAL_SEED_VERSION)
+        storage.write()
+        return storage
+
+    def test_write_appends_changes_to_journal(self):
+        storage = self._create_storage_with_snapshot()
+        with open(self.wallet_path, "r") as f:
+            snapshot = f.read()
+        storage.put('labels', {'a': 'b', 'c': 'd'})
+        storage.put('frozen_addresses', ['x'])
+        storage.write()
+        storage.put('frozen_addresses', None)
+        storage.write()
+        # the snapshot is untouched; only the changes were written
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(snapshot, f.read())
+        with open(storage.journal_path, "r") as f:
+            self.assertEqual(4, len(f.read().splitlines()))
+
+        storage2 = WalletStorage(self.wallet_path, manual_upgrades=True)
+        self.assertEqual({'a': 'b', 'c': 'd'}, storage2.get('labels'))
+        self.assertEqual(None, storage2.get('frozen_addresses'))
+
+    def test_compact_removes_journal(self):
+        storage = self._create_storage_with_snapshot()
+        storage.put('labels', {'c': 'd'})
+        storage.write()
+        self.assertTrue(os.path.exists(storage.journal_path))
+        storage.compact()
+        self.assertFalse(os.path.exists(storage.journal_path))
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual({'c': 'd'}, json.loads(f.read())['labels'])
+
+    def test_torn_journal_record_is_ignored(self):
+        storage = self._create_storage_with_snapshot()
+        storage.put('labels', {'a': 'b', 'c': 'd'})
+        storage.write()
+        with open(storage.journal_path, "a") as f:
+            f.write('["sset", "labels", "e", "f')
+
+        storage2 = WalletStorage(self.wallet_path, manual_upgrades=True)
+        self.assertEqual({'a': 'b', 'c': 'd'}, storage2.get('labels'))
+        # the next write rewrites the snapshot
+        storage2.put('labels', {'g': 'h'})
+        storage2.write()
+        self.assertFalse(os.path.exists(storage2.journal_path))
+        storage3 = WalletStorage(self.wallet_path, manual_upgrades=True)
+        self.assertEqual({'g': 'h'}, storage3.get('labels'))
+
+    def test_stale_journal_is_ignored(self):
+        storage = self._create_storage_with_snapshot()
+        storage.put('labels', {'c': 'd'})
+        storage.write()
+        with open(storage.journal_path, "r") as f:
+            journal = f.read()
+        storage.compact()
+        storage.put('labels', {'e': 'f'})
+        storage.compact()
+        # e.g. crash between replacing the wallet file and deleting the journal
+        with open(storage.journal_path, "w") as f:
+            f.write(journal)
+
+        storage2 = WalletStorage(self.wallet_path, manual_upgrades=True)
+        self.assertEqual({'e': 'f'}, storage2.get('labels'))
+
+    def test_encrypted_journal(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.put('seed_version', FINAL_SEED_VERSION)
+        storage.set_password('secret', STO_EV_USER_PW)
+        storage.write()
+        storage.put('labels', {'a': 'b'})
+        storage.write()
+        with open(storage.journal_path, "r") as f:
+            self.assertNotIn('labels', f.read())
+
+        storage2 = WalletStorage(self.wallet_path, manual_upgrades=True)
+        self.assertTrue(storage2.is_encrypted())
+        storage2.decrypt('secret')
+        self.assertEqual({'a': 'b'}, storage2.get('labels'))
+
 class FakeExchange(ExchangeBase):
     def __init__(self, rate):
         super().__init__(lambda self: None, lambda self: None)
@@ -138,3 +222,29 @@ class TestFiat(TestCase):
     def test_save_garbage(self):
         self.assertEqual(False, Abstract_Wallet.set_fiat_value(self.wallet, txid, ccy, 'garbage', self.fx, self.value_sat))
         self.assertNotIn(ccy, self.fiat_value)
+
+
+class TestHistoryIndex(TestCase):
+
+    def test_running_balances(self):
+        index = HistoryIndex()
+        index.add('c', (30, 0), -5)
+        index.add('a', (10, 0), 10)
+        index.add('b', (20, 1), 7)
+        self.assertEqual([('a', 10, 10), ('b', 7, 17), ('c', -5, 12)], index.get_range())
+        self.assertEqual(12, index.get_balance())
+        # a confirmation moves an entry
+        index.add('c', (15, 2), -5)
+        self.assertEqual([('a', 10, 10), ('c', -5, 5), ('b', 7, 12)], index.get_range())
+        index.remove('a')
+        self.assertNotIn('a', index)
+        self.assertEqual([('c', -5, -5), ('b', 7, 2)], index.get_range())
+
+    def test_get_range(self):
+        index = HistoryIndex()
+        for i in range(10):
+            index.add('tx%d' % i, (i, 0), 1)
+        self.assertEqual(10, len(index))
+        self.assertEqual([('tx3', 1, 4), ('tx4', 1, 5)], index.get_range(3, 5))
+        self.assertEqual([('tx8', 1, 9), ('tx9', 1, 10)], index.get_range(-2))
+        self.assertEqual([], index.get_range(20))
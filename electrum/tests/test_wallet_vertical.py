@@ -42,6 +42,32 @@ class WalletIntegrityHelper:
         test_obj.assertFalse(ks.can_import())
         test_obj.assertFalse(ks.has_seed())
 
+    @classmethod
+    def check_utxo_index_sanity(cls, test_obj, w):
+        # the utxo index must agree with a full scan of txi/txo
+        for addr in w.get_addresses():
+            received, sent = w.get_addr_io(addr)
+            expected = {txo: (height, v, is_cb) for txo, (height, v, is_cb) in received.items()
+                        if txo not in sent}
+            utxos = {txo: (x['height'], x['value'], x['coinbase']) for txo, x in w.get_addr_utxo(addr).items()}
+            test_obj.assertEqual(expected, utxos)
+
+    @classmethod
+    def check_history_index_sanity(cls, test_obj, w):
+        # the history index must agree with the history computed from scratch
+        h = w.get_history()
+        expected = w._get_domain_history(w.history.keys())
+        test_obj.assertEqual({tx_hash: delta for tx_hash, _, delta, _ in expected},
+                             {tx_hash: delta for tx_hash, _, delta, _ in h})
+        if expected:
+            test_obj.assertEqual(expected[-1][3], h[-1][3])
+        test_obj.assertEqual(h[-3:], w.get_history(start=-3))
+
+    @classmethod
+    def check_address_lookup_tables_sanity(cls, test_obj, w):
+        for addr in w.get_addresses():
+            test_obj.assertEqual(bitcoin.address_to_scripthash(addr), w.address_to_scripthash(addr))
+
     @classmethod
     def create_standard_wallet(cls, ks, gap_limit=None):
         store = storage.WalletStorage('if_this_exists_mocking_failed_648151893')
@@ -95,6 +121,7 @@ class TestWalletKeystoreAddressIntegrityForMainnet(SequentialTestCase):
 
         self.assertEqual(w.get_receiving_addresses()[0], '1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf')
         self.assertEqual(w.get_change_addresses()[0], '1KSezYMhAJMWqFbVFB2JshYg69UpmEXR4D')
+        WalletIntegrityHelper.check_address_lookup_tables_sanity(self, w)
 
     @needs_test_with_all_ecc_implementations
     @mock.patch.object(storage.WalletStorage, '_write')
@@ -288,6 +315,7 @@ class TestWalletKeystoreAddressIntegrityForMainnet(SequentialTestCase):
 
         self.assertEqual(w.get_receiving_addresses()[0], '32ji3QkAgXNz6oFoRfakyD3ys1XXiERQYN')
         self.assertEqual(w.get_change_addresses()[0], '36XWwEHrrVCLnhjK5MrVVGmUHghr9oWTN1')
+        WalletIntegrityHelper.check_address_lookup_tables_sanity(self, w)
 
     @needs_test_with_all_ecc_implementations
     @mock.patch.object(storage.WalletStorage, '_write')
@@ -519,6 +547,30 @@ class TestWalletSending(TestCaseForTestnet):
         ks = keystore.from_seed(seed_words, '', False)
         return WalletIntegrityHelper.create_standard_wallet(ks, gap_limit=2)
 
+    @mock.patch.object(storage.WalletStorage, '_write')
+    def test_pop_changed_addresses(self, mock_write):
+        wallet = self.create_standard_wallet_from_seed('bitter grass shiver impose acquire brush forget axis eager alone wine silver')
+        receiving = wallet.get_receiving_addresses()
+        # at first, any address may have changed
+        self.assertIsNone(wallet.pop_changed_addresses())
+        self.assertEqual(set(), wallet.pop_changed_addresses())
+
+        funding_tx = Transaction('01000000014576dacce264c24d81887642b726f5d64aa7825b21b350c7b75a57f337da6845010000006b483045022100a3f8b6155c71a98ad9986edd6161b20d24fad99b6463c23b463856c0ee54826d02200f606017fd987696ebbe5200daedde922eee264325a184d5bbda965ba5160821012102e5c473c051dae31043c335266d0ef89c1daab2f34d885cc7706b267f3269c609ffffffff0240420f00000000001600148a28bddb7f61864bdcf58b2ad13d5aeb3abc3c42a2ddb90e000000001976a914c384950342cb6f8df55175b48586838b03130fad88ac00000000')
+        wallet.receive_tx_callback(funding_tx.txid(), funding_tx, TX_HEIGHT_UNCONFIRMED)
+        # the funded address, and the next one whose gap limit depends on it
+        self.assertEqual(set(receiving), wallet.pop_changed_addresses())
+        self.assertEqual(set(), wallet.pop_changed_addresses())
+
+        wallet.set_label(receiving[1], 'label')
+        wallet.set_label(funding_tx.txid(), 'label')
+        self.assertEqual({receiving[1]}, wallet.pop_changed_addresses())
+        change = wallet.get_change_addresses()
+        wallet.set_frozen_state([change[-1]], True)
+        self.assertEqual({change[-1]}, wallet.pop_changed_addresses())
+
+        wallet.clear_history()
+        self.assertIsNone(wallet.pop_changed_addresses())
+
     @needs_test_with_all_ecc_implementations
     @mock.patch.object(storage.WalletStorage, '_write')
     def test_sending_between_p2wpkh_and_compressed_p2pkh(self, mock_write):
@@ -872,6 +924,19 @@ class TestWalletSending(TestCaseForTestnet):
 
         wallet.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
         self.assertEqual((0, funding_output_value - 2500000 - 10000, 0), wallet.get_balance())
+        WalletIntegrityHelper.check_utxo_index_sanity(self, wallet)
+
+        # removing the replacement makes the funding output spendable again
+        wallet.remove_transaction(tx.txid())
+        self.assertEqual([funding_txid], [x['prevout_hash'] for x in wallet.get_utxos()])
+        WalletIntegrityHelper.check_utxo_index_sanity(self, wallet)
+        self.assertEqual((0, funding_output_value, 0), wallet.get_balance())
+
+        # cached balances follow height changes of the funding tx
+        wallet.add_unverified_tx(funding_txid, 1325499)
+        self.assertEqual((funding_output_value, 0, 0), wallet.get_balance())
+        wallet.add_unverified_tx(funding_txid, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual((0, funding_output_value, 0), wallet.get_balance())
 
     @needs_test_with_all_ecc_implementations
     @mock.patch.object(storage.WalletStorage, '_write')
@@ -958,6 +1023,7 @@ class TestWalletSending(TestCaseForTestnet):
 
         wallet.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
         self.assertEqual((0, funding_output_value - 2500000 - 10000, 0), wallet.get_balance())
+        WalletIntegrityHelper.check_utxo_index_sanity(self, wallet)
 
     @needs_test_with_all_ecc_implementations
     @mock.patch.object(storage.WalletStorage, '_write')
@@ -1141,6 +1207,12 @@ class TestWalletOfflineSigning(TestCaseForTestnet):
         self.assertFalse(tx.is_complete())
         self.assertTrue(tx.is_segwit())
         self.assertEqual(1, len(tx.inputs()))
+        # the preimage parts shared by all inputs are cached, but not across changes
+        preimage = tx.serialize_preimage(0)
+        tx.set_rbf(False)
+        self.assertNotEqual(preimage, tx.serialize_preimage(0))
+        tx.set_rbf(True)
+        self.assertEqual(preimage, tx.serialize_preimage(0))
         tx_copy = Transaction(tx.serialize())
         self.assertTrue(wallet_online.is_mine(wallet_online.get_txin_address(tx_copy.inputs()[0])))
 
@@ -1582,6 +1654,17 @@ class TestWalletHistory_SimpleRandomOrder(TestCaseForTestnet):
             tx = Transaction(self.transactions[self.txid_list[i]])
             w.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
         self.assertEqual(27633300, sum(w.get_balance()))
+        WalletIntegrityHelper.check_utxo_index_sanity(self, w)
+        WalletIntegrityHelper.check_history_index_sanity(self, w)
+        WalletIntegrityHelper.check_address_lookup_tables_sanity(self, w)
+
+    @mock.patch.object(storage.WalletStorage, '_write')
+    def test_history_index_after_each_tx_txorder1(self, mock_write):
+        w = self.create_old_wallet()
+        for i in [2, 12, 7, 9, 11, 10, 16, 6, 17, 1, 13, 15, 5, 8, 4, 0, 14, 18, 3]:
+            tx = Transaction(self.transactions[self.txid_list[i]])
+            w.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
+            WalletIntegrityHelper.check_history_index_sanity(self, w)
 
     @mock.patch.object(storage.WalletStorage, '_write')
     def test_restoring_old_wallet_txorder2(self, mock_write):
@@ -1590,6 +1673,9 @@ class TestWalletHistory_SimpleRandomOrder(TestCaseForTestnet):
             tx = Transaction(self.transactions[self.txid_list[i]])
             w.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
         self.assertEqual(27633300, sum(w.get_balance()))
+        WalletIntegrityHelper.check_utxo_index_sanity(self, w)
+        WalletIntegrityHelper.check_history_index_sanity(self, w)
+        WalletIntegrityHelper.check_address_lookup_tables_sanity(self, w)
 
     @mock.patch.object(storage.WalletStorage, '_write')
     def test_restoring_old_wallet_txorder3(self, mock_write):
@@ -1598,6 +1684,9 @@ class TestWalletHistory_SimpleRandomOrder(TestCaseForTestnet):
             tx = Transaction(self.transactions[self.txid_list[i]])
             w.receive_tx_callback(tx.txid(), tx, TX_HEIGHT_UNCONFIRMED)
         self.assertEqual(27633300, sum(w.get_balance()))
+        WalletIntegrityHelper.check_utxo_index_sanity(self, w)
+        WalletIntegrityHelper.check_history_index_sanity(self, w)
+        WalletIntegrityHelper.check_address_lookup_tables_sanity(self, w)
 
 
 class TestWalletHistory_EvilGapLimit(TestCaseForTestnet):
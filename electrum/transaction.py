@@ -30,6 +30,7 @@
 import struct
 import traceback
 import sys
+import functools
 from typing import (Sequence, Union, NamedTuple, Tuple, Optional, Iterable,
                     Callable, List, Dict)
 
@@ -37,8 +38,9 @@ from . import ecc, bitcoin, constants, segwit_addr
 from .util import print_error, profiler, to_bytes, bh2u, bfh
 from .bitcoin import (TYPE_ADDRESS, TYPE_PUBKEY, TYPE_SCRIPT, hash_160,
                       hash160_to_p2sh, hash160_to_p2pkh, hash_to_segwit_addr,
-                      hash_encode, var_int, TOTAL_COIN_SUPPLY_LIMIT_IN_BTC, COIN,
-                      push_script, int_to_hex, push_script, b58_address_to_hash160)
+                      hash_encode, TOTAL_COIN_SUPPLY_LIMIT_IN_BTC, COIN,
+                      push_script, b58_address_to_hash160,
+                      int_to_bytes, compact_size, push_data)
 from .crypto import sha256d
 from .keystore import xpubkey_to_address, xpubkey_to_pubkey
 
@@ -81,6 +83,21 @@ class TxOutputHwInfo(NamedTuple):
     script_type: str
 
 
+class TxLayout(NamedTuple):
+    """Where the parts of a serialized transaction are, see scan_tx."""
+    body: bytes  # network serialization (without the partial txn header)
+    partial: bool
+    version: int
+    segwit_ser: bool
+    num_inputs: int
+    inputs_start: int
+    num_outputs: int
+    outputs_start: int
+    witness_start: int
+    witness_end: int
+    locktime: int
+
+
 class BCDataStream(object):
     """Workalike python implementation of Bitcoin's CDataStream class."""
 
@@ -468,6 +485,15 @@ def parse_redeemScript_multisig(redeem_script: bytes):
 
 
 def get_address_from_output_script(_bytes: bytes, *, net=None) -> Tuple[int, str]:
+    # fast path for the common templates, without decoding the script
+    size = len(_bytes)
+    if size == 25 and _bytes[0:3] == b'\x76\xa9\x14' and _bytes[23:25] == b'\x88\xac':
+        return TYPE_ADDRESS, hash160_to_p2pkh(bytes(_bytes[3:23]), net=net)
+    if size == 23 and _bytes[0:2] == b'\xa9\x14' and _bytes[22] == opcodes.OP_EQUAL:
+        return TYPE_ADDRESS, hash160_to_p2sh(bytes(_bytes[2:22]), net=net)
+    if size in (22, 34) and _bytes[0] == opcodes.OP_0 and _bytes[1] == size - 2:
+        return TYPE_ADDRESS, hash_to_segwit_addr(bytes(_bytes[2:]), witver=0, net=net)
+
     try:
         decoded = [x for x in script_GetOp(_bytes)]
     except MalformedBitcoinScript:
@@ -530,16 +556,21 @@ def parse_input(vds, full_parse: bool):
     return d
 
 
-def construct_witness(items: Sequence[Union[str, int, bytes]]) -> str:
+def construct_witness_bytes(items: Sequence[Union[str, int, bytes]]) -> bytes:
     """Constructs a witness from the given stack items."""
-    witness = var_int(len(items))
+    witness = bytearray(compact_size(len(items)))
     for item in items:
         if type(item) is int:
-            item = bitcoin.script_num_to_hex(item)
-        elif type(item) is bytes:
-            item = bh2u(item)
-        witness += bitcoin.witness_push(item)
-    return witness
+            item = bfh(bitcoin.script_num_to_hex(item))
+        elif type(item) is str:
+            item = bfh(item)
+        witness += compact_size(len(item))
+        witness += item
+    return bytes(witness)
+
+
+def construct_witness(items: Sequence[Union[str, int, bytes]]) -> str:
+    return bh2u(construct_witness_bytes(items))
 
 
 def parse_witness(vds, txin, full_parse: bool):
@@ -596,36 +627,58 @@ def parse_witness(vds, txin, full_parse: bool):
         print_error('failed to parse witness', txin.get('witness'))
 
 
-def parse_output(vds, i):
-    d = {}
-    d['value'] = vds.read_int64()
-    if d['value'] > TOTAL_COIN_SUPPLY_LIMIT_IN_BTC * COIN:
+def _read_output_value(vds) -> int:
+    value = vds.read_int64()
+    if value > TOTAL_COIN_SUPPLY_LIMIT_IN_BTC * COIN:
         raise SerializationError('invalid output amount (too large)')
-    if d['value'] < 0:
+    if value < 0:
         raise SerializationError('invalid output amount (negative)')
+    return value
+
+
+@functools.lru_cache(maxsize=10000)
+def _get_address_from_output_script_cached(script: bytes, net) -> Tuple[int, str]:
+    # the same scripts (e.g. the wallet's own) show up again and again
+    return get_address_from_output_script(script, net=net)
+
+
+def parse_output(vds, i):
+    d = {}
+    d['value'] = _read_output_value(vds)
     scriptPubKey = vds.read_bytes(vds.read_compact_size())
-    d['type'], d['address'] = get_address_from_output_script(scriptPubKey)
+    d['type'], d['address'] = _get_address_from_output_script_cached(scriptPubKey, constants.net)
     d['scriptPubKey'] = bh2u(scriptPubKey)
     d['prevout_n'] = i
     return d
 
 
-def deserialize(raw: str, force_full_parse=False) -> dict:
-    raw_bytes = bfh(raw)
-    d = {}
+def _read_stream(body: bytes, start: int) -> BCDataStream:
+    vds = BCDataStream()
+    vds.input = body  # only read from, so it is not copied
+    vds.read_cursor = start
+    return vds
+
+
+def _skip_bytes(vds, length: int):
+    vds.read_cursor += length
+    if vds.read_cursor > len(vds.input):
+        raise SerializationError("attempt to read past end of buffer")
+
+
+def scan_tx(raw_bytes: bytes) -> TxLayout:
+    """Finds where the inputs, outputs and witnesses of a serialized
+    transaction are, without parsing them."""
     if raw_bytes[:5] == PARTIAL_TXN_HEADER_MAGIC:
-        d['partial'] = is_partial = True
+        is_partial = True
         partial_format_version = raw_bytes[5]
         if partial_format_version != 0:
             raise SerializationError('unknown tx partial serialization format version: {}'
                                      .format(partial_format_version))
         raw_bytes = raw_bytes[6:]
     else:
-        d['partial'] = is_partial = False
-    full_parse = force_full_parse or is_partial
-    vds = BCDataStream()
-    vds.write(raw_bytes)
-    d['version'] = vds.read_int32()
+        is_partial = False
+    vds = _read_stream(raw_bytes, 0)
+    version = vds.read_int32()
     n_vin = vds.read_compact_size()
     is_segwit = (n_vin == 0)
     if is_segwit:
@@ -633,20 +686,80 @@ def deserialize(raw: str, force_full_parse=False) -> dict:
         if marker != b'\x01':
             raise ValueError('invalid txn marker byte: {}'.format(marker))
         n_vin = vds.read_compact_size()
-    d['segwit_ser'] = is_segwit
-    d['inputs'] = [parse_input(vds, full_parse=full_parse) for i in range(n_vin)]
+    inputs_start = vds.read_cursor
+    for i in range(n_vin):
+        _skip_bytes(vds, 36)  # prevout
+        _skip_bytes(vds, vds.read_compact_size() + 4)  # scriptSig, sequence
     n_vout = vds.read_compact_size()
-    d['outputs'] = [parse_output(vds, i) for i in range(n_vout)]
+    outputs_start = vds.read_cursor
+    for i in range(n_vout):
+        _skip_bytes(vds, 8)  # value
+        _skip_bytes(vds, vds.read_compact_size())  # scriptPubKey
+    witness_start = vds.read_cursor
     if is_segwit:
         for i in range(n_vin):
-            txin = d['inputs'][i]
-            parse_witness(vds, txin, full_parse=full_parse)
-    d['lockTime'] = vds.read_uint32()
+            n = vds.read_compact_size()
+            if n == 0xffffffff:
+                _skip_bytes(vds, 8 + 2)  # value, witness_version
+                n = vds.read_compact_size()
+            for j in range(n):
+                _skip_bytes(vds, vds.read_compact_size())
+    witness_end = vds.read_cursor
+    locktime = vds.read_uint32()
     if vds.can_read_more():
         raise SerializationError('extra junk at the end')
+    return TxLayout(body=raw_bytes, partial=is_partial, version=version, segwit_ser=is_segwit,
+                    num_inputs=n_vin, inputs_start=inputs_start,
+                    num_outputs=n_vout, outputs_start=outputs_start,
+                    witness_start=witness_start, witness_end=witness_end, locktime=locktime)
+
+
+def parse_inputs(layout: TxLayout, full_parse: bool) -> List[dict]:
+    vds = _read_stream(layout.body, layout.inputs_start)
+    inputs = [parse_input(vds, full_parse=full_parse) for i in range(layout.num_inputs)]
+    if layout.segwit_ser:
+        vds.read_cursor = layout.witness_start
+        for txin in inputs:
+            parse_witness(vds, txin, full_parse=full_parse)
+    return inputs
+
+
+def parse_outputs(layout: TxLayout) -> List[dict]:
+    vds = _read_stream(layout.body, layout.outputs_start)
+    return [parse_output(vds, i) for i in range(layout.num_outputs)]
+
+
+def parse_tx_outputs(layout: TxLayout) -> List[TxOutput]:
+    vds = _read_stream(layout.body, layout.outputs_start)
+    outputs = []
+    for i in range(layout.num_outputs):
+        value = _read_output_value(vds)
+        scriptPubKey = vds.read_bytes(vds.read_compact_size())
+        _type, address = _get_address_from_output_script_cached(scriptPubKey, constants.net)
+        outputs.append(TxOutput(_type, address, value))
+    return outputs
+
+
+def deserialize(raw: Union[str, bytes], force_full_parse=False) -> dict:
+    raw_bytes = bfh(raw) if isinstance(raw, str) else bytes(raw)
+    layout = scan_tx(raw_bytes)
+    d = {}
+    d['partial'] = layout.partial
+    d['version'] = layout.version
+    d['segwit_ser'] = layout.segwit_ser
+    d['inputs'] = parse_inputs(layout, full_parse=force_full_parse or layout.partial)
+    d['outputs'] = parse_outputs(layout)
+    d['lockTime'] = layout.locktime
     return d
 
 
+# Input types for which Transaction.estimated_input_sizes can reuse
+# the sizes of another input with the same keys and signatures.
+INPUT_SIZE_TEMPLATE_TYPES = ('p2pk', 'p2pkh', 'p2sh', 'p2wpkh', 'p2wpkh-p2sh', 'p2wsh', 'p2wsh-p2sh')
+# (txin type, segwit, num_sig, number of pubkeys, pubkey size) -> sizes
+_input_size_templates = {}  # type: Dict[tuple, Tuple[int, Optional[int]]]
+
+
 # pay & redeem scripts
 
 def multisig_script(public_keys: Sequence[str], m: int) -> str:
@@ -678,8 +791,16 @@ class Transaction:
             raise Exception("cannot initialize transaction", raw)
         self._inputs = None
         self._outputs = None  # type: List[TxOutput]
-        self.locktime = 0
-        self.version = 1
+        # inputs and outputs are parsed separately, on first access
+        self._layout = None  # type: Optional[TxLayout]
+        self._layout_raw = None  # the raw tx that _layout was computed from
+        # parts of the signature preimages shared by all inputs, see serialize_preimage
+        self._preimage_cache = {}
+        # (raw, {witness: id}): txid and wtxid of the raw tx they were computed for.
+        # Methods that change the tx drop self.raw, see _invalidate_raw
+        self._ids_cache = (None, {})
+        self._locktime = 0
+        self._version = 1
         # by default we assume this is a partial txn;
         # this value will get properly set when deserializing
         self.is_partial_originally = True
@@ -689,16 +810,65 @@ class Transaction:
     def update(self, raw):
         self.raw = raw
         self._inputs = None
+        self._outputs = None
+        self._preimage_cache.clear()
         self.deserialize()
 
+    def _get_layout(self) -> Optional[TxLayout]:
+        if self.raw is None:
+            return None
+        if self._layout is None or self._layout_raw is not self.raw:
+            layout = scan_tx(bfh(self.raw))
+            self._layout, self._layout_raw = layout, self.raw
+            self._locktime = layout.locktime
+            self._version = layout.version
+            self.is_partial_originally = layout.partial
+            self._segwit_ser = layout.segwit_ser
+        return self._layout
+
+    def _invalidate_raw(self):
+        """Called when the tx is about to change: it will be serialized
+        again from its fields, and its ids computed again."""
+        if self.raw is not None:
+            # parse what is still only in the raw tx
+            self.deserialize()
+        self.raw = None
+        self._ids_cache = (None, {})
+
+    @property
+    def locktime(self) -> int:
+        self._get_layout()
+        return self._locktime
+
+    @locktime.setter
+    def locktime(self, locktime: int):
+        if locktime != self.locktime:
+            self._invalidate_raw()
+        self._locktime = locktime
+
+    @property
+    def version(self) -> int:
+        self._get_layout()
+        return self._version
+
+    @version.setter
+    def version(self, version: int):
+        if version != self.version:
+            self._invalidate_raw()
+        self._version = version
+
     def inputs(self):
         if self._inputs is None:
-            self.deserialize()
+            layout = self._get_layout()
+            if layout is not None:
+                self._inputs = parse_inputs(layout, full_parse=layout.partial)
         return self._inputs
 
     def outputs(self) -> List[TxOutput]:
         if self._outputs is None:
-            self.deserialize()
+            layout = self._get_layout()
+            if layout is not None:
+                self._outputs = parse_tx_outputs(layout)
         return self._outputs
 
     @classmethod
@@ -724,6 +894,7 @@ class Transaction:
         """
         if self.is_complete():
             return
+        self._preimage_cache.clear()
         if len(self.inputs()) != len(signatures):
             raise Exception('expected {} signatures; got {}'.format(len(self.inputs()), len(signatures)))
         for i, txin in enumerate(self.inputs()):
@@ -731,7 +902,7 @@ class Transaction:
             sig = signatures[i]
             if sig in txin.get('signatures'):
                 continue
-            pre_hash = sha256d(bfh(self.serialize_preimage(i)))
+            pre_hash = sha256d(self.serialize_preimage_bytes(i))
             sig_string = ecc.sig_string_from_der_sig(bfh(sig[:-2]))
             for recid in range(4):
                 try:
@@ -754,11 +925,11 @@ class Transaction:
         self.raw = self.serialize()
 
     def add_signature_to_txin(self, i, signingPos, sig):
+        self._invalidate_raw()
         txin = self._inputs[i]
         txin['signatures'][signingPos] = sig
         txin['scriptSig'] = None  # force re-serialization
         txin['witness'] = None    # force re-serialization
-        self.raw = None
 
     def add_inputs_info(self, wallet):
         if self.is_complete():
@@ -767,6 +938,7 @@ class Transaction:
             wallet.add_input_info(txin)
 
     def remove_signatures(self):
+        self._invalidate_raw()
         for txin in self.inputs():
             txin['signatures'] = [None] * len(txin['signatures'])
         assert not self.is_complete()
@@ -775,15 +947,21 @@ class Transaction:
         if self.raw is None:
             return
             #self.raw = self.serialize()
-        if self._inputs is not None:
+        if self._inputs is not None and self._outputs is not None:
             return
-        d = deserialize(self.raw, force_full_parse)
-        self._inputs = d['inputs']
-        self._outputs = [TxOutput(x['type'], x['address'], x['value']) for x in d['outputs']]
-        self.locktime = d['lockTime']
-        self.version = d['version']
-        self.is_partial_originally = d['partial']
-        self._segwit_ser = d['segwit_ser']
+        layout = self._get_layout()
+        d = {}
+        d['partial'] = layout.partial
+        d['version'] = layout.version
+        d['segwit_ser'] = layout.segwit_ser
+        d['inputs'] = parse_inputs(layout, full_parse=force_full_parse or layout.partial)
+        d['outputs'] = parse_outputs(layout)
+        d['lockTime'] = layout.locktime
+        self._preimage_cache.clear()
+        if self._inputs is None:
+            self._inputs = d['inputs']
+        if self._outputs is None:
+            self._outputs = [TxOutput(x['type'], x['address'], x['value']) for x in d['outputs']]
         return d
 
     @classmethod
@@ -859,12 +1037,12 @@ class Transaction:
         return pk_list, sig_list
 
     @classmethod
-    def serialize_witness(self, txin, estimate_size=False):
+    def serialize_witness_bytes(self, txin, estimate_size=False) -> bytes:
         _type = txin['type']
         if not self.is_segwit_input(txin) and not txin['type'] == 'address':
-            return '00'
+            return b'\x00'
         if _type == 'coinbase':
-            return txin['witness']
+            return bfh(txin['witness'])
 
         witness = txin.get('witness', None)
         if witness is None or estimate_size:
@@ -872,21 +1050,26 @@ class Transaction:
                 _type = self.guess_txintype_from_address(txin['address'])
             pubkeys, sig_list = self.get_siglist(txin, estimate_size)
             if _type in ['p2wpkh', 'p2wpkh-p2sh']:
-                witness = construct_witness([sig_list[0], pubkeys[0]])
+                witness = construct_witness_bytes([sig_list[0], pubkeys[0]])
             elif _type in ['p2wsh', 'p2wsh-p2sh']:
                 witness_script = multisig_script(pubkeys, txin['num_sig'])
-                witness = construct_witness([0] + sig_list + [witness_script])
+                witness = construct_witness_bytes([0] + sig_list + [witness_script])
             else:
-                witness = txin.get('witness', '00')
+                witness = bfh(txin.get('witness', '00'))
+        else:
+            witness = bfh(witness)
 
         if self.is_txin_complete(txin) or estimate_size:
-            partial_format_witness_prefix = ''
-        else:
-            input_value = int_to_hex(txin['value'], 8)
-            witness_version = int_to_hex(txin.get('witness_version', 0), 2)
-            partial_format_witness_prefix = var_int(0xffffffff) + input_value + witness_version
+            return witness
+        input_value = int_to_bytes(txin['value'], 8)
+        witness_version = int_to_bytes(txin.get('witness_version', 0), 2)
+        partial_format_witness_prefix = compact_size(0xffffffff) + input_value + witness_version
         return partial_format_witness_prefix + witness
 
+    @classmethod
+    def serialize_witness(self, txin, estimate_size=False) -> str:
+        return bh2u(self.serialize_witness_bytes(txin, estimate_size))
+
     @classmethod
     def is_segwit_input(cls, txin, guess_for_address=False):
         _type = txin['type']
@@ -920,10 +1103,12 @@ class Transaction:
             return 'p2wpkh-p2sh'
 
     @classmethod
-    def input_script(self, txin, estimate_size=False):
+    def input_script_bytes(self, txin, estimate_size=False) -> bytes:
+        """Returns the scriptSig of txin.
+        Subclasses that need a custom scriptSig override this method."""
         _type = txin['type']
         if _type == 'coinbase':
-            return txin['scriptSig']
+            return bfh(txin['scriptSig'])
 
         # If there is already a saved scriptSig, just return that.
         # This allows manual creation of txins of any custom type.
@@ -931,40 +1116,44 @@ class Transaction:
         # saved from our partial txn ser format, so we re-serialize then.
         script_sig = txin.get('scriptSig', None)
         if script_sig is not None and self.is_txin_complete(txin):
-            return script_sig
+            return bfh(script_sig)
 
         pubkeys, sig_list = self.get_siglist(txin, estimate_size)
-        script = ''.join(push_script(x) for x in sig_list)
+        script = b''.join(push_data(bfh(x)) for x in sig_list)
         if _type == 'address' and estimate_size:
             _type = self.guess_txintype_from_address(txin['address'])
         if _type == 'p2pk':
             pass
         elif _type == 'p2sh':
             # put op_0 before script
-            script = '00' + script
+            script = b'\x00' + script
             redeem_script = multisig_script(pubkeys, txin['num_sig'])
-            script += push_script(redeem_script)
+            script += push_data(bfh(redeem_script))
         elif _type == 'p2pkh':
-            script += push_script(pubkeys[0])
+            script += push_data(bfh(pubkeys[0]))
         elif _type in ['p2wpkh', 'p2wsh']:
-            return ''
+            return b''
         elif _type == 'p2wpkh-p2sh':
             pubkey = safe_parse_pubkey(pubkeys[0])
             scriptSig = bitcoin.p2wpkh_nested_script(pubkey)
-            return push_script(scriptSig)
+            return push_data(bfh(scriptSig))
         elif _type == 'p2wsh-p2sh':
             if estimate_size:
                 witness_script = ''
             else:
                 witness_script = self.get_preimage_script(txin)
             scriptSig = bitcoin.p2wsh_nested_script(witness_script)
-            return push_script(scriptSig)
+            return push_data(bfh(scriptSig))
         elif _type == 'address':
-            return 'ff00' + push_script(pubkeys[0])  # fd extended pubkey
+            return b'\xff\x00' + push_data(bfh(pubkeys[0]))  # fd extended pubkey
         elif _type == 'unknown':
-            return txin['scriptSig']
+            return bfh(txin['scriptSig'])
         return script
 
+    @classmethod
+    def input_script(self, txin, estimate_size=False) -> str:
+        return bh2u(self.input_script_bytes(txin, estimate_size))
+
     @classmethod
     def is_txin_complete(cls, txin):
         if txin['type'] == 'coinbase':
@@ -998,8 +1187,12 @@ class Transaction:
             raise TypeError('Unknown txin type', txin['type'])
 
     @classmethod
-    def serialize_outpoint(self, txin):
-        return bh2u(bfh(txin['prevout_hash'])[::-1]) + int_to_hex(txin['prevout_n'], 4)
+    def serialize_outpoint_bytes(self, txin) -> bytes:
+        return bfh(txin['prevout_hash'])[::-1] + int_to_bytes(txin['prevout_n'], 4)
+
+    @classmethod
+    def serialize_outpoint(self, txin) -> str:
+        return bh2u(self.serialize_outpoint_bytes(txin))
 
     @classmethod
     def get_outpoint_from_txin(cls, txin):
@@ -1010,116 +1203,180 @@ class Transaction:
         return prevout_hash + ':%d' % prevout_n
 
     @classmethod
-    def serialize_input(self, txin, script):
+    def serialize_input_bytes(self, txin, script: bytes) -> bytes:
         # Prev hash and index
-        s = self.serialize_outpoint(txin)
+        s = self.serialize_outpoint_bytes(txin)
         # Script length, script, sequence
-        s += var_int(len(script)//2)
+        s += compact_size(len(script))
         s += script
-        s += int_to_hex(txin.get('sequence', 0xffffffff - 1), 4)
+        s += int_to_bytes(txin.get('sequence', 0xffffffff - 1), 4)
         return s
 
+    @classmethod
+    def serialize_input(self, txin, script: str) -> str:
+        return bh2u(self.serialize_input_bytes(txin, bfh(script)))
+
     def set_rbf(self, rbf):
         nSequence = 0xffffffff - (2 if rbf else 1)
+        self._invalidate_raw()
+        self._preimage_cache.clear()
         for txin in self.inputs():
             txin['sequence'] = nSequence
 
     def BIP69_sort(self, inputs=True, outputs=True):
+        self._invalidate_raw()
+        self._preimage_cache.clear()
         if inputs:
             self._inputs.sort(key = lambda i: (i['prevout_hash'], i['prevout_n']))
         if outputs:
             self._outputs.sort(key = lambda o: (o.value, self.pay_script(o.type, o.address)))
 
     @classmethod
-    def serialize_output(cls, output: TxOutput) -> str:
-        s = int_to_hex(output.value, 8)
-        script = cls.pay_script(output.type, output.address)
-        s += var_int(len(script)//2)
+    def serialize_output_bytes(cls, output: TxOutput) -> bytes:
+        s = int_to_bytes(output.value, 8)
+        script = bfh(cls.pay_script(output.type, output.address))
+        s += compact_size(len(script))
         s += script
         return s
 
-    def serialize_preimage(self, i):
-        nVersion = int_to_hex(self.version, 4)
-        nHashType = int_to_hex(1, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
+    @classmethod
+    def serialize_output(cls, output: TxOutput) -> str:
+        return bh2u(cls.serialize_output_bytes(output))
+
+    def _get_preimage_part(self, name: str, compute: Callable[[], bytes]) -> bytes:
+        # these only depend on the inputs and outputs, and are the same for all
+        # inputs: without caching, signing would be quadratic in the number of inputs.
+        # note: the cache is cleared when the tx changes through its own methods;
+        #       callers that edit the inputs or outputs in place must not rely on it.
+        value = self._preimage_cache.get(name)
+        if value is None:
+            value = self._preimage_cache[name] = compute()
+        return value
+
+    def serialize_preimage_bytes(self, i) -> bytes:
+        nVersion = int_to_bytes(self.version, 4)
+        nHashType = int_to_bytes(1, 4)
+        nLocktime = int_to_bytes(self.locktime, 4)
         inputs = self.inputs()
         outputs = self.outputs()
         txin = inputs[i]
-        # TODO: py3 hex
+        serialized_outputs = lambda: self._get_preimage_part(
+            'outputs', lambda: b''.join(self.serialize_output_bytes(o) for o in outputs))
         if self.is_segwit_input(txin):
-            hashPrevouts = bh2u(sha256d(bfh(''.join(self.serialize_outpoint(txin) for txin in inputs))))
-            hashSequence = bh2u(sha256d(bfh(''.join(int_to_hex(txin.get('sequence', 0xffffffff - 1), 4) for txin in inputs))))
-            hashOutputs = bh2u(sha256d(bfh(''.join(self.serialize_output(o) for o in outputs))))
-            outpoint = self.serialize_outpoint(txin)
-            preimage_script = self.get_preimage_script(txin)
-            scriptCode = var_int(len(preimage_script) // 2) + preimage_script
-            amount = int_to_hex(txin['value'], 8)
-            nSequence = int_to_hex(txin.get('sequence', 0xffffffff - 1), 4)
+            hashPrevouts = self._get_preimage_part('hashPrevouts', lambda: sha256d(
+                b''.join(self.serialize_outpoint_bytes(txin) for txin in inputs)))
+            hashSequence = self._get_preimage_part('hashSequence', lambda: sha256d(
+                b''.join(int_to_bytes(txin.get('sequence', 0xffffffff - 1), 4) for txin in inputs)))
+            hashOutputs = self._get_preimage_part('hashOutputs', lambda: sha256d(serialized_outputs()))
+            outpoint = self.serialize_outpoint_bytes(txin)
+            preimage_script = bfh(self.get_preimage_script(txin))
+            scriptCode = compact_size(len(preimage_script)) + preimage_script
+            amount = int_to_bytes(txin['value'], 8)
+            nSequence = int_to_bytes(txin.get('sequence', 0xffffffff - 1), 4)
             preimage = nVersion + hashPrevouts + hashSequence + outpoint + scriptCode + amount + nSequence + hashOutputs + nLocktime + nHashType
         else:
-            txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, self.get_preimage_script(txin) if i==k else '') for k, txin in enumerate(inputs))
-            txouts = var_int(len(outputs)) + ''.join(self.serialize_output(o) for o in outputs)
-            preimage = nVersion + txins + txouts + nLocktime + nHashType
+            preimage = bytearray(nVersion)
+            preimage += compact_size(len(inputs))
+            for k, txin in enumerate(inputs):
+                script = bfh(self.get_preimage_script(txin)) if i == k else b''
+                preimage += self.serialize_input_bytes(txin, script)
+            preimage += compact_size(len(outputs))
+            preimage += serialized_outputs()
+            preimage += nLocktime + nHashType
+            preimage = bytes(preimage)
         return preimage
 
+    def serialize_preimage(self, i) -> str:
+        return bh2u(self.serialize_preimage_bytes(i))
+
     def is_segwit(self, guess_for_address=False):
         if not self.is_partial_originally:
             return self._segwit_ser
         return any(self.is_segwit_input(x, guess_for_address=guess_for_address) for x in self.inputs())
 
     def serialize(self, estimate_size=False, witness=True):
-        network_ser = self.serialize_to_network(estimate_size, witness)
+        network_ser = self.serialize_to_network_bytes(estimate_size, witness)
         if estimate_size:
-            return network_ser
+            return bh2u(network_ser)
         if self.is_partial_originally and not self.is_complete():
-            partial_format_version = '00'
-            return bh2u(PARTIAL_TXN_HEADER_MAGIC) + partial_format_version + network_ser
+            partial_format_version = b'\x00'
+            return bh2u(PARTIAL_TXN_HEADER_MAGIC + partial_format_version + network_ser)
         else:
-            return network_ser
+            return bh2u(network_ser)
 
-    def serialize_to_network(self, estimate_size=False, witness=True):
+    def serialize_to_network_bytes(self, estimate_size=False, witness=True) -> bytes:
         self.deserialize()
-        nVersion = int_to_hex(self.version, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
         inputs = self.inputs()
         outputs = self.outputs()
-        txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, self.input_script(txin, estimate_size)) for txin in inputs)
-        txouts = var_int(len(outputs)) + ''.join(self.serialize_output(o) for o in outputs)
         use_segwit_ser_for_estimate_size = estimate_size and self.is_segwit(guess_for_address=True)
         use_segwit_ser_for_actual_use = not estimate_size and \
                                         (self.is_segwit() or any(txin['type'] == 'address' for txin in inputs))
         use_segwit_ser = use_segwit_ser_for_estimate_size or use_segwit_ser_for_actual_use
-        if witness and use_segwit_ser:
-            marker = '00'
-            flag = '01'
-            witness = ''.join(self.serialize_witness(x, estimate_size) for x in inputs)
-            return nVersion + marker + flag + txins + txouts + witness + nLocktime
+        include_witness = witness and use_segwit_ser
+        buf = bytearray(int_to_bytes(self.version, 4))
+        if include_witness:
+            buf += b'\x00\x01'  # marker and flag
+        buf += compact_size(len(inputs))
+        for txin in inputs:
+            buf += self.serialize_input_bytes(txin, self.input_script_bytes(txin, estimate_size))
+        buf += compact_size(len(outputs))
+        for o in outputs:
+            buf += self.serialize_output_bytes(o)
+        if include_witness:
+            for txin in inputs:
+                buf += self.serialize_witness_bytes(txin, estimate_size)
+        buf += int_to_bytes(self.locktime, 4)
+        return bytes(buf)
+
+    def serialize_to_network(self, estimate_size=False, witness=True) -> str:
+        return bh2u(self.serialize_to_network_bytes(estimate_size, witness))
+
+    def _compute_id(self, witness: bool) -> Optional[str]:
+        layout = self._get_layout()
+        if layout is not None and not layout.partial:
+            # network format: hash the raw tx, no need to serialize it again
+            body = layout.body
+            if layout.segwit_ser and not witness:
+                # skip marker and flag, and the witnesses
+                body = body[0:4] + body[6:layout.witness_start] + body[layout.witness_end:]
+            return bh2u(sha256d(body)[::-1])
+        self.deserialize()
+        if witness:
+            if not self.is_complete():
+                return None
         else:
-            return nVersion + txins + txouts + nLocktime
+            all_segwit = all(self.is_segwit_input(x) for x in self.inputs())
+            if not all_segwit and not self.is_complete():
+                return None
+        ser = self.serialize_to_network_bytes(witness=witness)
+        return bh2u(sha256d(ser)[::-1])
+
+    def _get_id(self, witness: bool) -> Optional[str]:
+        # memoized as long as self.raw does not change
+        raw = self.raw
+        if raw is None:
+            return self._compute_id(witness)
+        if self._ids_cache[0] is not raw:
+            self._ids_cache = (raw, {})
+        ids = self._ids_cache[1]
+        if witness not in ids:
+            ids[witness] = self._compute_id(witness)
+        return ids[witness]
 
     def txid(self):
-        self.deserialize()
-        all_segwit = all(self.is_segwit_input(x) for x in self.inputs())
-        if not all_segwit and not self.is_complete():
-            return None
-        ser = self.serialize_to_network(witness=False)
-        return bh2u(sha256d(bfh(ser))[::-1])
+        return self._get_id(witness=False)
 
     def wtxid(self):
-        self.deserialize()
-        if not self.is_complete():
-            return None
-        ser = self.serialize_to_network(witness=True)
-        return bh2u(sha256d(bfh(ser))[::-1])
+        return self._get_id(witness=True)
 
     def add_inputs(self, inputs):
+        self._invalidate_raw()
         self._inputs.extend(inputs)
-        self.raw = None
         self.BIP69_sort(outputs=False)
 
     def add_outputs(self, outputs):
+        self._invalidate_raw()
         self._outputs.extend(outputs)
-        self.raw = None
         self.BIP69_sort(inputs=False)
 
     def input_value(self):
@@ -1145,16 +1402,38 @@ class Transaction:
         return self.virtual_size_from_weight(weight)
 
     @classmethod
-    def estimated_input_weight(cls, txin, is_segwit_tx):
-        '''Return an estimate of serialized input weight in weight units.'''
-        script = cls.input_script(txin, True)
-        input_size = len(cls.serialize_input(txin, script)) // 2
-
+    def _estimated_input_sizes(cls, txin):
+        script = cls.input_script_bytes(txin, True)
+        input_size = len(cls.serialize_input_bytes(txin, script))
         if cls.is_segwit_input(txin, guess_for_address=True):
-            witness_size = len(cls.serialize_witness(txin, True)) // 2
+            witness_size = len(cls.serialize_witness_bytes(txin, True))
         else:
-            witness_size = 1 if is_segwit_tx else 0
+            witness_size = None
+        return input_size, witness_size
+
+    @classmethod
+    def estimated_input_sizes(cls, txin) -> Tuple[int, Optional[int]]:
+        '''Return estimates of the serialized size of an input and of its
+        witness (None if it does not use segwit), in bytes.
+        Inputs of the usual types that have no saved scriptSig only depend
+        on the number and size of their keys and signatures; their sizes
+        are computed once per such template.'''
+        _type = txin['type']
+        if _type not in INPUT_SIZE_TEMPLATE_TYPES or txin.get('scriptSig') is not None:
+            return cls._estimated_input_sizes(txin)
+        key = (_type, cls.is_segwit_input(txin), txin.get('num_sig', 1),
+               len(txin.get('x_pubkeys', [None])), cls.estimate_pubkey_size_for_txin(txin))
+        sizes = _input_size_templates.get(key)
+        if sizes is None:
+            sizes = _input_size_templates[key] = cls._estimated_input_sizes(txin)
+        return sizes
 
+    @classmethod
+    def estimated_input_weight(cls, txin, is_segwit_tx):
+        '''Return an estimate of serialized input weight in weight units.'''
+        input_size, witness_size = cls.estimated_input_sizes(txin)
+        if witness_size is None:
+            witness_size = 1 if is_segwit_tx else 0
         return 4 * input_size + witness_size
 
     @classmethod
@@ -1170,7 +1449,9 @@ class Transaction:
 
     def estimated_total_size(self):
         """Return an estimated total transaction size in bytes."""
-        return len(self.serialize(True)) // 2 if not self.is_complete() or self.raw is None else len(self.raw) // 2  # ASCII hex string
+        if not self.is_complete() or self.raw is None:
+            return len(self.serialize_to_network_bytes(estimate_size=True))
+        return len(self.raw) // 2  # ASCII hex string
 
     def estimated_witness_size(self):
         """Return an estimate of witness size in bytes."""
@@ -1178,8 +1459,8 @@ class Transaction:
         if not self.is_segwit(guess_for_address=estimate):
             return 0
         inputs = self.inputs()
-        witness = ''.join(self.serialize_witness(x, estimate) for x in inputs)
-        witness_size = len(witness) // 2 + 2  # include marker and flag
+        witness_size = sum(len(self.serialize_witness_bytes(x, estimate)) for x in inputs)
+        witness_size += 2  # include marker and flag
         return witness_size
 
     def estimated_base_size(self):
@@ -1209,6 +1490,7 @@ class Transaction:
 
     def sign(self, keypairs) -> None:
         # keypairs:  (x_)pubkey -> secret_bytes
+        self._preimage_cache.clear()
         for i, txin in enumerate(self.inputs()):
             pubkeys, x_pubkeys = self.get_sorted_pubkeys(txin)
             for j, (pubkey, x_pubkey) in enumerate(zip(pubkeys, x_pubkeys)):
@@ -1229,7 +1511,7 @@ class Transaction:
         self.raw = self.serialize()
 
     def sign_txin(self, txin_index, privkey_bytes) -> str:
-        pre_hash = sha256d(bfh(self.serialize_preimage(txin_index)))
+        pre_hash = sha256d(self.serialize_preimage_bytes(txin_index))
         privkey = ecc.ECPrivkey(privkey_bytes)
         sig = privkey.sign_transaction(pre_hash)
         sig = bh2u(sig) + '01'
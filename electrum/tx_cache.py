@@ -0,0 +1,62 @@
+# Electrum - Lightweight Bitcoin Client
+# Copyright (c) 2018 The Electrum Developers
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from .util import PrintError
+
+
+class TxCache(PrintError):
+    """Raw transactions by txid, shared by all the wallets of the process.
+
+    The most recently used transactions are kept in memory only. Nothing
+    is written to disk: wallets may be encrypted, and their transactions
+    must not leak into the data directory in plaintext.
+    Callers must only add transactions whose txid they have checked.
+    """
+
+    def __init__(self, config, memory_size: int = None):
+        if memory_size is None:
+            memory_size = config.get('tx_cache_memory_size', 1000)
+        self.memory_size = max(0, memory_size)
+        self._memory = OrderedDict()  # txid -> raw tx, least recently used first
+        self.lock = threading.Lock()
+
+    def get(self, txid: str) -> Optional[str]:
+        with self.lock:
+            raw = self._memory.get(txid)
+            if raw is not None:
+                self._memory.move_to_end(txid)
+            return raw
+
+    def put(self, txid: str, raw: str):
+        with self.lock:
+            self._memory[txid] = raw
+            self._memory.move_to_end(txid)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def __contains__(self, txid: str) -> bool:
+        with self.lock:
+            return txid in self._memory
@@ -930,6 +930,8 @@ class NetworkJobOnDefaultServer(PrintError):
         raise NotImplementedError()  # implemented by subclasses
 
     async def stop(self):
+        """Stops the job for good, it will not be restarted."""
+        self.network.unregister_callback(self._restart)
         await self.group.cancel_remaining()
 
     @log_exceptions
@@ -939,7 +941,7 @@ class NetworkJobOnDefaultServer(PrintError):
             return  # we should get called again soon
 
         async with self._restart_lock:
-            await self.stop()
+            await self.group.cancel_remaining()
             self._reset()
             await self._start(interface)
 
@@ -22,7 +22,9 @@
 # SOFTWARE.
 
 import asyncio
-from typing import Sequence, Optional, TYPE_CHECKING
+import time
+from collections import defaultdict
+from typing import Sequence, Optional, TYPE_CHECKING, List, Tuple
 
 import aiorpcx
 
@@ -39,6 +41,10 @@ if TYPE_CHECKING:
     from .address_synchronizer import AddressSynchronizer
 
 
+# while verifying many txs, results are written to disk at least this often (seconds)
+VERIFIED_TX_SAVE_INTERVAL = 10
+
+
 class MerkleVerificationFailure(Exception): pass
 class MissingBlockHeader(MerkleVerificationFailure): pass
 class MerkleRootMismatch(MerkleVerificationFailure): pass
@@ -50,12 +56,30 @@ class SPV(NetworkJobOnDefaultServer):
 
     def __init__(self, network: 'Network', wallet: 'AddressSynchronizer'):
         self.wallet = wallet
+        # max number of merkle proofs requested in one batch
+        self.batch_size = max(1, network.config.get('spv_batch_size', 100))
+        self._last_save_time = time.time()
         NetworkJobOnDefaultServer.__init__(self, network)
+        network.register_callback(self._on_blockchain_updated, ['blockchain_updated', 'network_updated'])
 
     def _reset(self):
         super()._reset()
         self.merkle_roots = {}  # txid -> merkle root (once it has been verified)
         self.requested_merkle = set()  # txid set of pending requests
+        self.requested_chunks = set()  # chunk indexes being fetched
+        # set when main() should look for work again
+        self._update_event = asyncio.Event()
+
+    def trigger_update(self):
+        """Makes main() rescan the unverified txs. Can be called from any thread."""
+        self.network.asyncio_loop.call_soon_threadsafe(self._update_event.set)
+
+    def _on_blockchain_updated(self, event, *args):
+        self._update_event.set()
+
+    async def stop(self):
+        self.network.unregister_callback(self._on_blockchain_updated)
+        await super().stop()
 
     async def _start_tasks(self):
         async with self.group as group:
@@ -67,14 +91,20 @@ class SPV(NetworkJobOnDefaultServer):
     async def main(self):
         self.blockchain = self.network.blockchain()
         while True:
+            self._update_event.clear()
             await self._maybe_undo_verifications()
             await self._request_proofs()
+            # wait for new unverified txs, headers or a switch of chain
+            await self._update_event.wait()
+            # let a burst of events accumulate
             await asyncio.sleep(0.1)
 
     async def _request_proofs(self):
         local_height = self.blockchain.height()
         unverified = self.wallet.get_unverified_txs()
 
+        # group by height, so that each header is read once
+        txs_by_height = defaultdict(list)
         for tx_hash, tx_height in unverified.items():
             # do not request merkle branch if we already requested it
             if tx_hash in self.requested_merkle or tx_hash in self.merkle_roots:
@@ -82,26 +112,57 @@ class SPV(NetworkJobOnDefaultServer):
             # or before headers are available
             if tx_height <= 0 or tx_height > local_height:
                 continue
+            txs_by_height[tx_height].append(tx_hash)
+
+        to_request = []  # type: List[Tuple[str, int]]
+        for tx_height in sorted(txs_by_height):
             # if it's in the checkpoint region, we still might not have the header
-            header = self.blockchain.read_header(tx_height)
-            if header is None:
-                if tx_height < constants.net.max_checkpoint():
-                    await self.group.spawn(self.network.request_chunk(tx_height, None, can_return_early=True))
+            if self.blockchain.read_header(tx_height) is None:
+                index = tx_height // 2016
+                if tx_height < constants.net.max_checkpoint() and index not in self.requested_chunks:
+                    self.requested_chunks.add(index)
+                    await self.group.spawn(self._request_chunk(index))
                 continue
-            # request now
-            self.print_error('requested merkle', tx_hash)
-            self.requested_merkle.add(tx_hash)
-            await self.group.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
+            to_request.extend((tx_hash, tx_height) for tx_hash in txs_by_height[tx_height])
 
-    async def _request_and_verify_single_proof(self, tx_hash, tx_height):
+        # request now, in batches of neighbouring heights
+        for i in range(0, len(to_request), self.batch_size):
+            batch = to_request[i:i+self.batch_size]
+            self.print_error('requested {} merkle proofs, heights {}-{}'.format(len(batch), batch[0][1], batch[-1][1]))
+            self.requested_merkle.update(tx_hash for tx_hash, tx_height in batch)
+            await self.group.spawn(self._request_and_verify_proofs, batch)
+
+    async def _request_chunk(self, index):
         try:
-            merkle = await self.network.get_merkle_for_transaction(tx_hash, tx_height)
-        except aiorpcx.jsonrpc.RPCError as e:
-            self.print_error('tx {} not at height {}'.format(tx_hash, tx_height))
-            self.wallet.remove_unverified_tx(tx_hash, tx_height)
-            try: self.requested_merkle.remove(tx_hash)
-            except KeyError: pass
-            return
+            await self.network.request_chunk(index * 2016, None, can_return_early=True)
+        finally:
+            self.requested_chunks.discard(index)
+        # the headers we were waiting for might be there now
+        self._update_event.set()
+
+    async def _request_and_verify_proofs(self, batch: List[Tuple[str, int]]):
+        merkles = await self.network.get_merkles_for_transactions(batch)
+        # we need to wait if header sync/reorg is still ongoing, hence lock:
+        async with self.network.bhi_lock:
+            chain = self.network.blockchain()
+            heights = set(merkle.get('block_height') for merkle in merkles if isinstance(merkle, dict))
+            headers = {tx_height: chain.read_header(tx_height) for tx_height in heights}
+        for (tx_hash, tx_height), merkle in zip(batch, merkles):
+            if isinstance(merkle, aiorpcx.jsonrpc.RPCError):
+                self.print_error('tx {} not at height {}'.format(tx_hash, tx_height))
+                self.wallet.remove_unverified_tx(tx_hash, tx_height)
+                self.requested_merkle.discard(tx_hash)
+                continue
+            if isinstance(merkle, Exception):
+                raise merkle
+            self._verify_proof(tx_hash, tx_height, merkle, headers)
+        if self.is_up_to_date() and self.wallet.is_up_to_date() \
+                or time.time() - self._last_save_time > VERIFIED_TX_SAVE_INTERVAL:
+            # also persist progress while verifying many txs, e.g. on restore
+            self._last_save_time = time.time()
+            self.wallet.save_verified_tx(write=True)
+
+    def _verify_proof(self, tx_hash, tx_height, merkle, headers):
         # Verify the hash of the server-provided merkle branch to a
         # transaction matches the merkle root of its block
         if tx_height != merkle.get('block_height'):
@@ -110,9 +171,7 @@ class SPV(NetworkJobOnDefaultServer):
         tx_height = merkle.get('block_height')
         pos = merkle.get('pos')
         merkle_branch = merkle.get('merkle')
-        # we need to wait if header sync/reorg is still ongoing, hence lock:
-        async with self.network.bhi_lock:
-            header = self.network.blockchain().read_header(tx_height)
+        header = headers.get(tx_height)
         try:
             verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height)
         except MerkleVerificationFailure as e:
@@ -120,14 +179,11 @@ class SPV(NetworkJobOnDefaultServer):
             raise GracefulDisconnect(e)
         # we passed all the tests
         self.merkle_roots[tx_hash] = header.get('merkle_root')
-        try: self.requested_merkle.remove(tx_hash)
-        except KeyError: pass
+        self.requested_merkle.discard(tx_hash)
         self.print_error("verified %s" % tx_hash)
         header_hash = hash_header(header)
         vtx_info = VerifiedTxInfo(tx_height, header.get('timestamp'), pos, header_hash)
         self.wallet.add_verified_tx(tx_hash, vtx_info)
-        if self.is_up_to_date() and self.wallet.is_up_to_date():
-            self.wallet.save_verified_tx(write=True)
 
     @classmethod
     def hash_merkle_root(cls, merkle_branch: Sequence[str], tx_hash: str, leaf_pos_in_tree: int):
@@ -245,6 +245,8 @@ class Abstract_Wallet(AddressSynchronizer):
         if changed:
             run_hook('set_label', self, name, text)
             self.storage.put('labels', self.labels)
+            if self.is_mine(name):
+                self._mark_addresses_changed([name])
         return changed
 
     def set_fiat_value(self, txid, ccy, text, fx, value_sat):
@@ -701,6 +703,7 @@ class Abstract_Wallet(AddressSynchronizer):
             else:
                 self.frozen_addresses -= set(addrs)
             self.storage.put('frozen_addresses', list(self.frozen_addresses))
+            self._mark_addresses_changed(addrs)
             return True
         return False
 
@@ -1341,6 +1344,8 @@ class Imported_Wallet(Simple_Wallet):
                         transactions_new.add(tx_hash)
             transactions_to_remove -= transactions_new
             self.history.pop(address, None)
+            self._invalidate_address_caches(address)
+            self._remove_address_from_lookup_tables(address)
 
             for tx_hash in transactions_to_remove:
                 self.remove_transaction(tx_hash)
@@ -1513,32 +1518,41 @@ class Deterministic_Wallet(Abstract_Wallet):
             self._addr_to_addr_index[addr] = (True, i)
 
     def create_new_address(self, for_change=False):
+        assert type(for_change) is bool
+        return self.create_new_addresses(for_change, 1)[0]
+
+    def create_new_addresses(self, for_change, num):
         assert type(for_change) is bool
         with self.lock:
             addr_list = self.change_addresses if for_change else self.receiving_addresses
             n = len(addr_list)
-            x = self.derive_pubkeys(for_change, n)
-            address = self.pubkeys_to_address(x)
-            addr_list.append(address)
-            self._addr_to_addr_index[address] = (for_change, n)
+            pubkeys = self.derive_pubkeys_range(for_change, n, n + num)
+            addresses = [self.pubkeys_to_address(x) for x in pubkeys]
+            for i, address in enumerate(addresses, n):
+                addr_list.append(address)
+                self._addr_to_addr_index[address] = (for_change, i)
             self.save_addresses()
-            self.add_address(address)
+            for address in addresses:
+                self.add_address(address)
             if for_change:
                 # note: if it's actually used, it will get filtered later
-                self._unused_change_addresses.append(address)
-            return address
+                self._unused_change_addresses.extend(addresses)
+            return addresses
 
     def synchronize_sequence(self, for_change):
         limit = self.gap_limit_for_change if for_change else self.gap_limit
         while True:
             addresses = self.get_change_addresses() if for_change else self.get_receiving_addresses()
             if len(addresses) < limit:
-                self.create_new_address(for_change)
-                continue
-            if any(map(self.address_is_old, addresses[-limit:])):
-                self.create_new_address(for_change)
+                num = limit - len(addresses)
             else:
+                # the last `limit` addresses must not be old: create enough
+                # new ones to push the last old one out of that window
+                old = [i for i, addr in enumerate(addresses[-limit:]) if self.address_is_old(addr)]
+                num = old[-1] + 1 if old else 0
+            if num == 0:
                 break
+            self.create_new_addresses(for_change, num)
 
     def synchronize(self):
         with self.lock:
@@ -1560,6 +1574,23 @@ class Deterministic_Wallet(Abstract_Wallet):
     def get_address_index(self, address):
         return self._addr_to_addr_index[address]
 
+    def pop_changed_addresses(self):
+        changed = super().pop_changed_addresses()
+        if changed is None:
+            return None
+        # whether an address is beyond the gap limit depends on the
+        # history of the addresses before it
+        with self.lock:
+            for addr in list(changed):
+                index = self._addr_to_addr_index.get(addr)
+                if index is None:
+                    continue
+                is_change, i = index
+                addr_list = self.change_addresses if is_change else self.receiving_addresses
+                limit = self.gap_limit_for_change if is_change else self.gap_limit
+                changed.update(addr_list[i + 1:i + 1 + limit])
+        return changed
+
     def get_master_public_keys(self):
         return [self.get_master_public_key()]
 
@@ -1606,6 +1637,9 @@ class Simple_Deterministic_Wallet(Simple_Wallet, Deterministic_Wallet):
     def derive_pubkeys(self, c, i):
         return self.keystore.derive_pubkey(c, i)
 
+    def derive_pubkeys_range(self, c, start, stop):
+        return self.keystore.derive_pubkeys_range(c, start, stop)
+
 
 
 
@@ -1649,6 +1683,10 @@ class Multisig_Wallet(Deterministic_Wallet):
     def derive_pubkeys(self, c, i):
         return [k.derive_pubkey(c, i) for k in self.get_keystores()]
 
+    def derive_pubkeys_range(self, c, start, stop):
+        pubkeys_per_keystore = [k.derive_pubkeys_range(c, start, stop) for k in self.get_keystores()]
+        return [list(pubkeys) for pubkeys in zip(*pubkeys_per_keystore)]
+
     def load_keystore(self):
         self.keystores = {}
         for i in range(self.n):